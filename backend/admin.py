@@ -1,8 +1,47 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.db.models import Sum, F
 
-from .models import Shop, Category, Order, OrderItem, ProductInfo, User, ProductParameter, Contact
+from .cache import bump_catalog_version
+from .models import Shop, Category, Order, OrderItem, ProductInfo, User, ProductParameter, Contact, ImportJob, \
+    MailMessage, OutboxEvent, ShopOrder
+from .orders import deleting_goods, recalculate_order, split_orders
+
+
+class GoodsDeleteMixin:
+    """
+    удаление через админку пересчитывает корзины с товарами, которые удаляются каскадом;
+    goods_lookup - путь от товара к удаляемой модели
+    """
+    goods_lookup = None
+
+    def goods(self, queryset):
+        return ProductInfo.objects.filter(**{f'{self.goods_lookup}__in': queryset})
+
+    def delete_model(self, request, obj):
+        with deleting_goods(self.goods(type(obj).objects.filter(pk=obj.pk))):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with deleting_goods(self.goods(queryset)):
+            super().delete_queryset(request, queryset)
+
+
+class CatalogAdmin(GoodsDeleteMixin, admin.ModelAdmin):
+    """
+    изменения каталога через админку сбрасывают кеш каталога
+    """
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        bump_catalog_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_catalog_version()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_catalog_version()
 
 
 class OrderItemsInline(admin.TabularInline):
@@ -11,6 +50,17 @@ class OrderItemsInline(admin.TabularInline):
     extra = 1
 
 
+class ShopOrderInline(admin.TabularInline):
+    model = ShopOrder
+    fields = ('shop', 'state', 'total_sum', 'items_count')
+    readonly_fields = ('shop', 'total_sum', 'items_count')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class ProductParameterInline(admin.TabularInline):
     model = ProductParameter
     extra = 1
@@ -34,14 +84,16 @@ class OrderAdmin(admin.ModelAdmin):
     list_display_links = ('order_number', 'dt')
     list_filter = ('user', 'state')
     search_fields = ('user__first_name', 'user__last_name')
-    inlines = [OrderItemsInline]
+    inlines = [OrderItemsInline, ShopOrderInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recalculate_order(form.instance.id)
+        if form.instance.state != 'basket':
+            split_orders(Order.objects.filter(id=form.instance.id))
 
     def order_sum(self, obj):
-        lst_items = obj.ordered_items.all().prefetch_related(
-            'product_info__product__category',
-            'product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('quantity') * F('product_info__price')))
-        return f"{sum(x.total_sum for x in lst_items)} руб."
+        return f"{obj.total_sum} руб."
 
     def order_number(self, obj):
         return obj.id
@@ -51,20 +103,22 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
+class ProductInfoAdmin(CatalogAdmin):
     list_display = ('product', 'model', 'shop', 'price', 'price_rrc')
     ordering = ('product', 'price')
     list_filter = ('shop',)
     search_fields = ('product__name', 'model')
     inlines = [ProductParameterInline]
+    goods_lookup = 'id'
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(GoodsDeleteMixin, UserAdmin):
     """
     Панель управления пользователями
     """
     model = User
+    goods_lookup = 'shop__user'
 
     fieldsets = (
         (None, {'fields': ('email', 'password', 'type')}),
@@ -78,5 +132,25 @@ class CustomUserAdmin(UserAdmin):
     inlines = [ContactInline]
 
 
-admin.site.register(Shop)
-admin.site.register(Category)
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'shop', 'filename', 'mode', 'status', 'stage', 'created_at', 'updated_at')
+    list_filter = ('status', 'mode')
+    readonly_fields = ('counts', 'timings', 'error', 'created_at', 'updated_at')
+
+
+@admin.register(MailMessage)
+class MailMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'email', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('attempts', 'error', 'created_at', 'sent_at')
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'created_at')
+    readonly_fields = ('created_at',)
+
+
+admin.site.register(Shop, CatalogAdmin, goods_lookup='shop')
+admin.site.register(Category, CatalogAdmin, goods_lookup='product__category')
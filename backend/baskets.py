@@ -0,0 +1,399 @@
+import time
+from datetime import datetime, timezone
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from redis.exceptions import WatchError
+
+from backend.cache import prices_version
+from backend.locks import get_redis
+from backend.models import Order, OrderItem, ProductInfo
+from backend.orders import recalculate_order
+from backend.querysets import ordered_items_prefetch, product_info_queryset, product_parameters_prefetch
+
+# строки корзины {product_info_id: quantity}, служебные данные корзины, корзины по времени изменения
+BASKET_KEY = 'basket:{}'
+BASKET_META_KEY = 'basket:{}:meta'
+BASKET_IDLE_KEY = 'basket:idle'
+# счетчики корзины: позиций, единиц товара, сумма и версия цен каталога, по которой она посчитана
+BASKET_SUMMARY_KEY = 'basket:{}:summary'
+SUMMARY_FIELDS = ('lines', 'units', 'total')
+
+
+def basket_store(user_id):
+    """
+    хранилище корзины по настройке BASKET_BACKEND: 'db' - таблицы заказов, 'redis' - хеши Redis
+    """
+    return BASKET_BACKENDS[settings.BASKET_BACKEND](user_id)
+
+
+def prices(product_infos):
+    return dict(ProductInfo.objects.filter(id__in=product_infos).values_list('id', 'price'))
+
+
+class BasketCounters:
+    """
+    Счетчики корзины Redis для быстрой сводки в отдельном хеше: каждое изменение корзины
+    прибавляет к ним разницу; после смены версии цен каталога счетчики пересчитываются
+    по строкам корзины при следующем чтении, списание остатков при оформлении заказов их не сбрасывает
+    """
+
+    @property
+    def summary_key(self):
+        return BASKET_SUMMARY_KEY.format(self.user_id)
+
+    def count(self, pipe, old, lines, line_prices):
+        """
+        добавляем в pipe изменение счетчиков: old - прежние количества изменяемых строк, lines - новые
+        """
+        delta = dict.fromkeys(SUMMARY_FIELDS, 0)
+        for product_info, quantity in lines.items():
+            before = old.get(product_info, 0)
+            delta['lines'] += bool(quantity) - bool(before)
+            delta['units'] += quantity - before
+            delta['total'] += (quantity - before) * line_prices.get(product_info, 0)
+        for name, value in delta.items():
+            if value:
+                pipe.hincrby(self.summary_key, name, value)
+        pipe.expire(self.summary_key, settings.BASKET_IDLE_TIMEOUT)
+
+    def summary(self):
+        """
+        сводка корзины: число позиций, единиц товара и сумма
+        """
+        redis = get_redis()
+        version = prices_version()
+        stored = {name.decode(): value.decode() for name, value in redis.hgetall(self.summary_key).items()}
+        if stored.get('version') == version:
+            return {name: int(stored.get(name, 0)) for name in SUMMARY_FIELDS}
+        lines = self.quantities()
+        line_prices = prices(lines)
+        summary = {'lines': len(lines), 'units': sum(lines.values()),
+                   'total': sum(quantity * line_prices.get(product_info, 0)
+                                for product_info, quantity in lines.items())}
+        pipe = redis.pipeline()
+        pipe.delete(self.summary_key)
+        pipe.hset(self.summary_key, mapping={**summary, 'version': version})
+        pipe.expire(self.summary_key, settings.BASKET_IDLE_TIMEOUT)
+        pipe.execute()
+        return summary
+
+
+class DatabaseBasket:
+    """
+    Корзина - заказ в статусе basket, позиции пишутся сразу в таблицы.
+    Позиция адресуется id позиции заказа, а если такой нет - id товара, как в корзине Redis
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queryset = Order.objects.filter(user_id=user_id, state='basket')
+
+    def set_lines(self, lines):
+        """
+        lines - {product_info_id: quantity}, quantity=0 удаляет позицию;
+        позиции и суммы заказа меняются одной транзакцией
+        """
+        with transaction.atomic():
+            basket, _ = Order.objects.get_or_create(user_id=self.user_id, state='basket')
+            removed = [product_info for product_info, quantity in lines.items() if not quantity]
+            if removed:
+                OrderItem.objects.filter(order_id=basket.id, product_info_id__in=removed).delete()
+            OrderItem.objects.bulk_create(
+                [OrderItem(order_id=basket.id, product_info_id=product_info, quantity=quantity)
+                 for product_info, quantity in lines.items() if quantity],
+                update_conflicts=True, unique_fields=['order_id', 'product_info_id'], update_fields=['quantity'])
+            recalculate_order(basket.id)
+
+    def line(self, product_info_id):
+        return OrderItem.objects.filter(order__in=self.queryset, product_info_id=product_info_id).first()
+
+    def lookup(self, item_id):
+        """
+        позиции корзины с id item_id или с товаром item_id; первой идет позиция с совпавшим id
+        """
+        return OrderItem.objects.filter(Q(id=item_id) | Q(product_info_id=item_id), order__in=self.queryset)
+
+    @staticmethod
+    def pick(items, item_id, key=lambda item: item.id):
+        return next((item for item in items if key(item) == item_id), items[0] if items else None)
+
+    def item(self, item_id):
+        return self.pick(list(self.lookup(item_id).select_related('product_info__product__category').prefetch_related(
+            product_parameters_prefetch('product_info__product_parameters'))), item_id)
+
+    def remove(self, item_id):
+        item = self.pick(list(self.lookup(item_id).values_list('id', 'order_id')), item_id, key=itemgetter(0))
+        if item is None:
+            return False
+        item_id, order_id = item
+        with transaction.atomic():
+            OrderItem.objects.filter(id=item_id).delete()
+            recalculate_order(order_id)
+        return True
+
+    def summary(self):
+        """
+        сводка корзины из счетчиков заказа-корзины, которые пересчитываются при каждом изменении позиций и цен
+        """
+        basket = self.queryset.values('items_count', 'units_count', 'total_sum').first()
+        if basket is None:
+            return dict.fromkeys(SUMMARY_FIELDS, 0)
+        return {'lines': basket['items_count'], 'units': basket['units_count'], 'total': basket['total_sum']}
+
+    def modified(self):
+        """
+        время последнего изменения корзины (timestamp), None - корзины нет
+        """
+        updated_at = self.queryset.values_list('updated_at', flat=True).first()
+        return updated_at.timestamp() if updated_at else None
+
+    def baskets(self):
+        return list(self.queryset.prefetch_related(ordered_items_prefetch()))
+
+    def current(self):
+        return self.queryset.prefetch_related(ordered_items_prefetch()).first()
+
+    def order(self):
+        """
+        заказ для оформления
+        """
+        return self.queryset.first()
+
+    def placed(self):
+        """
+        оформленный заказ уже не в статусе basket, следующая корзина создается заново
+        """
+
+
+class BasketSnapshot:
+    """
+    Корзина из Redis в виде, который ожидает OrderSerializer
+    """
+    state = 'basket'
+    contact = None
+
+    def __init__(self, order_id, dt, ordered_items):
+        self.id = order_id
+        self.dt = dt
+        self.ordered_items = ordered_items
+        self.total_sum = sum(item.quantity * item.product_info.price for item in ordered_items)
+        self.items_count = len(ordered_items)
+
+
+class RedisBasket(BasketCounters):
+    """
+    Корзина в хешах Redis: изменения не пишут в БД, заказ с позициями создается
+    при оформлении или при сбросе простаивающей корзины (flush_idle_baskets).
+    Позиция корзины адресуется id товара, а если такого нет - id позиции заказа-корзины в БД, как в DatabaseBasket.
+    При первом обращении в Redis переносится корзина из БД, если она есть;
+    изменения и сброс - оптимистичные транзакции Redis (WATCH) по служебному ключу
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.key = BASKET_KEY.format(user_id)
+        self.meta_key = BASKET_META_KEY.format(user_id)
+        self.redis = get_redis()
+
+    @staticmethod
+    def decode(lines, meta):
+        return ({int(product_info): int(quantity) for product_info, quantity in lines.items()},
+                {name.decode(): value.decode() for name, value in meta.items()})
+
+    def load(self):
+        """
+        строки и служебные данные корзины
+        """
+        while True:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hgetall(self.key)
+            pipe.hgetall(self.meta_key)
+            lines, meta = pipe.execute()
+            if meta:
+                return self.decode(lines, meta)
+            self.hydrate()
+
+    def hydrate(self):
+        """
+        переносим корзину из БД, если в Redis ее еще нет; такая корзина не изменена (dirty=0)
+        и при сбросе просто удаляется из Redis
+        """
+        order = Order.objects.filter(user_id=self.user_id, state='basket').values_list('id', 'dt').first()
+        lines = dict(OrderItem.objects.filter(order_id=order[0]).values_list('product_info_id', 'quantity')) \
+            if order else {}
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(self.meta_key)
+                if pipe.exists(self.meta_key):
+                    return
+                pipe.multi()
+                pipe.delete(self.key)
+                if lines:
+                    pipe.hset(self.key, mapping=lines)
+                pipe.hset(self.meta_key, mapping={'order': order[0] if order else '',
+                                                  'created': order[1].timestamp() if order else now,
+                                                  'modified': now, 'dirty': 0})
+                pipe.zadd(BASKET_IDLE_KEY, {self.user_id: now})
+                pipe.execute()
+            except WatchError:
+                pass
+
+    def change(self, lines):
+        """
+        lines - {product_info_id: quantity}, quantity=0 удаляет позицию; строки, отметка изменения
+        и счетчики пишутся одной транзакцией, только если корзину не изменили и не сбросили в БД
+        между чтением и записью. Возвращает прежние количества строк
+        """
+        line_prices = prices(lines)
+        while True:
+            with self.redis.pipeline() as pipe:
+                try:
+                    pipe.watch(self.key, self.meta_key)
+                    if not pipe.exists(self.meta_key):
+                        pipe.unwatch()
+                        self.hydrate()
+                        continue
+                    old = {product_info: int(quantity) for product_info, quantity
+                           in zip(lines, pipe.hmget(self.key, list(lines))) if quantity is not None}
+                    pipe.multi()
+                    removed = [product_info for product_info, quantity in lines.items() if not quantity]
+                    if removed:
+                        pipe.hdel(self.key, *removed)
+                    added = {product_info: quantity for product_info, quantity in lines.items() if quantity}
+                    if added:
+                        pipe.hset(self.key, mapping=added)
+                    now = time.time()
+                    pipe.hset(self.meta_key, mapping={'modified': now, 'dirty': 1})
+                    pipe.zadd(BASKET_IDLE_KEY, {self.user_id: now})
+                    self.count(pipe, old, lines, line_prices)
+                    pipe.execute()
+                    return old
+                except WatchError:
+                    continue
+
+    def quantities(self):
+        return self.load()[0]
+
+    def set_lines(self, lines):
+        self.change(lines)
+
+    def line(self, product_info_id):
+        quantity = self.load()[0].get(product_info_id)
+        if quantity is None:
+            return None
+        return OrderItem(id=product_info_id, product_info_id=product_info_id, quantity=quantity)
+
+    def items(self, lines):
+        return [OrderItem(id=product_info.id, product_info=product_info, quantity=lines[product_info.id])
+                for product_info in product_info_queryset().filter(id__in=lines).order_by('id')]
+
+    @staticmethod
+    def line_id(lines, meta, item_id):
+        """
+        id товара строки item_id: строки корзины, перенесенной из БД, находятся и по id позиций заказа-корзины
+        """
+        if item_id in lines or not meta['order']:
+            return item_id
+        product_info = OrderItem.objects.filter(order_id=meta['order'], id=item_id).values_list(
+            'product_info_id', flat=True).first()
+        return product_info if product_info in lines else item_id
+
+    def item(self, item_id):
+        lines, meta = self.load()
+        item_id = self.line_id(lines, meta, item_id)
+        if item_id not in lines:
+            return None
+        items = self.items({item_id: lines[item_id]})
+        return items[0] if items else None
+
+    def remove(self, item_id):
+        lines, meta = self.load()
+        item_id = self.line_id(lines, meta, item_id)
+        return item_id in lines and item_id in self.change({item_id: 0})
+
+    def modified(self):
+        return float(self.load()[1]['modified'])
+
+    def snapshot(self, lines, meta):
+        return BasketSnapshot(int(meta['order']) if meta['order'] else None,
+                              datetime.fromtimestamp(float(meta['created']), timezone.utc), self.items(lines))
+
+    def baskets(self):
+        lines, meta = self.load()
+        if not lines and not meta['order']:
+            return []
+        return [self.snapshot(lines, meta)]
+
+    def current(self):
+        return self.snapshot(*self.load())
+
+    def materialize(self, lines):
+        """
+        записываем строки корзины в заказ-корзину в БД, товары, удаленные из каталога, пропускаются
+        """
+        existing = set(ProductInfo.objects.filter(id__in=lines).values_list('id', flat=True))
+        lines = {product_info: quantity for product_info, quantity in lines.items() if product_info in existing}
+        with transaction.atomic():
+            basket, _ = Order.objects.get_or_create(user_id=self.user_id, state='basket')
+            OrderItem.objects.filter(order_id=basket.id).exclude(product_info_id__in=lines).delete()
+            OrderItem.objects.bulk_create(
+                [OrderItem(order_id=basket.id, product_info_id=product_info, quantity=quantity)
+                 for product_info, quantity in lines.items()],
+                update_conflicts=True, unique_fields=['order_id', 'product_info_id'], update_fields=['quantity'])
+            recalculate_order(basket.id)
+        return basket
+
+    def order(self):
+        lines, meta = self.load()
+        if not lines and not meta['order']:
+            return None
+        return self.materialize(lines)
+
+    def placed(self):
+        """
+        корзина оформлена - следующая начнется с пустой
+        """
+        pipe = self.redis.pipeline()
+        pipe.delete(self.key, self.meta_key, self.summary_key)
+        pipe.zrem(BASKET_IDLE_KEY, self.user_id)
+        pipe.execute()
+
+    def flush(self, deadline):
+        """
+        сброс корзины, не менявшейся с deadline, в БД; если ее изменили во время сброса,
+        ключи остаются в Redis до следующего раза
+        """
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(self.key, self.meta_key)
+                lines, meta = self.decode(pipe.hgetall(self.key), pipe.hgetall(self.meta_key))
+                if meta and float(meta['modified']) > deadline:
+                    return False
+                if meta.get('dirty') == '1':
+                    self.materialize(lines)
+                pipe.multi()
+                pipe.delete(self.key, self.meta_key)
+                pipe.zrem(BASKET_IDLE_KEY, self.user_id)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+
+def flush_idle():
+    """
+    переносим в БД корзины Redis, которые не менялись BASKET_IDLE_TIMEOUT секунд
+    """
+    deadline = time.time() - settings.BASKET_IDLE_TIMEOUT
+    return sum(RedisBasket(int(user_id)).flush(deadline)
+               for user_id in get_redis().zrangebyscore(BASKET_IDLE_KEY, 0, deadline))
+
+
+BASKET_BACKENDS = {
+    'db': DatabaseBasket,
+    'redis': RedisBasket,
+}
@@ -0,0 +1,141 @@
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.urls import resolve
+from rest_framework.response import Response
+
+from backend.conditional import conditional_response, etag_hash, set_validators
+
+# версии каталога: любая его часть, данные конкретного магазина, общие данные (категории, продукты)
+CATALOG_VERSION = 'catalog:version'
+CATALOG_VERSION_COMMON = 'catalog:version:common'
+CATALOG_VERSION_SHOP = 'catalog:version:shop:{}'
+# версия цен и состава товаров: не меняется, когда меняются только остатки
+CATALOG_VERSION_PRICES = 'catalog:version:prices'
+
+
+def get_version(key):
+    """
+    версия без срока хранения; после вытеснения из кеша начинается с текущего времени,
+    поэтому не совпадает ни с одной из прежних
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    cache.set(f'{key}:modified', int(time.time()), timeout=None)
+
+
+def catalog_version(shop_id=None):
+    """
+    версия данных каталога магазина shop_id или всего каталога
+    """
+    if shop_id is None:
+        return str(get_version(CATALOG_VERSION))
+    return f'{get_version(CATALOG_VERSION_COMMON)}.{get_version(CATALOG_VERSION_SHOP.format(shop_id))}'
+
+
+def catalog_last_modified(shop_id=None):
+    """
+    время последнего изменения каталога магазина shop_id или всего каталога, None - неизвестно
+    """
+    keys = (CATALOG_VERSION,) if shop_id is None else (CATALOG_VERSION_COMMON, CATALOG_VERSION_SHOP.format(shop_id))
+    modified = cache.get_many([f'{key}:modified' for key in keys])
+    return max(modified.values()) if len(modified) == len(keys) else None
+
+
+def prices_version():
+    """
+    версия цен каталога
+    """
+    return str(get_version(CATALOG_VERSION_PRICES))
+
+
+def bump_catalog_version(shop_id=None, prices=True):
+    """
+    изменились данные магазина shop_id, без shop_id - общие данные каталога;
+    prices=False - изменились только остатки, цены прежние
+    """
+    bump(CATALOG_VERSION)
+    bump(CATALOG_VERSION_SHOP.format(shop_id) if shop_id is not None else CATALOG_VERSION_COMMON)
+    if prices:
+        bump(CATALOG_VERSION_PRICES)
+
+
+def request_url(request):
+    """
+    адрес запроса (ссылки пагинации в ответе абсолютные) с параметрами в порядке сортировки
+    """
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    return f'{request.build_absolute_uri(request.path)}?{query}'
+
+
+class CatalogCacheMixin:
+    """
+    Кеширование списков каталога до следующего изменения версии каталога;
+    изменения через API увеличивают версию сами
+    """
+
+    def get_catalog_shop(self, request):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        shop_id = self.get_catalog_shop(request)
+        version, url = catalog_version(shop_id), request_url(request)
+        not_modified, etag, last_modified = conditional_response(
+            request, (version, url, request.accepted_renderer.format), catalog_last_modified(shop_id))
+        if not_modified is not None:
+            return not_modified
+        key = f'catalog:response:{etag_hash(version, url)}'
+        data = cache.get(key)
+        if data is not None:
+            return set_validators(Response(data), etag, last_modified)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+            set_validators(response, etag, last_modified)
+        return response
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        bump_catalog_version(getattr(serializer.instance, 'shop_id', None))
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_catalog_version(getattr(serializer.instance, 'shop_id', None))
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_catalog_version(getattr(instance, 'shop_id', None))
+
+
+def warm_catalog_cache(shop_id=None):
+    """
+    заполняем кеш страниц CATALOG_WARM_PAGES, как если бы их запросили по адресу CATALOG_WARM_BASE_URL:
+    запрос проходит обычную обработку представления без проверки прав и ограничения частоты запросов -
+    ответ в кеше общий для всех пользователей, права проверяются при каждом обращении к нему
+    """
+    base_url = urlsplit(settings.CATALOG_WARM_BASE_URL)
+    factory = RequestFactory(SERVER_NAME=base_url.hostname,
+                             SERVER_PORT=str(base_url.port or (443 if base_url.scheme == 'https' else 80)))
+    for page in settings.CATALOG_WARM_PAGES:
+        if '{shop_id}' in page and shop_id is None:
+            continue
+        path, _, query = page.format(shop_id=shop_id).partition('?')
+        match = resolve(path)
+        actions = getattr(match.func, 'actions', None)
+        view = match.func.cls.as_view(**({'actions': actions} if actions else {}), **match.func.initkwargs,
+                                      permission_classes=(), throttle_classes=())
+        view(factory.get(path, QueryDict(query), secure=base_url.scheme == 'https'), *match.args, **match.kwargs)
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def etag_hash(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    ETag и Last-Modified ответа; last_modified - время unix в секундах
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_response(request, parts, last_modified=None):
+    """
+    валидаторы ответа по частям, от которых зависит его содержимое;
+    возвращаем (ответ 304 или None, etag, last_modified), тело ответа при этом не строится
+    """
+    etag = quote_etag(etag_hash(*parts))
+    last_modified = int(last_modified) if last_modified is not None else None
+    not_modified = get_conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        set_validators(not_modified, etag, last_modified)
+    return not_modified, etag, last_modified
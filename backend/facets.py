@@ -0,0 +1,67 @@
+import math
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max, Min, Q
+from django.db.models.fields.json import KeyTextTransform
+
+from backend.models import ProductInfo
+
+PRICE_BUCKETS = 10
+
+# разворачивание ProductInfo.facets в пары (key, value)
+JSON_EACH = {
+    'postgresql': 'jsonb_each_text',
+    'sqlite': 'json_each',
+}
+
+
+def filter_facet(queryset, name, values):
+    """
+    отбор товаров по значениям параметра из ProductInfo.facets;
+    на PostgreSQL условие @> обслуживается GIN-индексом
+    """
+    if connection.vendor == 'postgresql':
+        condition = Q()
+        for value in values:
+            condition |= Q(facets__contains={name: value})
+        return queryset.filter(condition)
+    alias = f'facet_{len(queryset.query.annotations)}'
+    return queryset.alias(**{alias: KeyTextTransform(name, 'facets')}).filter(**{f'{alias}__in': values})
+
+
+def facet_counts(queryset):
+    """
+    количество товаров по каждому значению каждого параметра в выборке
+    """
+    counts = defaultdict(dict)
+    if connection.vendor not in JSON_EACH:
+        for facets in queryset.order_by().values_list('facets', flat=True).iterator():
+            for name, value in facets.items():
+                counts[name][value] = counts[name].get(value, 0) + 1
+        return counts
+    ids, params = queryset.order_by().values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT f.key, f.value, COUNT(*) FROM {ProductInfo._meta.db_table} pi, '
+                       f'{JSON_EACH[connection.vendor]}(pi.facets) f WHERE pi.id IN ({ids}) '
+                       f'GROUP BY f.key, f.value ORDER BY f.key, COUNT(*) DESC, f.value', params)
+        for name, value, count in cursor.fetchall():
+            counts[name][value] = count
+    return counts
+
+
+def price_histogram(queryset, buckets=PRICE_BUCKETS):
+    """
+    распределение цен выборки по buckets равным интервалам, пустые интервалы не возвращаются
+    """
+    queryset = queryset.order_by()
+    prices = queryset.aggregate(low=Min('price'), high=Max('price'))
+    if prices['low'] is None:
+        return []
+    low = prices['low']
+    width = math.ceil((prices['high'] - low + 1) / buckets)
+    rows = queryset.annotate(
+        bucket=ExpressionWrapper((F('price') - low) / width, output_field=IntegerField())
+    ).values('bucket').annotate(count=Count('id')).order_by('bucket')
+    return [{'min': low + row['bucket'] * width, 'max': low + (row['bucket'] + 1) * width - 1,
+             'count': row['count']} for row in rows]
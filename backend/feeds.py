@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import os
+import tempfile
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+
+from backend.models import ImportJob, Shop
+from backend.parsers import EXTENSIONS
+from backend.uploads import price_list_path
+
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def check_shop_feed(shop):
+    """
+    проверяем, изменился ли прайс-лист магазина с прошлой проверки;
+    возвращаем (имя файла для импорта, sha256) или None, если изменений нет или прайс-лист недоступен
+    """
+    try:
+        if shop.url:
+            return fetch_feed(shop)
+        if shop.filename:
+            return check_file(shop)
+    except (OSError, requests.RequestException) as e:
+        logger.warning('не удалось проверить прайс-лист магазина %s: %s', shop.id, e)
+    return None
+
+
+def is_imported(shop, content_hash):
+    """
+    содержимое уже импортировано или импортируется: последнее не упавшее задание магазина с тем же хешем;
+    если оно завершится ошибкой, следующая проверка запустит импорт снова
+    """
+    last_job = ImportJob.objects.filter(user_id=shop.user_id, status__in=('queued', 'running', 'done')).first()
+    return last_job is not None and last_job.content_hash == content_hash
+
+
+def fetch_feed(shop):
+    """
+    условный GET по сохраненным ETag/Last-Modified, новое содержимое сохраняется в IMPORT_UPLOAD_DIR;
+    ETag и Last-Modified запоминаются, только когда содержимое уже импортировано
+    """
+    headers = {}
+    if shop.feed_etag:
+        headers['If-None-Match'] = shop.feed_etag
+    if shop.feed_last_modified:
+        headers['If-Modified-Since'] = shop.feed_last_modified
+    with requests.get(shop.url, headers=headers, stream=True, timeout=settings.IMPORT_FEED_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        os.makedirs(settings.IMPORT_UPLOAD_DIR, exist_ok=True)
+        content_hash = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=settings.IMPORT_UPLOAD_DIR, delete=False) as temp:
+            try:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    content_hash.update(chunk)
+                    temp.write(chunk)
+            except BaseException:
+                temp.close()
+                os.remove(temp.name)
+                raise
+        feed_state = {'feed_etag': response.headers.get('ETag', ''),
+                      'feed_last_modified': response.headers.get('Last-Modified', '')}
+    content_hash = content_hash.hexdigest()
+    if is_imported(shop, content_hash):
+        os.remove(temp.name)
+        save_feed_state(shop, feed_hash=content_hash, **feed_state)
+        return None
+    extension = os.path.splitext(urlparse(shop.url).path)[1].lower()
+    path = os.path.join(settings.IMPORT_UPLOAD_DIR, content_hash + (extension if extension in EXTENSIONS else ''))
+    os.replace(temp.name, path)
+    return path, content_hash
+
+
+def check_file(shop):
+    """
+    файл перечитывается только при изменении mtime, импорт - только при изменении содержимого;
+    mtime запоминается, только когда содержимое уже импортировано
+    """
+    path = price_list_path(shop.filename)
+    mtime = os.stat(path).st_mtime
+    if mtime == shop.feed_mtime:
+        return None
+    content_hash = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            content_hash.update(chunk)
+    content_hash = content_hash.hexdigest()
+    if is_imported(shop, content_hash):
+        save_feed_state(shop, feed_mtime=mtime, feed_hash=content_hash)
+        return None
+    return shop.filename, content_hash
+
+
+def save_feed_state(shop, **fields):
+    Shop.objects.filter(id=shop.id).update(**fields)
+    for name, value in fields.items():
+        setattr(shop, name, value)
@@ -1,7 +1,12 @@
+import re
+
 import django_filters
 
+from backend.facets import filter_facet
 from backend.models import ProductInfo
 
+PARAM_FILTER = re.compile(r'^param\[(.+)\]$')
+
 
 class ProductFilterPrice(django_filters.FilterSet):
     price__gt = django_filters.NumberFilter(field_name='price', lookup_expr='gt')
@@ -9,3 +14,14 @@ class ProductFilterPrice(django_filters.FilterSet):
     class Meta:
         model = ProductInfo
         fields = ['shop']
+
+    def filter_queryset(self, queryset):
+        """
+        дополнительно отбираем по параметрам товара: param[Цвет]=черный, несколько значений - через ИЛИ
+        """
+        queryset = super().filter_queryset(queryset)
+        for key in self.data:
+            match = PARAM_FILTER.match(key)
+            if match:
+                queryset = filter_facet(queryset, match.group(1), self.data.getlist(key))
+        return queryset
@@ -0,0 +1,501 @@
+import csv
+import hashlib
+import io
+import json
+import math
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from backend.models import Category, Product, ProductInfo, Parameter, ProductParameter, ImportRow
+from backend.orders import basket_ids
+
+PRODUCT_INFO_FIELDS = ('model', 'price', 'price_rrc', 'quantity')
+
+
+def fingerprint(item):
+    """
+    отпечаток строки прайс-листа вместе с параметрами
+    """
+    data = [item[field] for field in PRODUCT_INFO_FIELDS]
+    data.append(sorted((str(name), str(value)) for name, value in item['parameters'].items()))
+    return hashlib.md5(json.dumps(data, ensure_ascii=False, default=str).encode(), usedforsecurity=False).hexdigest()
+
+
+def facets(item):
+    """
+    параметры строки прайс-листа для фильтрации и подсчета фасетов
+    """
+    return {str(name): str(value) for name, value in item['parameters'].items()}
+
+
+def chunked(iterable, size):
+    """
+    разбиваем последовательность на списки по size элементов
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ImportLockLost(Exception):
+    """
+    Блокировка импорта истекла или перехвачена: этап не начинается, транзакция импорта откатывается
+    """
+
+
+class ImportProgress:
+    """
+    Учет этапов импорта в ImportJob: время этапов суммируется, состояние сохраняется
+    не чаще раза в PROGRESS_INTERVAL секунд. Внутри транзакции импорта запись в ImportJob
+    не видна до фиксации, поэтому этап и время этапов кладутся в кеш (PROGRESS_KEY),
+    откуда их берет current_progress для статуса задания.
+    Если блокировка импорта потеряна (lock_lost), очередной этап прерывает импорт
+    """
+    PROGRESS_INTERVAL = 1
+    PROGRESS_KEY = 'import_progress:{}'
+
+    def __init__(self, job=None, lock_lost=None):
+        self.job = job
+        self.lock_lost = lock_lost
+        self.saved = 0
+        self.cached = False
+
+    @contextmanager
+    def stage(self, name):
+        if self.lock_lost is not None and self.lock_lost.is_set():
+            raise ImportLockLost('Блокировка импорта магазина потеряна, изменения отменены')
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            if self.job is not None:
+                self.job.timings[name] = round(self.job.timings.get(name, 0) + time.monotonic() - started, 3)
+                self.job.stage = name
+                self.save()
+
+    def save(self, force=False, **fields):
+        if self.job is None:
+            return
+        for field, value in fields.items():
+            setattr(self.job, field, value)
+        now = time.monotonic()
+        if not force and now - self.saved < self.PROGRESS_INTERVAL:
+            return
+        key = self.PROGRESS_KEY.format(self.job.id)
+        if not force and transaction.get_connection().in_atomic_block:
+            cache.set(key, {'stage': self.job.stage, 'timings': self.job.timings}, settings.IMPORT_LOCK_TIMEOUT)
+            self.cached = True
+        else:
+            self.job.save()
+            if self.cached:
+                cache.delete(key)
+                self.cached = False
+        self.saved = now
+
+
+def current_progress(job):
+    """
+    подставляем в выполняющееся задание этап, сохраненный в кеше из транзакции импорта
+    """
+    if job.status == 'running':
+        for field, value in (cache.get(ImportProgress.PROGRESS_KEY.format(job.id)) or {}).items():
+            setattr(job, field, value)
+    return job
+
+
+class PriceListImporter:
+    """
+    Пакетный импорт прайс-листа магазина.
+    Категории, продукты и параметры разрешаются через словари в памяти,
+    ProductInfo и ProductParameter пишутся массовыми вставками по batch_size строк
+    в одной транзакции.
+    """
+
+    def __init__(self, shop, batch_size=None, progress=None):
+        self.shop = shop
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.progress = progress or ImportProgress()
+        self.products = {}
+        self.loaded_categories = set()
+        self.parameters = {}
+        self.orders = set()
+        self.stats = {'goods': 0, 'products': 0, 'parameters': 0}
+
+    def run(self, categories, goods):
+        self.import_categories(categories)
+        with transaction.atomic():
+            self.begin()
+            for chunk in chunked(goods, self.batch_size):
+                self.load(chunk)
+            self.finish()
+        return self.stats
+
+    def summary(self):
+        return f'Загружено товаров: {self.stats["goods"]}.'
+
+    def import_categories(self, categories):
+        names = {category['id']: category['name'] for category in categories}
+        with self.progress.stage('categories'), transaction.atomic():
+            existing = set(Category.objects.filter(id__in=names).values_list('id', flat=True))
+            Category.objects.bulk_create(
+                [Category(id=category_id, name=name) for category_id, name in names.items()
+                 if category_id not in existing],
+                batch_size=self.batch_size, ignore_conflicts=True)
+            category_shops = Category.shops.through
+            category_shops.objects.bulk_create(
+                [category_shops(category_id=category_id, shop_id=self.shop.id) for category_id in names],
+                batch_size=self.batch_size, ignore_conflicts=True)
+
+    def begin(self):
+        self.delete_product_infos(ProductInfo.objects.filter(shop_id=self.shop.id))
+
+    def delete_product_infos(self, product_infos):
+        """
+        удаляем строки товаров, запоминая корзины, из которых вместе с ними пропадут позиции
+        """
+        self.orders.update(basket_ids(product_infos))
+        return product_infos.delete()
+
+    def load(self, goods):
+        """
+        записываем пачку товаров за ограниченное число запросов
+        """
+        keyed = [((str(item['name']), item['category']), item) for item in goods]
+        with self.progress.stage('products'):
+            self.resolve_products({key for key, _ in keyed})
+        rows = {self.products[key]: item for key, item in keyed}
+        self.stats['goods'] += len(rows)
+        self.write(rows, {product_id: fingerprint(item) for product_id, item in rows.items()})
+
+    def write(self, rows, fingerprints):
+        with self.progress.stage('products'):
+            product_infos = self.write_product_infos(rows, fingerprints)
+        with self.progress.stage('parameters'):
+            self.write_parameters(rows, product_infos)
+
+    def finish(self):
+        pass
+
+    def resolve_products(self, keys):
+        self.load_products({category_id for _, category_id in keys})
+        missing = keys - self.products.keys()
+        if not missing:
+            return
+        Product.objects.bulk_create([Product(name=name, category_id=category_id) for name, category_id in missing],
+                                    batch_size=self.batch_size, ignore_conflicts=True)
+        self.stats['products'] += len(missing)
+        self.products.update(
+            ((name, category_id), product_id) for product_id, name, category_id
+            in Product.objects.filter(name__in={name for name, _ in missing},
+                                      category_id__in={category_id for _, category_id in missing}
+                                      ).values_list('id', 'name', 'category_id'))
+
+    def load_products(self, categories):
+        categories = categories - self.loaded_categories
+        if not categories:
+            return
+        self.products.update(
+            ((name, category_id), product_id) for product_id, name, category_id
+            in Product.objects.filter(category_id__in=categories).values_list('id', 'name', 'category_id'))
+        self.loaded_categories |= categories
+
+    def resolve_parameters(self, names):
+        missing = {name for name in names if name not in self.parameters}
+        if not missing:
+            return
+        self.parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+        created = [Parameter(name=name) for name in missing if name not in self.parameters]
+        if created:
+            Parameter.objects.bulk_create(created, batch_size=self.batch_size)
+            self.stats['parameters'] += len(created)
+            self.parameters.update(
+                Parameter.objects.filter(name__in=[parameter.name for parameter in created]).values_list('name', 'id'))
+
+    def write_product_infos(self, rows, fingerprints):
+        ProductInfo.objects.bulk_create(
+            [ProductInfo(product_id=product_id, shop_id=self.shop.id, fingerprint=fingerprints[product_id],
+                         facets=facets(item), **{field: item[field] for field in PRODUCT_INFO_FIELDS})
+             for product_id, item in rows.items()],
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=('product_id', 'shop_id'),
+            update_fields=PRODUCT_INFO_FIELDS + ('fingerprint', 'facets'))
+        return dict(ProductInfo.objects.filter(shop_id=self.shop.id, product_id__in=rows).values_list('product_id', 'id'))
+
+    def write_parameters(self, rows, product_infos):
+        self.resolve_parameters({str(name) for item in rows.values() for name in item['parameters']})
+        ProductParameter.objects.bulk_create(
+            [ProductParameter(product_info_id=product_infos[product_id],
+                              parameter_id=self.parameters[str(name)],
+                              value=value)
+             for product_id, item in rows.items() for name, value in item['parameters'].items()],
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=('product_info_id', 'parameter_id'),
+            update_fields=('value',))
+
+
+class DeltaPriceListImporter(PriceListImporter):
+    """
+    Дифференциальный импорт: существующие ProductInfo сопоставляются по (product, shop)
+    и отпечатку строки, записываются только новые и изменившиеся строки,
+    пропавшие из прайс-листа удаляются в конце импорта
+    """
+
+    def __init__(self, shop, batch_size=None, progress=None):
+        super().__init__(shop, batch_size, progress)
+        self.existing = {}
+        self.stats.update({'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0})
+
+    def summary(self):
+        return (f'Изменено товаров: {self.stats["changed"]}, добавлено: {self.stats["added"]}, '
+                f'удалено: {self.stats["removed"]}, без изменений: {self.stats["unchanged"]}.')
+
+    def begin(self):
+        self.existing = {
+            product_id: (product_info_id, fingerprint) for product_id, product_info_id, fingerprint
+            in ProductInfo.objects.filter(shop_id=self.shop.id).values_list('product_id', 'id', 'fingerprint')}
+
+    def write(self, rows, fingerprints):
+        added, changed = {}, {}
+        for product_id, item in rows.items():
+            existing = self.existing.pop(product_id, None)
+            if existing is None:
+                added[product_id] = item
+            elif existing[1] != fingerprints[product_id]:
+                changed[product_id] = item
+        self.stats['added'] += len(added)
+        self.stats['changed'] += len(changed)
+        self.stats['unchanged'] += len(rows) - len(added) - len(changed)
+        rows = {**added, **changed}
+        if not rows:
+            return
+        with self.progress.stage('products'):
+            product_infos = self.write_product_infos(rows, fingerprints)
+        with self.progress.stage('parameters'):
+            if changed:
+                self.delete_parameters([product_infos[product_id] for product_id in changed])
+            self.write_parameters(rows, product_infos)
+
+    def delete_parameters(self, product_info_ids):
+        """
+        параметры изменившихся строк удаляются одним DELETE без сигналов post_delete:
+        отпечаток и фасеты строк импорт уже записал сам
+        """
+        parameters = ProductParameter.objects.filter(product_info_id__in=product_info_ids)
+        parameters._raw_delete(parameters.db)
+
+    def finish(self):
+        removed = [product_info_id for product_info_id, _ in self.existing.values()]
+        with self.progress.stage('products'):
+            for chunk in chunked(removed, self.batch_size):
+                self.delete_product_infos(ProductInfo.objects.filter(id__in=chunk))
+        self.stats['removed'] = len(removed)
+        self.existing = {}
+
+
+class StagedPriceListImporter(DeltaPriceListImporter):
+    """
+    Импорт через промежуточные таблицы: строки прайс-листа загружаются во временные
+    таблицы (COPY на PostgreSQL, многострочные INSERT на остальных СУБД),
+    затем сливаются в ProductInfo/ProductParameter одной короткой транзакцией,
+    поэтому читатели каталога не видят частично загруженных данных
+    """
+    STAGE_PRODUCT_INFO = 'import_stage_product_info'
+    STAGE_PRODUCT_PARAMETER = 'import_stage_product_parameter'
+    STAGE_PRODUCT_INFO_COLUMNS = ('product_id', 'fingerprint') + PRODUCT_INFO_FIELDS + ('facets',)
+    STAGE_PRODUCT_PARAMETER_COLUMNS = ('product_id', 'parameter_id', 'value')
+
+    def __init__(self, shop, batch_size=None, progress=None):
+        super().__init__(shop, batch_size, progress)
+        self.staged = set()
+
+    def run(self, categories, goods):
+        self.import_categories(categories)
+        self.create_stage()
+        try:
+            for chunk in chunked(goods, self.batch_size):
+                self.load(chunk)
+            with transaction.atomic():
+                self.merge()
+        finally:
+            self.drop_stage()
+        return self.stats
+
+    def create_stage(self):
+        self.drop_stage()
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE {self.STAGE_PRODUCT_INFO} ('
+                           f'product_id bigint, fingerprint varchar(32), model varchar(80), '
+                           f'price integer, price_rrc integer, quantity integer, facets text)')
+            cursor.execute(f'CREATE TEMPORARY TABLE {self.STAGE_PRODUCT_PARAMETER} ('
+                           f'product_id bigint, parameter_id bigint, value varchar(100))')
+
+    def drop_stage(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.STAGE_PRODUCT_INFO}')
+            cursor.execute(f'DROP TABLE IF EXISTS {self.STAGE_PRODUCT_PARAMETER}')
+
+    def write(self, rows, fingerprints):
+        rows = {product_id: item for product_id, item in rows.items() if product_id not in self.staged}
+        self.staged.update(rows)
+        with self.progress.stage('products'):
+            self.copy(self.STAGE_PRODUCT_INFO, self.STAGE_PRODUCT_INFO_COLUMNS, [
+                (product_id, fingerprints[product_id], *(item[field] for field in PRODUCT_INFO_FIELDS),
+                 json.dumps(facets(item), ensure_ascii=False))
+                for product_id, item in rows.items()])
+        with self.progress.stage('parameters'):
+            self.resolve_parameters({str(name) for item in rows.values() for name in item['parameters']})
+            self.copy(self.STAGE_PRODUCT_PARAMETER, self.STAGE_PRODUCT_PARAMETER_COLUMNS, [
+                (product_id, self.parameters[str(name)], value)
+                for product_id, item in rows.items() for name, value in item['parameters'].items()])
+
+    def copy(self, table, columns, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # в формате csv COPY читает пустое поле без кавычек как NULL, поэтому кавычки у всех полей
+                buffer = io.StringIO()
+                csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+                buffer.seek(0)
+                cursor.cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+                return
+            placeholders = f'({", ".join(["%s"] * len(columns))})'
+            statement_rows = (connection.features.max_query_params or len(rows) * len(columns)) // len(columns)
+            for chunk in chunked(rows, statement_rows):
+                values = ', '.join([placeholders] * len(chunk))
+                cursor.execute(f'INSERT INTO {table} ({", ".join(columns)}) VALUES {values}',
+                               [value for row in chunk for value in row])
+
+    def merge(self):
+        product_info = ProductInfo._meta.db_table
+        product_parameter = ProductParameter._meta.db_table
+        shop_id = self.shop.id
+        with self.progress.stage('products'), connection.cursor() as cursor:
+            self.stats['removed'] = self.delete_product_infos(ProductInfo.objects.filter(shop_id=shop_id).exclude(
+                product_id__in=RawSQL(f'SELECT product_id FROM {self.STAGE_PRODUCT_INFO}', ()))
+            )[1].get(ProductInfo._meta.label, 0)
+            cursor.execute(f'DELETE FROM {self.STAGE_PRODUCT_INFO} WHERE EXISTS ('
+                           f'SELECT 1 FROM {product_info} p WHERE p.shop_id = %s '
+                           f'AND p.product_id = {self.STAGE_PRODUCT_INFO}.product_id '
+                           f'AND p.fingerprint = {self.STAGE_PRODUCT_INFO}.fingerprint)', (shop_id,))
+            self.stats['unchanged'] = cursor.rowcount
+            cursor.execute(f'SELECT COUNT(*) FROM {self.STAGE_PRODUCT_INFO} s WHERE NOT EXISTS ('
+                           f'SELECT 1 FROM {product_info} p WHERE p.shop_id = %s AND p.product_id = s.product_id)',
+                           (shop_id,))
+            self.stats['added'] = cursor.fetchone()[0]
+            self.stats['changed'] = len(self.staged) - self.stats['unchanged'] - self.stats['added']
+            columns = ', '.join(self.STAGE_PRODUCT_INFO_COLUMNS)
+            values = columns.replace('facets', 'CAST(facets AS jsonb)') if connection.vendor == 'postgresql' \
+                else columns
+            updates = ', '.join(f'{column} = excluded.{column}' for column in self.STAGE_PRODUCT_INFO_COLUMNS[1:])
+            cursor.execute(f'INSERT INTO {product_info} (shop_id, {columns}) '
+                           f'SELECT %s, {values} FROM {self.STAGE_PRODUCT_INFO} WHERE true '
+                           f'ON CONFLICT (product_id, shop_id) DO UPDATE SET {updates}', (shop_id,))
+        with self.progress.stage('parameters'), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {product_parameter} WHERE product_info_id IN ('
+                           f'SELECT p.id FROM {product_info} p JOIN {self.STAGE_PRODUCT_INFO} s '
+                           f'ON s.product_id = p.product_id WHERE p.shop_id = %s)', (shop_id,))
+            cursor.execute(f'INSERT INTO {product_parameter} (product_info_id, parameter_id, value) '
+                           f'SELECT p.id, sp.parameter_id, sp.value FROM {self.STAGE_PRODUCT_PARAMETER} sp '
+                           f'JOIN {self.STAGE_PRODUCT_INFO} s ON s.product_id = sp.product_id '
+                           f'JOIN {product_info} p ON p.product_id = sp.product_id AND p.shop_id = %s', (shop_id,))
+
+
+class ShardedPriceListImporter(DeltaPriceListImporter):
+    """
+    Параллельный импорт: prepare разрешает ключи и раскладывает товары в ImportRow
+    по шардам из shard_size строк, шарды записываются независимо через load_shard,
+    пропавшие строки удаляет reconcile после записи всех шардов
+    """
+
+    def __init__(self, shop, batch_size=None, progress=None, shard_size=None):
+        super().__init__(shop, batch_size, progress)
+        self.shard_size = shard_size or settings.IMPORT_SHARD_SIZE
+
+    def run(self, categories, goods):
+        self.import_categories(categories)
+        product_ids = []
+        for chunk in chunked(goods, self.shard_size):
+            product_ids.extend(self.load_rows(self.resolve_rows(chunk)))
+        self.reconcile(product_ids)
+        return self.stats
+
+    def resolve_rows(self, chunk):
+        """
+        возвращаем пары (product_id, строка прайс-листа)
+        """
+        keyed = [((str(item['name']), item['category']), item) for item in chunk]
+        with self.progress.stage('products'):
+            self.resolve_products({key for key, _ in keyed})
+        with self.progress.stage('parameters'):
+            self.resolve_parameters({str(name) for _, item in keyed for name in item['parameters']})
+        return [(self.products[key], item) for key, item in keyed]
+
+    def prepare(self, categories, goods, job_id):
+        """
+        записываем товары в ImportRow пачками по batch_size, возвращаем число шардов;
+        при ошибке разбора уже записанные строки удаляются
+        """
+        self.import_categories(categories)
+        count = 0
+        try:
+            for chunk in chunked(goods, self.batch_size):
+                ImportRow.objects.bulk_create(
+                    ImportRow(job_id=job_id, shard=number // self.shard_size, product_id=product_id, item=item)
+                    for number, (product_id, item) in enumerate(self.resolve_rows(chunk), count))
+                count += len(chunk)
+        except Exception:
+            clear_staged_rows(job_id)
+            raise
+        return math.ceil(count / self.shard_size)
+
+    def load_shard(self, job_id, shard):
+        return self.load_rows(ImportRow.objects.filter(job_id=job_id, shard=shard).order_by('id').values_list(
+            'product_id', 'item'))
+
+    def load_rows(self, rows):
+        rows = dict(rows)
+        self.stats['goods'] += len(rows)
+        with transaction.atomic():
+            self.existing = {
+                product_id: (product_info_id, fingerprint) for product_id, product_info_id, fingerprint
+                in ProductInfo.objects.filter(shop_id=self.shop.id, product_id__in=rows).values_list(
+                    'product_id', 'id', 'fingerprint')}
+            self.write(rows, {product_id: fingerprint(item) for product_id, item in rows.items()})
+        return list(rows)
+
+    def reconcile(self, product_ids):
+        product_ids = set(product_ids)
+        with transaction.atomic():
+            self.existing = {
+                product_id: (product_info_id, None) for product_id, product_info_id
+                in ProductInfo.objects.filter(shop_id=self.shop.id).values_list('product_id', 'id')
+                if product_id not in product_ids}
+            self.finish()
+
+    def reconcile_staged(self, job_id):
+        """
+        удаляем строки, которых не было среди ImportRow задания, и очищаем ImportRow
+        """
+        self.reconcile(ImportRow.objects.filter(job_id=job_id).values_list('product_id', flat=True))
+        clear_staged_rows(job_id)
+
+
+def clear_staged_rows(job_id):
+    ImportRow.objects.filter(job_id=job_id).delete()
+
+
+IMPORTERS = {
+    'replace': PriceListImporter,
+    'delta': DeltaPriceListImporter,
+    'staged': StagedPriceListImporter,
+    'parallel': ShardedPriceListImporter,
+}
@@ -0,0 +1,72 @@
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+
+def import_lock_key(user_id):
+    return f'import:lock:{user_id}'
+
+
+def acquire_import_lock(user_id, job_id):
+    """
+    блокировка импорта магазина: одновременно выполняется только один импорт,
+    владелец блокировки - задание импорта
+    """
+    return bool(get_redis().set(import_lock_key(user_id), job_id, nx=True, px=int(settings.IMPORT_LOCK_TIMEOUT * 1000)))
+
+
+def release_import_lock(user_id, job_id):
+    get_redis().eval(RELEASE_SCRIPT, 1, import_lock_key(user_id), job_id)
+
+
+def extend_import_lock(user_id, job_id):
+    """
+    продлеваем блокировку на IMPORT_LOCK_TIMEOUT, если она все еще принадлежит заданию
+    """
+    return bool(get_redis().eval(EXTEND_SCRIPT, 1, import_lock_key(user_id), job_id,
+                                 int(settings.IMPORT_LOCK_TIMEOUT * 1000)))
+
+
+@contextmanager
+def import_lock_heartbeat(user_id, job_id):
+    """
+    пока выполняется импорт, блокировка продлевается каждую треть IMPORT_LOCK_TIMEOUT;
+    отдаем событие, которое выставляется, если блокировка потеряна
+    """
+    stopped, lost = threading.Event(), threading.Event()
+
+    def beat():
+        while not stopped.wait(settings.IMPORT_LOCK_TIMEOUT / 3):
+            if not extend_import_lock(user_id, job_id):
+                lost.set()
+                return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stopped.set()
+        thread.join()
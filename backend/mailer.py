@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from backend.models import MailMessage, User
+
+
+def enqueue_mail(user_id, msg_txt, topic_msg, event_id=None):
+    """
+    ставим письмо пользователю в очередь одним INSERT, адрес берется подзапросом; отправляет его send_mail_queue.
+    event_id - событие outbox: повторная публикация того же события второго письма не ставит
+    """
+    email = Subquery(User.objects.filter(id=user_id).values('email'))
+    try:
+        with transaction.atomic():
+            MailMessage.objects.create(user_id=user_id, email=email, subject=topic_msg, body=msg_txt,
+                                       event_id=event_id)
+    except IntegrityError:
+        if event_id is None or not MailMessage.objects.filter(event_id=event_id).exists():
+            raise
+
+
+def claim_mail(batch_size):
+    """
+    забираем пачку писем, срок которых подошел; письмо в отправке откладывается на MAIL_SEND_TIMEOUT,
+    чтобы письма упавшего воркера вернулись в очередь, а параллельные воркеры не брали одни и те же письма
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(MailMessage.objects.select_for_update(skip_locked=True).filter(
+            status__in=('queued', 'sending'), next_attempt_at__lte=now,
+        ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        MailMessage.objects.filter(id__in=ids).update(
+            status='sending', attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.MAIL_SEND_TIMEOUT))
+    return list(MailMessage.objects.filter(id__in=ids).order_by('id'))
+
+
+def defer_mail(message, error):
+    """
+    откладываем письмо с удвоением паузы после каждой попытки, после MAIL_MAX_ATTEMPTS - ошибка
+    """
+    if message.attempts >= settings.MAIL_MAX_ATTEMPTS:
+        MailMessage.objects.filter(id=message.id).update(status='failed', error=str(error))
+        return
+    delay = settings.MAIL_RETRY_DELAY * 2 ** (message.attempts - 1)
+    MailMessage.objects.filter(id=message.id).update(
+        status='queued', error=str(error), next_attempt_at=timezone.now() + timedelta(seconds=delay))
+
+
+def send_mail_queue(batch_size=None):
+    """
+    отправляем очередь писем пачками по MAIL_BATCH_SIZE через одно SMTP-соединение;
+    письмо, которое не удалось отправить, откладывается отдельно, соединение открывается заново.
+    Возвращаем число отправленных писем
+    """
+    batch_size = batch_size or settings.MAIL_BATCH_SIZE
+    connection = get_connection()
+    sent = 0
+    try:
+        while messages := claim_mail(batch_size):
+            delivered = []
+            for message in messages:
+                msg = EmailMultiAlternatives(message.subject, message.body, settings.EMAIL_HOST_USER,
+                                             [message.email], connection=connection)
+                try:
+                    connection.open()
+                    connection.send_messages([msg])
+                except Exception as error:
+                    connection.close()
+                    defer_mail(message, error)
+                else:
+                    delivered.append(message.id)
+            MailMessage.objects.filter(id__in=delivered).update(status='sent', sent_at=timezone.now(), error='')
+            sent += len(delivered)
+    finally:
+        connection.close()
+    return sent
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from backend.models import Order
+from backend.orders import freeze_prices, item_totals, recalculate_totals, split_orders
+
+
+class Command(BaseCommand):
+    help = 'Пересчет сохраненных сумм заказов (Order.total_sum, Order.items_count, Order.units_count) ' \
+           'и заказов магазинов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='только сверить суммы, ничего не меняя')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_totals()
+        freeze_prices(Order.objects.exclude(state='basket'))
+        split_orders(Order.objects.exclude(state='basket'))
+        ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            recalculate_totals(Order.objects.filter(id__in=ids[start:start + batch_size]))
+        self.stdout.write(f'Пересчитано заказов: {len(ids)}')
+
+    def check_totals(self):
+        total_sum, items_count, units_count = item_totals()
+        mismatched = list(Order.objects.annotate(
+            expected_sum=total_sum, expected_count=items_count, expected_units=units_count).exclude(
+            total_sum=F('expected_sum'), items_count=F('expected_count'), units_count=F('expected_units')).order_by(
+            'id').values_list('id', 'total_sum', 'expected_sum'))
+        for order_id, stored, expected in mismatched:
+            self.stdout.write(f'Заказ {order_id}: сохранено {stored}, по позициям {expected}')
+        if mismatched:
+            raise CommandError(f'Суммы расходятся у заказов: {len(mismatched)}')
+        self.stdout.write('Суммы заказов сходятся')
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.outbox import relay_events
+
+
+class Command(BaseCommand):
+    help = 'Публикация событий outbox в Celery: постоянно или один проход (--once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='опубликовать накопившиеся события и выйти')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            relayed = relay_events(options['batch_size'])
+            if options['once']:
+                self.stdout.write(f'Опубликовано событий: {relayed}')
+                return
+            if not relayed:
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
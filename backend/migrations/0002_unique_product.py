@@ -0,0 +1,50 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:12
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def dedupe_products(apps, schema_editor):
+    """
+    склеиваем продукты с одинаковыми (name, category) перед добавлением unique_product:
+    остается продукт с наименьшим id, товары магазинов переносятся на него; если у оставшегося продукта
+    уже есть товар того же магазина, позиции заказов переходят на этот товар (количество складывается)
+    """
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    groups = Product.objects.order_by().values('name', 'category_id').annotate(
+        keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    for group in groups:
+        extra = Product.objects.filter(name=group['name'], category_id=group['category_id']).exclude(
+            id=group['keep'])
+        kept = dict(ProductInfo.objects.filter(product_id=group['keep']).values_list('shop_id', 'id'))
+        for info_id, shop_id in ProductInfo.objects.filter(product__in=extra).order_by('id').values_list(
+                'id', 'shop_id'):
+            if shop_id not in kept:
+                ProductInfo.objects.filter(id=info_id).update(product_id=group['keep'])
+                kept[shop_id] = info_id
+                continue
+            for item_id, order_id, quantity in OrderItem.objects.filter(product_info_id=info_id).values_list(
+                    'id', 'order_id', 'quantity'):
+                merged = OrderItem.objects.filter(order_id=order_id, product_info_id=kept[shop_id]).update(
+                    quantity=F('quantity') + quantity)
+                if not merged:
+                    OrderItem.objects.filter(id=item_id).update(product_info_id=kept[shop_id])
+            ProductInfo.objects.filter(id=info_id).delete()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_products, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name', 'category'), name='unique_product'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_unique_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Отпечаток строки импорта'),
+        ),
+    ]
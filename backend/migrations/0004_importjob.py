@@ -0,0 +1,37 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_productinfo_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.TextField(verbose_name='Файл')),
+                ('mode', models.CharField(default='replace', max_length=15, verbose_name='Режим')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=15, verbose_name='Статус')),
+                ('stage', models.CharField(blank=True, choices=[('parsed', 'Файл разобран'), ('categories', 'Категории'), ('products', 'Товары'), ('parameters', 'Параметры'), ('done', 'Завершен')], max_length=15, verbose_name='Этап')),
+                ('counts', models.JSONField(blank=True, default=dict, verbose_name='Количество строк')),
+                ('timings', models.JSONField(blank=True, default=dict, verbose_name='Время этапов, с')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлен')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to='backend.shop', verbose_name='Магазин')),
+                ('user', models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание импорта',
+                'verbose_name_plural': 'Задания импорта',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка'), ('superseded', 'Заменен более новым')], default='queued', max_length=15, verbose_name='Статус'),
+        ),
+    ]
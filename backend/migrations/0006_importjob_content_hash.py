@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_importjob_superseded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256 содержимого'),
+        ),
+    ]
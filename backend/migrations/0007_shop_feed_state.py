@@ -0,0 +1,33 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_importjob_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='feed_etag',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='ETag прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256 прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_last_modified',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Last-Modified прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_mtime',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Время изменения файла прайса'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRESQL_INDEXES = (
+    "ALTER TABLE backend_productsearch ADD COLUMN vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', name), 'A') || setweight(to_tsvector('russian', model), 'B') || "
+    "setweight(to_tsvector('russian', category), 'C')) STORED",
+    "CREATE INDEX backend_productsearch_vector ON backend_productsearch USING gin (vector)",
+)
+POSTGRESQL_TRIGRAM_INDEXES = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX backend_productsearch_model_trgm ON backend_productsearch USING gin (model gin_trgm_ops)",
+)
+SQLITE_INDEXES = (
+    "CREATE VIRTUAL TABLE backend_productsearch_fts USING fts5("
+    "name, model, category, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER backend_productsearch_ai AFTER INSERT ON backend_productsearch BEGIN "
+    "INSERT INTO backend_productsearch_fts (rowid, name, model, category) "
+    "VALUES (new.product_info_id, new.name, new.model, new.category); END",
+    "CREATE TRIGGER backend_productsearch_ad AFTER DELETE ON backend_productsearch BEGIN "
+    "DELETE FROM backend_productsearch_fts WHERE rowid = old.product_info_id; END",
+    "CREATE TRIGGER backend_productsearch_au AFTER UPDATE ON backend_productsearch BEGIN "
+    "UPDATE backend_productsearch_fts SET name = new.name, model = new.model, category = new.category "
+    "WHERE rowid = old.product_info_id; END",
+)
+SQLITE_DROP_INDEXES = (
+    "DROP TRIGGER IF EXISTS backend_productsearch_ai",
+    "DROP TRIGGER IF EXISTS backend_productsearch_ad",
+    "DROP TRIGGER IF EXISTS backend_productsearch_au",
+    "DROP TABLE IF EXISTS backend_productsearch_fts",
+)
+FILL_DOCUMENTS = (
+    "INSERT INTO backend_productsearch (product_info_id, name, model, category) "
+    "SELECT pi.id, p.name, pi.model, c.name FROM backend_productinfo pi "
+    "JOIN backend_product p ON p.id = pi.product_id JOIN backend_category c ON c.id = p.category_id"
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    поисковые индексы зависят от СУБД, на остальных СУБД поиск работает без индекса
+    """
+    connection = schema_editor.connection
+    statements = ()
+    if connection.vendor == 'postgresql':
+        statements = POSTGRESQL_INDEXES
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            if cursor.fetchone():
+                statements += POSTGRESQL_TRIGRAM_INDEXES
+    elif connection.vendor == 'sqlite':
+        statements = SQLITE_INDEXES
+    for statement in statements + (FILL_DOCUMENTS,):
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_DROP_INDEXES:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_shop_feed_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearch',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('name', models.CharField(max_length=80, verbose_name='Название')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('category', models.CharField(max_length=40, verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='stage',
+            field=models.CharField(blank=True, choices=[('parsed', 'Файл разобран'), ('categories', 'Категории'), ('products', 'Товары'), ('parameters', 'Параметры'), ('search', 'Поисковый индекс'), ('done', 'Завершен')], max_length=15, verbose_name='Этап'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:28
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def fill_facets(apps, schema_editor):
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        facets = defaultdict(dict)
+        for product_info_id, name, value in ProductParameter.objects.filter(product_info_id__in=chunk).values_list(
+                'product_info_id', 'parameter__name', 'value'):
+            facets[product_info_id][name] = value
+        ProductInfo.objects.bulk_update([ProductInfo(id=product_info_id, facets=facets[product_info_id])
+                                         for product_info_id in chunk if product_info_id in facets], ['facets'])
+
+
+def create_facets_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX backend_productinfo_facets ON backend_productinfo '
+                              'USING gin (facets jsonb_path_ops)')
+
+
+def drop_facets_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS backend_productinfo_facets')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_productsearch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='facets',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Параметры для фильтрации'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+        migrations.RunPython(create_facets_index, drop_facets_index),
+    ]
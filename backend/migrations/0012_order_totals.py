@@ -0,0 +1,47 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:37
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    """
+    оформленные заказы получают цены на момент миграции, суммы считаются для всех заказов
+    """
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    OrderItem.objects.exclude(order__state='basket').update(
+        price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('price')[:1]))
+    items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    Order.objects.update(
+        total_sum=Coalesce(Subquery(items.annotate(
+            value=Sum(F('quantity') * Coalesce('price', 'product_info__price'))).values('value')), 0),
+        items_count=Coalesce(Subquery(items.annotate(value=Count('id')).values('value')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Цена на момент заказа'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.3 on 2026-10-18 20:41
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def split_orders(apps, schema_editor):
+    """
+    заказы магазинов для уже оформленных заказов
+    """
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ShopOrder = apps.get_model('backend', 'ShopOrder')
+    items = OrderItem.objects.exclude(order__state='basket')
+    ShopOrder.objects.bulk_create(
+        [ShopOrder(order_id=order_id, shop_id=shop_id, state=state) for order_id, shop_id, state
+         in items.order_by().values_list('order_id', 'product_info__shop_id', 'order__state').distinct()],
+        ignore_conflicts=True)
+    shop_id = ProductInfo.objects.filter(id=OuterRef(OuterRef('product_info_id'))).values('shop_id')
+    items.update(shop_order=Subquery(ShopOrder.objects.filter(
+        order_id=OuterRef('order_id'), shop_id=Subquery(shop_id)).values('id')[:1]))
+    shop_items = OrderItem.objects.filter(shop_order_id=OuterRef('pk')).order_by().values('shop_order_id')
+    ShopOrder.objects.update(
+        total_sum=Coalesce(Subquery(shop_items.annotate(
+            value=Sum(F('quantity') * Coalesce('price', 'product_info__price'))).values('value')), 0),
+        items_count=Coalesce(Subquery(shop_items.annotate(value=Count('id')).values('value')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый')], max_length=15, verbose_name='Статус')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменен')),
+                ('total_sum', models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма')),
+                ('items_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество позиций')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.order', verbose_name='Заказ')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Заказ магазина',
+                'verbose_name_plural': 'Заказы магазинов',
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop_order',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='backend.shoporder', verbose_name='Заказ магазина'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoporder',
+            constraint=models.UniqueConstraint(fields=('shop', 'order'), name='unique_shop_order'),
+        ),
+        migrations.RunPython(split_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.3 on 2026-10-18 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'ordering': ['id'], 'verbose_name': 'Категория', 'verbose_name_plural': 'Список категорий'},
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='state',
+            field=models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый')], max_length=15, verbose_name='Статус'),
+        ),
+    ]
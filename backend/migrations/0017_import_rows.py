@@ -0,0 +1,32 @@
+# Generated by Django 4.1.3 on 2026-10-18 21:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_category_options_order_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveIntegerField(verbose_name='Шард')),
+                ('product_id', models.BigIntegerField(verbose_name='Продукт')),
+                ('item', models.JSONField(verbose_name='Строка прайс-листа')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='backend.importjob', verbose_name='Задание импорта')),
+            ],
+            options={
+                'verbose_name': 'Строка импорта',
+                'verbose_name_plural': 'Строки импорта',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importrow',
+            index=models.Index(fields=['job', 'shard'], name='import_row_shard'),
+        ),
+    ]
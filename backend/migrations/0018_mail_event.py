@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_import_rows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailmessage',
+            name='event_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True, verbose_name='Событие outbox'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.3 on 2026-10-18 21:47
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_units(apps, schema_editor):
+    """
+    количество единиц товара считается по позициям для заказов и заказов магазинов
+    """
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    for model_name, field in (('Order', 'order_id'), ('ShopOrder', 'shop_order_id')):
+        items = OrderItem.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+        apps.get_model('backend', model_name).objects.update(
+            units_count=Coalesce(Subquery(items.annotate(value=Sum('quantity')).values('value')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_mail_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='units_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество единиц товара'),
+        ),
+        migrations.AddField(
+            model_name='shoporder',
+            name='units_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество единиц товара'),
+        ),
+        migrations.RunPython(fill_units, migrations.RunPython.noop),
+    ]
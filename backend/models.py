@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 STATE_CHOICES = (
@@ -8,6 +9,30 @@ STATE_CHOICES = (
     ('new', 'Новый'),
 )
 
+IMPORT_STATUS_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+    ('superseded', 'Заменен более новым'),
+)
+
+IMPORT_STAGE_CHOICES = (
+    ('parsed', 'Файл разобран'),
+    ('categories', 'Категории'),
+    ('products', 'Товары'),
+    ('parameters', 'Параметры'),
+    ('search', 'Поисковый индекс'),
+    ('done', 'Завершен'),
+)
+
+MAIL_STATUS_CHOICES = (
+    ('queued', 'В очереди'),
+    ('sending', 'Отправляется'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -62,6 +87,12 @@ class Shop(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='статус получения заказов', default=True)
+    feed_etag = models.CharField(verbose_name='ETag прайса', max_length=255, blank=True, editable=False)
+    feed_last_modified = models.CharField(verbose_name='Last-Modified прайса', max_length=64, blank=True,
+                                          editable=False)
+    feed_mtime = models.FloatField(verbose_name='Время изменения файла прайса', blank=True, null=True,
+                                   editable=False)
+    feed_hash = models.CharField(verbose_name='SHA-256 прайса', max_length=64, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -93,6 +124,9 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_product'),
+        ]
         # ordering = ('-name',)
 
     def __str__(self):
@@ -108,6 +142,9 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    fingerprint = models.CharField(max_length=32, verbose_name='Отпечаток строки импорта', blank=True,
+                                   editable=False)
+    facets = models.JSONField(verbose_name='Параметры для фильтрации', default=dict, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -115,12 +152,34 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_info'),
         ]
+        indexes = [
+            models.Index(fields=['shop', 'id'], name='product_info_keyset'),
+        ]
         ordering = ('shop', 'product__category__name', 'product__name')
 
     def __str__(self):
         return str(self.product.name)
 
 
+class ProductSearch(models.Model):
+    """
+    Поисковый документ товара; индексы создаются миграцией под СУБД:
+    tsvector/GIN и триграммы на PostgreSQL, таблица FTS5 на SQLite
+    """
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', primary_key=True,
+                                        related_name='search', on_delete=models.CASCADE)
+    name = models.CharField(max_length=80, verbose_name='Название')
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    category = models.CharField(max_length=40, verbose_name='Категория')
+
+    class Meta:
+        verbose_name = 'Поисковый документ'
+        verbose_name_plural = "Поисковые документы"
+
+    def __str__(self):
+        return self.name
+
+
 class Parameter(models.Model):
     name = models.CharField(max_length=40, verbose_name='Название')
 
@@ -180,16 +239,44 @@ class Order(models.Model):
     contact = models.ForeignKey(Contact, verbose_name='Контакт',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменен')
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма', default=0, editable=False)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0, editable=False)
+    units_count = models.PositiveIntegerField(verbose_name='Количество единиц товара', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Заказы"
+        indexes = [
+            models.Index(fields=['user', 'id'], name='order_keyset'),
+        ]
         ordering = ('id', '-dt',)
 
     def __str__(self):
         return str(f"Заказ №{self.id} от {self.dt.strftime('%Y-%m-%d %H:%M:%S')}")
 
 
+class ShopOrder(models.Model):
+    """
+    Часть оформленного заказа с позициями одного магазина
+    """
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='shop_orders', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='shop_orders', on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменен')
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма', default=0, editable=False)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0, editable=False)
+    units_count = models.PositiveIntegerField(verbose_name='Количество единиц товара', default=0, editable=False)
+
+    class Meta:
+        verbose_name = 'Заказ магазина'
+        verbose_name_plural = "Заказы магазинов"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'order'], name='unique_shop_order'),
+        ]
+
+    def __str__(self):
+        return f'{self.order} ({self.shop})'
 
 
 class OrderItem(models.Model):
@@ -200,6 +287,10 @@ class OrderItem(models.Model):
                                      blank=True,
                                      on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена на момент заказа', blank=True, null=True,
+                                        editable=False)
+    shop_order = models.ForeignKey(ShopOrder, verbose_name='Заказ магазина', related_name='items', blank=True,
+                                   null=True, editable=False, on_delete=models.SET_NULL)
 
     class Meta:
         verbose_name = 'Заказанная позиция'
@@ -209,4 +300,89 @@ class OrderItem(models.Model):
         ]
 
     def __str__(self):
-        return str(self.product_info.product.category)
\ No newline at end of file
+        return str(self.product_info.product.category)
+
+
+class ImportJob(models.Model):
+    user = models.ForeignKey(User, verbose_name='Пользователь',
+                             related_name='import_jobs', blank=True,
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='import_jobs', blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    filename = models.TextField(verbose_name='Файл')
+    mode = models.CharField(verbose_name='Режим', max_length=15, default='replace')
+    content_hash = models.CharField(verbose_name='SHA-256 содержимого', max_length=64, blank=True)
+    status = models.CharField(verbose_name='Статус', choices=IMPORT_STATUS_CHOICES, max_length=15, default='queued')
+    stage = models.CharField(verbose_name='Этап', choices=IMPORT_STAGE_CHOICES, max_length=15, blank=True)
+    counts = models.JSONField(verbose_name='Количество строк', default=dict, blank=True)
+    timings = models.JSONField(verbose_name='Время этапов, с', default=dict, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлен')
+
+    class Meta:
+        verbose_name = 'Задание импорта'
+        verbose_name_plural = "Задания импорта"
+        ordering = ('-id',)
+
+    def __str__(self):
+        return str(f"Импорт №{self.id} {self.filename}")
+
+
+class ImportRow(models.Model):
+    """
+    Строка прайс-листа параллельного импорта с разрешенным product_id;
+    задачи записи шардов получают только номер шарда, строки удаляются после завершения импорта
+    """
+    job = models.ForeignKey(ImportJob, verbose_name='Задание импорта', related_name='rows', on_delete=models.CASCADE)
+    shard = models.PositiveIntegerField(verbose_name='Шард')
+    product_id = models.BigIntegerField(verbose_name='Продукт')
+    item = models.JSONField(verbose_name='Строка прайс-листа')
+
+    class Meta:
+        verbose_name = 'Строка импорта'
+        verbose_name_plural = "Строки импорта"
+        indexes = [
+            models.Index(fields=['job', 'shard'], name='import_row_shard'),
+        ]
+
+
+class MailMessage(models.Model):
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='mail_messages', blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    email = models.EmailField(verbose_name='Получатель')
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст')
+    status = models.CharField(verbose_name='Статус', choices=MAIL_STATUS_CHOICES, max_length=15, default='queued')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(verbose_name='Отправлено', blank=True, null=True)
+    event_id = models.BigIntegerField(verbose_name='Событие outbox', unique=True, blank=True, null=True,
+                                      editable=False)
+
+    class Meta:
+        verbose_name = 'Письмо'
+        verbose_name_plural = "Очередь писем"
+        ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='mail_due_idx'),
+        ]
+
+    def __str__(self):
+        return str(f"Письмо №{self.id} {self.email}")
+
+
+class OutboxEvent(models.Model):
+    task = models.CharField(verbose_name='Задача Celery', max_length=255)
+    kwargs = models.JSONField(verbose_name='Аргументы', default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+
+    class Meta:
+        verbose_name = 'Событие outbox'
+        verbose_name_plural = "Исходящие события"
+        ordering = ('id',)
+
+    def __str__(self):
+        return str(f"Событие №{self.id} {self.task}")
@@ -0,0 +1,149 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from backend.cache import bump_catalog_version
+from backend.models import Order, OrderItem, ProductInfo, ShopOrder
+
+
+class OutOfStock(Exception):
+    """
+    Остатка хватило не на все позиции заказа; failures - отчет по каждой такой позиции
+    """
+
+    def __init__(self, failures):
+        super().__init__(failures)
+        self.failures = failures
+
+
+class AlreadyPlaced(Exception):
+    """
+    Заказ уже оформлен другим запросом
+    """
+
+
+def item_totals(field='order_id'):
+    """
+    суммы позиций заказа (field='shop_order_id' - заказа магазина):
+    в корзине по текущей цене товара, после оформления - по зафиксированной
+    """
+    items = OrderItem.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    total_sum = items.annotate(value=Sum(F('quantity') * Coalesce('price', 'product_info__price'))).values('value')
+    items_count = items.annotate(value=Count('id')).values('value')
+    units_count = items.annotate(value=Sum('quantity')).values('value')
+    return Coalesce(Subquery(total_sum), 0), Coalesce(Subquery(items_count), 0), Coalesce(Subquery(units_count), 0)
+
+
+def recalculate_totals(orders, field='order_id'):
+    """
+    пересчитываем total_sum, items_count и units_count заказов (или заказов магазинов) одним запросом UPDATE
+    """
+    total_sum, items_count, units_count = item_totals(field)
+    return orders.update(total_sum=total_sum, items_count=items_count, units_count=units_count,
+                         updated_at=timezone.now())
+
+
+def recalculate_order(order_id):
+    recalculate_totals(Order.objects.filter(id=order_id))
+
+
+def basket_ids(product_infos):
+    """
+    корзины с позициями из product_infos; запрашивается до удаления товаров, которое удалит и позиции
+    """
+    return set(OrderItem.objects.filter(product_info__in=product_infos, order__state='basket').values_list(
+        'order_id', flat=True))
+
+
+@contextmanager
+def deleting_goods(product_infos):
+    """
+    удаление товаров product_infos или того, что удалит их каскадом (магазина, категории, пользователя):
+    корзины, из которых каскадом уйдут позиции, пересчитываются после удаления
+    """
+    baskets = basket_ids(product_infos)
+    yield
+    if baskets:
+        recalculate_totals(Order.objects.filter(id__in=baskets))
+
+
+def recalculate_baskets(shop_id, order_ids=()):
+    """
+    после импорта: корзины с товарами магазина и корзины, из которых импорт удалил товары
+    """
+    baskets = Order.objects.filter(state='basket')
+    recalculate_totals(baskets.filter(id__in=OrderItem.objects.filter(
+        product_info__shop_id=shop_id).values('order_id')))
+    if order_ids:
+        recalculate_totals(baskets.filter(id__in=order_ids))
+
+
+def freeze_prices(orders):
+    """
+    фиксируем цены позиций при оформлении заказа
+    """
+    OrderItem.objects.filter(order__in=orders, price__isnull=True).update(
+        price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('price')[:1]))
+
+
+def split_orders(orders):
+    """
+    делим оформленные заказы на заказы магазинов и привязываем к ним позиции
+    """
+    items = OrderItem.objects.filter(order__in=orders, shop_order__isnull=True)
+    ShopOrder.objects.bulk_create(
+        [ShopOrder(order_id=order_id, shop_id=shop_id, state=state) for order_id, shop_id, state
+         in items.order_by().values_list('order_id', 'product_info__shop_id', 'order__state').distinct()],
+        ignore_conflicts=True)
+    shop_id = ProductInfo.objects.filter(id=OuterRef(OuterRef('product_info_id'))).values('shop_id')
+    items.update(shop_order=Subquery(ShopOrder.objects.filter(
+        order_id=OuterRef('order_id'), shop_id=Subquery(shop_id)).values('id')[:1]))
+    recalculate_shop_orders(orders)
+
+
+def recalculate_shop_orders(orders):
+    recalculate_totals(ShopOrder.objects.filter(order__in=orders), 'shop_order_id')
+
+
+def reserve_stock(order_id):
+    """
+    списываем остатки условным UPDATE на каждую позицию (quantity >= n) без предварительных блокировок;
+    строки товаров обновляются в порядке id, поэтому встречные оформления не взаимоблокируются.
+    Вызывается в транзакции: при нехватке - OutOfStock по всем позициям, откат делает вызывающий
+    """
+    failures = []
+    items = OrderItem.objects.filter(order_id=order_id).order_by('product_info_id').values_list(
+        'product_info_id', 'quantity')
+    for product_info_id, quantity in items:
+        if not ProductInfo.objects.filter(id=product_info_id, quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity):
+            failures.append({'product_info': product_info_id, 'requested': quantity})
+    if failures:
+        available = dict(ProductInfo.objects.filter(id__in=[failure['product_info'] for failure in failures])
+                         .values_list('id', 'quantity'))
+        for failure in failures:
+            failure['available'] = available.get(failure['product_info'], 0)
+        raise OutOfStock(failures)
+
+
+def checkout(order):
+    """
+    оформление корзины одной транзакцией: смена статуса, списание остатков,
+    фиксация цен, суммы и заказы магазинов; после фиксации транзакции меняется версия каталога
+    магазинов заказа, чтобы в кеше каталога не остались прежние остатки (версия цен остается прежней)
+    """
+    orders = Order.objects.filter(id=order.id)
+    with transaction.atomic():
+        if not orders.filter(state='basket').update(state='new', updated_at=timezone.now()):
+            raise AlreadyPlaced(order.id)
+        reserve_stock(order.id)
+        freeze_prices(orders)
+        recalculate_totals(orders)
+        split_orders(orders)
+        shop_ids = list(ShopOrder.objects.filter(order_id=order.id).values_list('shop_id', flat=True))
+        transaction.on_commit(lambda: [bump_catalog_version(shop_id, prices=False) for shop_id in shop_ids])
+    order.state = 'new'
+    return order
@@ -0,0 +1,33 @@
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+
+from backend.models import OutboxEvent
+
+
+def publish_event(task, **kwargs):
+    """
+    записываем задачу Celery в outbox; вызывается в транзакции изменения состояния,
+    поэтому задача не уйдет при откате, а запрос не ждет брокер. Ставит ее в очередь relay_events
+    """
+    OutboxEvent.objects.create(task=task, kwargs=kwargs)
+
+
+def relay_events(batch_size=None):
+    """
+    публикуем события outbox в Celery пачками по OUTBOX_BATCH_SIZE через одно соединение с брокером;
+    пачка удаляется в транзакции, где была выбрана, так что событие публикуется не менее одного раза;
+    задача получает event_id, по которому отбрасывает повторы. Возвращаем число опубликованных событий
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    relayed = 0
+    with current_app.producer_or_acquire() as producer:
+        while True:
+            with transaction.atomic():
+                events = list(OutboxEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+                if not events:
+                    return relayed
+                for event in events:
+                    current_app.signature(event.task, kwargs={**event.kwargs, 'event_id': event.id}).apply_async(producer=producer)
+                OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+            relayed += len(events)
@@ -0,0 +1,124 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Постраничный вывод по ключу: курсор хранит значения полей сортировки последней строки,
+    следующая страница выбирается условием по ним без OFFSET и COUNT(*).
+    Сортировка задается атрибутом представления keyset_ordering и должна заканчиваться
+    уникальным полем; под нее нужен составной индекс.
+    Если выборка уже отсортирована иначе (например, по релевантности поиска),
+    курсор хранит смещение
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.offset = None
+        position = self.decode_cursor(request)
+        if queryset.query.order_by and tuple(queryset.query.order_by) != self.ordering:
+            self.offset = self.offset_position(position)
+            page = list(queryset[self.offset:self.offset + self.page_size + 1])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                queryset = queryset.filter(self.keyset_filter(self.keyset_values(queryset.model, position)))
+            page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.has_previous = False
+        self.display_page_controls = self.has_next and self.template is not None
+        self.page = page[:self.page_size]
+        return self.page
+
+    def offset_position(self, position):
+        if position is None:
+            return 0
+        if not isinstance(position, int) or position < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def ordering_field(self, model, name):
+        """
+        поле модели по имени из сортировки (в том числе через связи), для внешнего ключа - поле, на которое он ссылается
+        """
+        *path, name = name.split('__')
+        for part in path:
+            model = model._meta.get_field(part).related_model
+        field = model._meta.get_field(name)
+        return field.target_field if field.is_relation else field
+
+    def keyset_values(self, model, position):
+        """
+        значения курсора приводятся к типам полей сортировки с их проверками:
+        подделанный курсор дает 404, а не ошибку базы данных
+        """
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        values = []
+        for name, value in zip(self.ordering, position):
+            try:
+                field = self.ordering_field(model, name.lstrip('-'))
+                value = field.to_python(value)
+                if value is None:
+                    raise ValueError(name)
+                field.run_validators(value)
+                # SQLite не сообщает диапазоны целых полей, проверяем по общим 64-битным
+                low, high = BaseDatabaseOperations.integer_field_ranges.get(field.get_internal_type(), (None, None))
+                if low is not None and not low <= value <= high:
+                    raise ValueError(name)
+                values.append(field.get_prep_value(value))
+            except (ValueError, TypeError, ValidationError, FieldDoesNotExist):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def keyset_filter(self, position):
+        """
+        (a, b, c) > (x, y, z) с учетом направления каждого поля:
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            equal = {name.lstrip('-'): value for name, value in zip(self.ordering[:index], position)}
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(Q(**equal, **{f'{field.lstrip("-")}__{lookup}': position[index]}))
+        return reduce(or_, conditions)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(json.dumps(position, default=str).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.offset is not None:
+            return self.encode_cursor(self.offset + self.page_size)
+        last = self.page[-1]
+        return self.encode_cursor([getattr(last, field.lstrip('-')) for field in self.ordering])
+
+    def get_previous_link(self):
+        return None
@@ -0,0 +1,221 @@
+import csv
+import io
+import json
+import os
+from collections import namedtuple
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+PriceList = namedtuple('PriceList', ('shop', 'categories', 'goods'))
+
+EXTENSIONS = {
+    '.yml': 'yaml',
+    '.yaml': 'yaml',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+}
+
+CSV_FIELDS = ('shop', 'category', 'category_name', 'name', 'model', 'price', 'price_rrc', 'quantity')
+CSV_NUMBER_FIELDS = ('category', 'price', 'price_rrc', 'quantity')
+SNIFF_SIZE = 64 * 1024
+
+
+class PriceListError(ValueError):
+    """
+    Ошибка структуры прайс-листа
+    """
+
+
+# ошибки данных прайс-листа при разборе и чтении товаров (в потоковом режиме - во время записи):
+# синтаксис YAML/JSON, отсутствующие ключи, значения неверного типа
+PARSE_ERRORS = (ValueError, KeyError, TypeError, yaml.YAMLError)
+
+
+def read_price_list(stream, filename='', streaming=False):
+    """
+    разбираем прайс-лист любого поддерживаемого формата (YAML, JSON, JSON Lines, CSV),
+    формат определяется по расширению файла или по содержимому;
+    stream - файл, открытый в двоичном режиме.
+    Потоково (streaming=True) разбираются YAML, JSON Lines и CSV; документ JSON всегда
+    загружается целиком, для больших прайс-листов нужен JSON Lines
+    """
+    loader, streamer = PARSERS[detect_format(stream, filename)]
+    return streamer(stream) if streaming else loader(stream)
+
+
+def detect_format(stream, filename=''):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+    head = stream.read(SNIFF_SIZE)
+    stream.seek(0)
+    text = head.decode('utf-8', errors='ignore').lstrip('\ufeff').lstrip()
+    first_line, _, rest = text.partition('\n')
+    if text.startswith('{'):
+        try:
+            json_loads(first_line)
+        except ValueError:
+            return 'json'
+        return 'jsonl' if rest.strip() else 'json'
+    header = {field.strip() for field in first_line.replace(';', ',').split(',')}
+    if {'name', 'price'} <= header:
+        return 'csv'
+    return 'yaml'
+
+
+def price_list_document(data):
+    """
+    прайс-лист, загруженный целиком, - объект с разделами shop, categories и goods
+    """
+    if not isinstance(data, dict) or not {'shop', 'categories', 'goods'} <= data.keys():
+        raise PriceListError('Прайс-лист должен быть объектом с разделами shop, categories и goods')
+    return PriceList(data['shop'], data['categories'], data['goods'])
+
+
+def load_json(stream):
+    return price_list_document(json_loads(stream.read()))
+
+
+def stream_jsonl(stream):
+    """
+    первая строка - заголовок с shop и categories, далее по одному товару в строке
+    """
+    lines = (line for line in stream if line.strip())
+    header = json_loads(next(lines, b'{}'))
+    if 'shop' not in header or 'categories' not in header:
+        raise PriceListError('Первая строка JSON Lines должна содержать shop и categories')
+    return PriceList(header['shop'], header['categories'], (json_loads(line) for line in lines))
+
+
+def stream_csv(stream):
+    """
+    колонки CSV_FIELDS, остальные колонки - параметры товара;
+    магазин и категории собираются первым проходом по файлу, товары отдаются вторым
+    """
+    shop, categories = None, {}
+    for row in csv_rows(stream):
+        shop = shop or row['shop']
+        categories.setdefault(int(row['category']), row.get('category_name') or row['category'])
+    if shop is None:
+        raise PriceListError('В прайс-листе CSV нет товаров')
+    stream.seek(0)
+    return PriceList(shop, [{'id': category_id, 'name': name} for category_id, name in categories.items()],
+                     (csv_item(row) for row in csv_rows(stream)))
+
+
+def csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        dialect = csv.Sniffer().sniff(text.readline(), delimiters=',;')
+        text.seek(0)
+        yield from csv.DictReader(text, dialect=dialect)
+    finally:
+        text.detach()
+
+
+def csv_item(row):
+    item = {field: int(row[field]) if field in CSV_NUMBER_FIELDS else row[field]
+            for field in CSV_FIELDS[3:] + ('category',)}
+    item['parameters'] = {name: value for name, value in row.items() if name not in CSV_FIELDS and value}
+    return item
+
+
+def load_price_list(stream):
+    """
+    загружаем прайс-лист YAML целиком
+    """
+    return price_list_document(yaml.load(stream, Loader=SafeLoader))
+
+
+def stream_price_list(stream):
+    """
+    разбираем прайс-лист YAML по событиям: shop и categories читаются сразу,
+    goods отдаются генератором по одному товару, документ целиком в память не попадает
+    """
+    reader = YamlEventReader(stream)
+    header = {}
+    for key in reader.mapping_keys():
+        if key == 'goods':
+            break
+        header[key] = reader.value()
+    else:
+        raise PriceListError('В прайс-листе отсутствует раздел goods')
+    if 'shop' not in header or 'categories' not in header:
+        raise PriceListError('Разделы shop и categories должны предшествовать goods')
+    return PriceList(header['shop'], header['categories'], reader.sequence_items())
+
+
+class YamlEventReader:
+    """
+    Построение значений YAML из потока событий парсера
+    """
+
+    def __init__(self, stream):
+        self.loader = SafeLoader(stream)
+        self.expect(yaml.StreamStartEvent)
+        self.expect(yaml.DocumentStartEvent)
+
+    def expect(self, event_class):
+        event = self.loader.get_event()
+        if not isinstance(event, event_class):
+            raise PriceListError(f'Неожиданная структура прайс-листа: {event}')
+        return event
+
+    def mapping_keys(self):
+        self.expect(yaml.MappingStartEvent)
+        while not self.loader.check_event(yaml.MappingEndEvent):
+            yield self.value()
+
+    def sequence_items(self):
+        self.expect(yaml.SequenceStartEvent)
+        while not self.loader.check_event(yaml.SequenceEndEvent):
+            yield self.value()
+        self.loader.get_event()
+
+    def value(self):
+        event = self.loader.get_event()
+        if isinstance(event, yaml.ScalarEvent):
+            return self.scalar(event)
+        if isinstance(event, yaml.SequenceStartEvent):
+            items = []
+            while not self.loader.check_event(yaml.SequenceEndEvent):
+                items.append(self.value())
+            self.loader.get_event()
+            return items
+        if isinstance(event, yaml.MappingStartEvent):
+            mapping = {}
+            while not self.loader.check_event(yaml.MappingEndEvent):
+                key = self.value()
+                mapping[key] = self.value()
+            self.loader.get_event()
+            return mapping
+        raise PriceListError(f'Неподдерживаемый элемент прайс-листа: {event}')
+
+    def scalar(self, event):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = self.loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style)
+        constructors = self.loader.yaml_constructors
+        return constructors.get(tag, constructors[None])(self.loader, node)
+
+
+# (загрузка целиком, потоковый разбор); у JSON потокового режима нет
+PARSERS = {
+    'yaml': (load_price_list, stream_price_list),
+    'json': (load_json, load_json),
+    'jsonl': (stream_jsonl, stream_jsonl),
+    'csv': (stream_csv, stream_csv),
+}
@@ -0,0 +1,20 @@
+from django.db.models import Prefetch
+
+from backend.models import OrderItem, ProductInfo, ProductParameter
+
+
+def product_parameters_prefetch(lookup='product_parameters'):
+    return Prefetch(lookup, queryset=ProductParameter.objects.select_related('parameter'))
+
+
+def product_info_queryset():
+    """
+    товары со всеми данными для ProductInfoSerializer за фиксированное число запросов
+    """
+    return ProductInfo.objects.select_related('product__category').prefetch_related(product_parameters_prefetch())
+
+
+def ordered_items_prefetch(lookup='ordered_items'):
+    return Prefetch(lookup, queryset=OrderItem.objects.select_related(
+        'product_info__product__category').prefetch_related(
+        product_parameters_prefetch('product_info__product_parameters')))
@@ -0,0 +1,112 @@
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from backend.models import Category, Product, ProductInfo, ProductSearch
+
+SEARCH_CONFIG = 'russian'
+# веса полей name, model, category для bm25 в FTS5
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def refresh_documents(**lookup):
+    """
+    пересобираем поисковые документы товаров ProductInfo.objects.filter(**lookup)
+    одним запросом, строки без изменений не перезаписываются
+    """
+    ids, params = ProductInfo.objects.filter(**lookup).order_by().values('id').query.sql_with_params()
+    search = ProductSearch._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {search} (product_info_id, name, model, category) '
+            f'SELECT pi.id, p.name, pi.model, c.name FROM {ProductInfo._meta.db_table} pi '
+            f'JOIN {Product._meta.db_table} p ON p.id = pi.product_id '
+            f'JOIN {Category._meta.db_table} c ON c.id = p.category_id '
+            f'WHERE pi.id IN ({ids}) '
+            f'ON CONFLICT (product_info_id) DO UPDATE SET '
+            f'name = excluded.name, model = excluded.model, category = excluded.category '
+            f'WHERE {search}.name <> excluded.name OR {search}.model <> excluded.model '
+            f'OR {search}.category <> excluded.category', params)
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text.lower())
+
+
+@lru_cache
+def has_trigram():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def search_postgresql(queryset, text, terms):
+    """
+    tsvector с префиксным поиском по словам, номера моделей дополнительно по триграммам
+    """
+    search = ProductSearch._meta.db_table
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    match = f"vector @@ to_tsquery('{SEARCH_CONFIG}', %s)"
+    rank = f"ts_rank(vector, to_tsquery('{SEARCH_CONFIG}', %s))"
+    match_params, rank_params = [tsquery], [tsquery]
+    if has_trigram():
+        match += ' OR %s <%% model'
+        rank += ' + word_similarity(%s, model)'
+        match_params.append(text)
+        rank_params.append(text)
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT product_info_id FROM {search} WHERE {match}', match_params)
+    ).annotate(search_rank=RawSQL(
+        f'SELECT {rank} FROM {search} WHERE product_info_id = {ProductInfo._meta.db_table}.id', rank_params))
+
+
+def search_sqlite(queryset, text, terms):
+    """
+    FTS5 с префиксным поиском по словам, релевантность - bm25
+    """
+    fts = f'{ProductSearch._meta.db_table}_fts'
+    query = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', (query,))
+    ).annotate(search_rank=RawSQL(
+        f'SELECT -bm25({fts}, {weights}) FROM {fts} '
+        f'WHERE {fts} MATCH %s AND rowid = {ProductInfo._meta.db_table}.id', (query,)))
+
+
+def search_fallback(queryset, text, terms):
+    condition = Q()
+    for term in terms:
+        condition &= Q(search__name__icontains=term) | Q(search__model__icontains=term) | Q(
+            search__category__icontains=term)
+    return queryset.filter(condition)
+
+
+SEARCH_BACKENDS = {
+    'postgresql': search_postgresql,
+    'sqlite': search_sqlite,
+}
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Полнотекстовый поиск товаров по поисковым документам ProductSearch
+    с сортировкой по релевантности
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        search = SEARCH_BACKENDS.get(connection.vendor, search_fallback)
+        queryset = search(queryset, text, terms)
+        if 'search_rank' in queryset.query.annotations:
+            return queryset.order_by('-search_rank', 'id')
+        return queryset
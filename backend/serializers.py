@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
 
-from backend.models import Category, Shop, Product, ProductParameter, ProductInfo, Contact, Order, OrderItem
+from backend.models import Category, Shop, Product, ProductParameter, ProductInfo, Contact, Order, OrderItem, \
+    ImportJob, ShopOrder
+from backend.orders import checkout
 
 
 # сериализатор категорий
@@ -69,14 +71,27 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'product_info', 'quantity', 'order',)
         read_only_fields = ('id', 'order')
 
-    def create(self, validated_data):
-        order = OrderItem(
-            quantity=validated_data['quantity'],
-            order=self.context['order'],
-            product_info=validated_data['product_info']
-        )
-        order.save()
-        return order
+
+# сериализатор позиции пакетного изменения корзины: quantity=0 удаляет позицию
+class BasketLineSerializer(serializers.Serializer):
+    product_info = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+
+# сериализатор пакетного изменения корзины
+class BasketBulkSerializer(serializers.Serializer):
+    items = BasketLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        lines = {item['product_info']: item['quantity'] for item in items}
+        shops = dict(ProductInfo.objects.filter(id__in=lines).values_list('id', 'shop__state'))
+        errors = [f'Данные по товару отсутствуют id={product_info}'
+                  for product_info in lines if product_info not in shops]
+        errors += [f'Данный товар недоступен для заказа id={product_info}'
+                   for product_info, state in shops.items() if not state and lines[product_info]]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return lines
 
 
 # сериализатор просмотра списка заказов
@@ -86,7 +101,7 @@ class OrdersListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
+        fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'items_count', 'contact',)
         read_only_fields = ('id',)
 
 
@@ -100,12 +115,17 @@ class OrderSerializer(OrdersListSerializer):
     ordered_items = OrderItemSerializer(read_only=True, many=True)
 
 
-# сериализатор просмотра списка заказов продавцом
-class OrderSerializerShop(OrderSerializer):
+# сериализатор просмотра заказов продавцом: только позиции его магазина
+class ShopOrderSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='order_id', read_only=True)
+    ordered_items = OrderItemSerializer(source='items', read_only=True, many=True)
+    dt = serializers.DateTimeField(source='order.dt', read_only=True)
+    contact = ContactSerializer(source='order.contact', read_only=True)
+
     class Meta:
-        model = Order
-        fields = ('id', 'ordered_items', 'state', 'dt', 'contact',)
-        read_only_fields = ('id',)
+        model = ShopOrder
+        fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'items_count', 'contact',)
+        read_only_fields = ('state',)
 
 
 # сериализатор подтверждения заказа
@@ -116,14 +136,14 @@ class OrderNewSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
     def update(self, instance, validated_data):
-        instance.state = 'new'
-        instance.save()
-        return instance
+        # остатки проверяются и списываются атомарно при оформлении, см. backend.orders.checkout
+        return checkout(instance)
 
-    def validate(self, data):
-        items = list(self.instance.ordered_items.all())
-        for item in items:
-            if item.product_info.quantity < item.quantity:
-                raise serializers.ValidationError(f"Недостаточное количество товара id={item.product_info.id}")
-        return data
 
+# сериализатор состояния импорта прайса
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'filename', 'mode', 'status', 'stage', 'counts', 'timings', 'error', 'created_at',
+                  'updated_at',)
+        read_only_fields = fields
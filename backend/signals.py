@@ -1,9 +1,64 @@
 from allauth.socialaccount.signals import pre_social_login
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
+from backend.models import Category, Product, ProductInfo, ProductParameter, Order, OrderItem
+from backend.orders import recalculate_totals
+from backend.search import refresh_documents
+
 
 @receiver(pre_social_login)
 def pre_social_login(**kwargs):
     kwargs['sociallogin'].user.is_active = True
     return kwargs
 
+
+@receiver(pre_save, sender=ProductInfo)
+def reset_product_info_fingerprint(instance, **kwargs):
+    """
+    ручное изменение товара делает отпечаток импорта недействительным
+    """
+    instance.fingerprint = ''
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def refresh_product_parameter_facets(instance, origin=None, **kwargs):
+    """
+    ручное изменение параметров пересобирает фасеты товара и сбрасывает отпечаток импорта;
+    при удалении самого товара каскадом ничего не делаем, импорт удаляет параметры без сигналов
+    """
+    if origin is not None and getattr(origin, 'model', type(origin)) is not ProductParameter:
+        return
+    facets = dict(ProductParameter.objects.filter(product_info_id=instance.product_info_id).values_list(
+        'parameter__name', 'value'))
+    ProductInfo.objects.filter(id=instance.product_info_id).update(fingerprint='', facets=facets)
+
+
+@receiver(post_save, sender=ProductInfo)
+def refresh_product_info_search(instance, **kwargs):
+    """
+    импорт пишет товары массово и обновляет поисковые документы сам, здесь - ручные изменения
+    """
+    refresh_documents(id=instance.id)
+
+
+@receiver(post_save, sender=ProductInfo)
+def recalculate_product_info_baskets(instance, created, **kwargs):
+    """
+    корзины считаются по текущей цене товара
+    """
+    if not created:
+        recalculate_totals(Order.objects.filter(state='basket', id__in=OrderItem.objects.filter(
+            product_info_id=instance.id).values('order_id')))
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search(instance, created, **kwargs):
+    if not created:
+        refresh_documents(product_id=instance.id)
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_search(instance, created, **kwargs):
+    if not created:
+        refresh_documents(product__category_id=instance.id)
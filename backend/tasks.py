@@ -1,71 +1,255 @@
-from celery import shared_task
+import itertools
+import math
+import os
+
+from celery import chord, shared_task
 
-import yaml
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Q
 from django.db.utils import IntegrityError
 
-from backend.models import User, Shop, Category, ProductInfo, Product, ProductParameter, Parameter
-from yaml.loader import SafeLoader
-from pathlib import Path
+from backend.baskets import flush_idle
+from backend.cache import bump_catalog_version, warm_catalog_cache
+from backend.feeds import check_shop_feed
+from backend.importer import IMPORTERS, ImportLockLost, ImportProgress, ShardedPriceListImporter, clear_staged_rows
+from backend.locks import acquire_import_lock, extend_import_lock, import_lock_heartbeat, release_import_lock
+from backend.mailer import enqueue_mail, send_mail_queue
+from backend.models import Shop, ImportJob
+from backend.orders import recalculate_baskets
+from backend.outbox import publish_event, relay_events
+from backend.parsers import PARSE_ERRORS, read_price_list
+from backend.search import refresh_documents
+from backend.uploads import is_upload, price_list_path, remove_upload
 
 
 @shared_task
-def sand_mail(user_id, msg_txt, topic_msg):
-    sand_mail_import(user_id, msg_txt, topic_msg)
+def sand_mail(user_id, msg_txt, topic_msg, event_id=None):
+    """
+    письмо только ставится в очередь, отправляет его send_queued_mail;
+    event_id передает relay_outbox, повторно опубликованное событие письмо не дублирует
+    """
+    enqueue_mail(user_id, msg_txt, topic_msg, event_id)
 
 
 def sand_mail_import(user_id, msg_txt, topic_msg):
     """
-    отправяем письмо при выполнении импорта
+    письмо о результате импорта публикуется через outbox вместе со статусом задания
     """
-    user = User.objects.get(id=user_id)
-    msg = EmailMultiAlternatives(
-        # title:
-        topic_msg,
-        # message:
-        msg_txt,
-        # from:
-        settings.EMAIL_HOST_USER,
-        # to:
-        [user.email]
-    )
-    msg.send()
+    publish_event('backend.tasks.sand_mail', user_id=user_id, msg_txt=msg_txt, topic_msg=topic_msg)
 
 
-@shared_task
-def do_import(filename, user_id):
-    topic_msg = 'результат импорта данных'
-    file_path = Path(__file__).parent.absolute()
-    try:
-        with open(str(file_path) + filename, encoding='UTF-8') as yml:
-            data = yaml.load(yml, Loader=SafeLoader)
-    except FileNotFoundError as e:
-        sand_mail_import(user_id, f'При импорте файла {filename} возникла ошибка {str(e)}', topic_msg)
+def enqueue_import(user_id, filename, mode='replace', content_hash=''):
+    """
+    ставим импорт в очередь, ожидающее задание магазина заменяется новым
+    """
+    ImportJob.objects.filter(user_id=user_id, status='queued').update(status='superseded')
+    job = ImportJob.objects.create(user_id=user_id, filename=filename, mode=mode, content_hash=content_hash)
+    do_import.delay(filename, user_id, mode=mode, job_id=job.id)
+    return job
+
+
+@shared_task(bind=True)
+def do_import(self, filename, user_id, streaming=None, mode='replace', job_id=None):
+    """
+    импорт прайс-листа; большие файлы (от IMPORT_STREAMING_SIZE байт) или streaming=True
+    разбираются потоково, товары передаются в базу пачками;
+    mode='delta' записывает только изменившиеся строки,
+    mode='parallel' распределяет запись шардов по воркерам Celery.
+    Поддерживаются YAML, JSON, JSON Lines и CSV.
+    Ход импорта записывается в ImportJob. Для магазина выполняется не более одного импорта:
+    задание ждет освобождения блокировки в очереди и пропускается, если его заменил более новый запрос.
+    Загруженный через API файл удаляется после завершения импорта
+    """
+    if job_id:
+        job = ImportJob.objects.get(id=job_id)
     else:
-        try:
-            shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
-        except IntegrityError as e:
-            sand_mail_import(user_id, f'При импорте файла {filename} возникла ошибка {str(e)}', topic_msg)
+        job = ImportJob.objects.create(user_id=user_id, filename=filename, mode=mode)
+    if job.status != 'queued':
+        remove_upload(filename)
+        return
+    if not acquire_import_lock(user_id, job.id):
+        if self.request.retries >= settings.IMPORT_LOCK_MAX_RETRIES:
+            fail_import(ImportProgress(job), user_id, filename, 'не дождались завершения предыдущего импорта магазина')
+            remove_upload(filename)
             return
-        for category in data['categories']:
-            category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-            category_object.shops.add(shop.id)
-            category_object.save()
-        ProductInfo.objects.filter(shop_id=shop.id).delete()
-        for item in data['goods']:
-            product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-            product_info = ProductInfo.objects.create(product_id=product.id,
-                                                      model=item['model'],
-                                                      price=item['price'],
-                                                      price_rrc=item['price_rrc'],
-                                                      quantity=item['quantity'],
-                                                      shop_id=shop.id)
-            for name, value in item['parameters'].items():
-                parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                ProductParameter.objects.create(product_info_id=product_info.id,
-                                                parameter_id=parameter_object.id,
-                                                value=value)
-
-        sand_mail_import(user_id, f'Файл с данными {filename} успешно импортирован.', topic_msg)
+        raise self.retry(countdown=settings.IMPORT_LOCK_RETRY_DELAY, max_retries=settings.IMPORT_LOCK_MAX_RETRIES)
+    if not ImportJob.objects.filter(id=job.id, status='queued').update(status='running'):
+        release_import_lock(user_id, job.id)
+        remove_upload(filename)
+        return
+    handed_over = False
+    try:
+        with import_lock_heartbeat(user_id, job.id) as lock_lost:
+            handed_over = run_import(job, filename, user_id, streaming, mode, lock_lost)
+    finally:
+        if not handed_over:
+            release_import_lock(user_id, job.id)
+            remove_upload(filename)
+
+
+def run_import(job, filename, user_id, streaming, mode, lock_lost=None):
+    """
+    возвращаем True, если завершение импорта передано аккорду параллельной записи
+    """
+    progress = ImportProgress(job, lock_lost)
+    progress.save(force=True, status='running')
+    try:
+        price_file = open(price_list_path(filename), 'rb')
+    except FileNotFoundError as e:
+        fail_import(progress, user_id, filename, e)
+        return False
+    try:
+        with price_file:
+            with progress.stage('parsed'):
+                if streaming is None:
+                    streaming = os.fstat(price_file.fileno()).st_size >= settings.IMPORT_STREAMING_SIZE
+                price_list = read_price_list(price_file, filename, streaming)
+            try:
+                shop, _ = Shop.objects.get_or_create(name=price_list.shop, user_id=user_id)
+            except IntegrityError as e:
+                fail_import(progress, user_id, filename, e)
+                return False
+            if shop.filename != filename and not is_upload(filename):
+                Shop.objects.filter(id=shop.id).update(filename=filename)
+            progress.save(force=True, shop=shop)
+            importer = IMPORTERS[mode](shop, progress=progress)
+            if mode == 'parallel':
+                shards = importer.prepare(price_list.categories, price_list.goods, job.id)
+                import_shards(shards, shop.id, user_id, filename, job.id)
+                return True
+            importer.run(price_list.categories, price_list.goods)
+    except PARSE_ERRORS + (ImportLockLost,) as e:
+        fail_import(progress, user_id, filename, e)
+        return False
+    except Exception as e:
+        progress.save(force=True, status='failed', error=str(e))
+        raise
+
+    complete_import(progress, importer, user_id, filename)
+    return False
+
+
+def complete_import(progress, importer, user_id, filename):
+    with progress.stage('search'):
+        refresh_documents(shop_id=importer.shop.id)
+    recalculate_baskets(importer.shop.id, importer.orders)
+    bump_catalog_version(importer.shop.id)
+    warm_cache.delay(importer.shop.id)
+    with transaction.atomic():
+        with progress.stage('done'):
+            sand_mail_import(user_id, f'Файл с данными {filename} успешно импортирован. {importer.summary()}',
+                             'результат импорта данных')
+        progress.save(force=True, status='done', counts=importer.stats)
+
+
+def fail_import(progress, user_id, filename, error):
+    with transaction.atomic():
+        progress.save(force=True, status='failed', error=str(error))
+        sand_mail_import(user_id, f'При импорте файла {filename} возникла ошибка {str(error)}',
+                         'результат импорта данных')
+
+
+def import_shards(shards, shop_id, user_id, filename, job_id):
+    """
+    запускаем запись шардов аккордом Celery: не более IMPORT_CONCURRENCY задач,
+    каждая пишет свою часть шардов последовательно, затем finish_import;
+    задачи получают только номера шардов, строки читаются из ImportRow
+    """
+    if not shards:
+        finish_import.delay([], shop_id, user_id, filename, job_id)
+        return
+    shards_per_task = math.ceil(shards / settings.IMPORT_CONCURRENCY)
+    header = import_shard.chunks(((shop_id, job_id, shard) for shard in range(shards)), shards_per_task).group()
+    chord(header)(finish_import.s(shop_id, user_id, filename, job_id).on_error(import_failed.s(job_id)))
+
+
+@shared_task
+def import_shard(shop_id, job_id, shard):
+    shop = Shop.objects.get(id=shop_id)
+    extend_import_lock(shop.user_id, job_id)
+    importer = ShardedPriceListImporter(shop)
+    importer.load_shard(job_id, shard)
+    return {'stats': importer.stats}
+
+
+@shared_task
+def finish_import(results, shop_id, user_id, filename, job_id):
+    """
+    сводим результаты шардов, удаляем пропавшие из прайс-листа строки и отправляем уведомление
+    """
+    progress = ImportProgress(ImportJob.objects.get(id=job_id))
+    importer = ShardedPriceListImporter(Shop.objects.get(id=shop_id), progress=progress)
+    for result in itertools.chain.from_iterable(results):
+        for key in ('goods', 'added', 'changed', 'unchanged'):
+            importer.stats[key] += result['stats'][key]
+    try:
+        importer.reconcile_staged(job_id)
+        complete_import(progress, importer, user_id, filename)
+    finally:
+        release_import_lock(user_id, job_id)
+        remove_upload(filename)
+
+
+@shared_task
+def import_failed(request, exc, traceback, job_id):
+    job = ImportJob.objects.get(id=job_id)
+    ImportJob.objects.filter(id=job_id).update(status='failed', error=str(exc))
+    clear_staged_rows(job_id)
+    release_import_lock(job.user_id, job_id)
+    remove_upload(job.filename)
+
+
+@shared_task
+def reimport_shops():
+    """
+    периодическая проверка прайс-листов активных магазинов (CELERY_BEAT_SCHEDULE)
+    """
+    shops = Shop.objects.filter(Q(url__gt='') | ~Q(filename=''), state=True, user__isnull=False)
+    for shop_id in shops.values_list('id', flat=True):
+        refresh_shop_feed.delay(shop_id)
+
+
+@shared_task
+def refresh_shop_feed(shop_id):
+    """
+    импортируем прайс-лист магазина, только если он изменился с прошлой проверки
+    """
+    shop = Shop.objects.get(id=shop_id)
+    changed = check_shop_feed(shop)
+    if changed is None:
+        return None
+    filename, content_hash = changed
+    return enqueue_import(shop.user_id, filename, mode=settings.IMPORT_FEED_MODE, content_hash=content_hash).id
+
+
+@shared_task
+def warm_cache(shop_id):
+    """
+    заполняем кеш популярных страниц каталога после импорта
+    """
+    warm_catalog_cache(shop_id)
+
+
+@shared_task
+def flush_idle_baskets():
+    """
+    перенос простаивающих корзин Redis в БД (BASKET_BACKEND='redis')
+    """
+    return flush_idle()
+
+
+@shared_task
+def send_queued_mail():
+    """
+    отправка очереди писем (CELERY_BEAT_SCHEDULE)
+    """
+    return send_mail_queue()
+
+
+@shared_task
+def relay_outbox():
+    """
+    публикация событий outbox (CELERY_BEAT_SCHEDULE, постоянно - manage.py relay_outbox)
+    """
+    return relay_events()
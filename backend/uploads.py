@@ -0,0 +1,72 @@
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from backend.models import ImportJob, Shop
+from backend.parsers import EXTENSIONS
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Загрузка прайс-листа потоком во временный файл на диске
+    с подсчетом sha256 по мере поступления данных
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.content_hash = self.hash.hexdigest()
+        return upload
+
+
+def store_upload(upload):
+    """
+    переносим загруженный файл в IMPORT_UPLOAD_DIR под именем по хешу содержимого
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    filename = upload.content_hash + (extension if extension in EXTENSIONS else '')
+    os.makedirs(settings.IMPORT_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_UPLOAD_DIR, filename)
+    file_move_safe(upload.temporary_file_path(), path, allow_overwrite=True)
+    upload.close()
+    return path
+
+
+def remove_upload(path):
+    """
+    удаляем загруженный прайс-лист после импорта; файл остается, если его ждет другое задание
+    или он указан как прайс-лист магазина
+    """
+    if not is_upload(path) or ImportJob.objects.filter(filename=path, status__in=('queued', 'running')).exists():
+        return
+    if Shop.objects.filter(filename=path).exists():
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_upload(path):
+    upload_dir = os.path.realpath(settings.IMPORT_UPLOAD_DIR)
+    return os.path.commonpath([os.path.realpath(path), upload_dir]) == upload_dir
+
+
+def price_list_path(filename):
+    """
+    загруженные через API прайс-листы лежат в IMPORT_UPLOAD_DIR, остальные - относительно пакета backend
+    """
+    if os.path.isabs(filename) and is_upload(filename):
+        return filename
+    return str(Path(__file__).parent.absolute()) + filename
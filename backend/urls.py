@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework import routers
 
 from backend.views import CategoryView, PartnerUpdate, ShopView, ProductInfoView, ContactView, PartnerState, BasketView, \
-    OrderView
+    OrderView, PartnerUpdateStatus, PartnerUpload
 
 
 router = routers.DefaultRouter()
@@ -17,6 +17,8 @@ urlpatterns = [
     path('shops/', ShopView.as_view(), name='shops'),
     path('', include(router.urls)),
     path('partner/update/', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<int:job_id>/', PartnerUpdateStatus.as_view(), name='partner-update-status'),
+    path('partner/upload/', PartnerUpload.as_view(), name='partner-upload'),
     path('partner/state/', PartnerState.as_view({'get': 'retrieve', 'patch': 'update'}), name='partner-state'),
 
 ]
\ No newline at end of file
@@ -1,40 +1,71 @@
-import requests
-from django.db.models import Q, Sum, F
+from django.contrib.auth.tokens import default_token_generator
+from django.db import transaction
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from djoser import signals
+from djoser.compat import get_user_email
+from djoser.conf import settings as djoser_settings
+from djoser.views import UserViewSet
 from rest_framework import permissions, viewsets, status, mixins
-from rest_framework.generics import ListAPIView, get_object_or_404
+from rest_framework.generics import ListAPIView, RetrieveAPIView, get_object_or_404
 from rest_framework.viewsets import GenericViewSet
 from django.http import Http404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import filters
 from rest_framework.decorators import action
-
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser, FileUploadParser
+from rest_framework.renderers import JSONRenderer
+
+from backend.baskets import basket_store
+from backend.cache import CatalogCacheMixin, bump_catalog_version, catalog_last_modified, catalog_version
+from backend.conditional import conditional_response, set_validators
+from backend.facets import facet_counts, price_histogram
 from backend.filters import ProductFilterPrice
-from backend.models import Category, Shop, ProductInfo, Contact, Order, OrderItem
+from backend.importer import IMPORTERS, current_progress
+from backend.models import Category, Shop, ProductInfo, Contact, Order, ImportJob, ShopOrder
+from backend.orders import AlreadyPlaced, OutOfStock, deleting_goods
+from backend.outbox import publish_event
+from backend.pagination import KeysetPagination
 from backend.permissions import IsOwnerOrReadOnly, IsBuyer
+from backend.querysets import ordered_items_prefetch, product_info_queryset
+from backend.search import ProductSearchFilter
 from backend.serializers import ShopSerializer, CategorySerializer, ProductInfoSerializer, ContactSerializer, \
     OrderItemSerializer, OrdersListSerializer, OrderNewSerializer, OrderSerializer, OrderItemCreateSerializer, \
-    OrderSerializerShop
-from backend.tasks import do_import, sand_mail
+    ShopOrderSerializer, ImportJobSerializer, BasketBulkSerializer
+from backend.tasks import enqueue_import
+from backend.uploads import HashingFileUploadHandler, store_upload
 
 
 class UserActivationView(APIView):
-    def get(self, request, uid, token):
-        protocol = 'https://' if request.is_secure() else 'http://'
-        web_url = protocol + request.get_host()
-        post_url = web_url + "/api/v1/auth/users/activation/"
-        post_data = {'uid': uid, 'token': token}
-        result = requests.post(post_url, data=post_data)
-        content = result.text
-        return Response(content)
-
+    """
+    Активация по ссылке из письма: uid и token проверяются, и пользователь активируется в этом же запросе
+    логикой djoser (UserViewSet.activation), без запроса к собственному API.
+    Ответ прежний: текст ответа /auth/users/activation/ (пустой при успехе)
+    """
+    token_generator = default_token_generator
 
-class CategoryView(ListAPIView):
+    def get(self, request, uid, token):
+        serializer = djoser_settings.SERIALIZERS.activation(data={'uid': uid, 'token': token},
+                                                           context={'request': request, 'view': self})
+        try:
+            if not serializer.is_valid():
+                return Response(JSONRenderer().render(serializer.errors).decode())
+        except APIException as error:
+            return Response(JSONRenderer().render({'detail': error.detail}).decode())
+        user = serializer.user
+        user.is_active = True
+        user.save()
+        signals.user_activated.send(sender=UserViewSet, user=user, request=request)
+        if djoser_settings.SEND_CONFIRMATION_EMAIL:
+            djoser_settings.EMAIL.confirmation(request, {'user': user}).send([get_user_email(user)])
+        return Response('')
+
+
+class CategoryView(CatalogCacheMixin, ListAPIView):
     """
     Класс для просмотра категорий
     """
@@ -43,7 +74,7 @@ class CategoryView(ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class ShopView(ListAPIView):
+class ShopView(CatalogCacheMixin, ListAPIView):
     """
     Класс для просмотра списка магазинов
     """
@@ -60,7 +91,9 @@ class PartnerUpdate(APIView):
     @swagger_auto_schema(request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         properties={
-            'filename': openapi.Schema(type=openapi.TYPE_STRING, description='string')
+            'filename': openapi.Schema(type=openapi.TYPE_STRING, description='string'),
+            'mode': openapi.Schema(type=openapi.TYPE_STRING, enum=list(IMPORTERS), default='replace',
+                                   description='режим импорта: полная замена или только изменения')
         }
     ))
     def post(self, request, *args, **kwargs):
@@ -71,22 +104,105 @@ class PartnerUpdate(APIView):
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
         filename = request.data.get('filename')
+        mode = request.data.get('mode', 'replace')
+        if mode not in IMPORTERS:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный режим импорта {mode}'})
         if filename:
-            do_import.delay(filename, request.user.id)
-            return JsonResponse({'Status': True})
+            job = enqueue_import(request.user.id, filename, mode)
+            return JsonResponse({'Status': True, 'job_id': job.id})
         else:
             return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class ProductInfoView(viewsets.ModelViewSet):
+class PartnerUpload(APIView):
+    """
+    Класс для загрузки файла прайса от поставщика.
+    Файл пишется на диск потоком и удаляется после импорта,
+    повторная загрузка уже импортированного содержимого не запускает импорт
+    """
+    parser_classes = (MultiPartParser, FileUploadParser)
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [HashingFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+        openapi.Parameter('mode', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=list(IMPORTERS)),
+    ])
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        upload = request.data.get('file')
+        mode = request.data.get('mode', 'replace')
+        if mode not in IMPORTERS:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный режим импорта {mode}'})
+        if not upload:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        # пропускаем, только если содержимое уже успешно импортировано и после этого импортов не запускалось
+        last_job = ImportJob.objects.filter(user_id=request.user.id, status__in=('queued', 'running', 'done')).first()
+        if last_job and last_job.status == 'done' and last_job.content_hash == upload.content_hash:
+            upload.close()
+            return JsonResponse({'Status': True, 'Skipped': True, 'job_id': last_job.id})
+        job = enqueue_import(request.user.id, store_upload(upload), mode, upload.content_hash)
+        return JsonResponse({'Status': True, 'job_id': job.id})
+
+
+class PartnerUpdateStatus(RetrieveAPIView):
+    """
+    Класс для просмотра хода импорта прайса
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_url_kwarg = 'job_id'
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user_id=self.request.user.id)
+
+    def get_object(self):
+        return current_progress(super().get_object())
+
+
+@method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=[
+    openapi.Parameter('param[Название]', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description='отбор по значению параметра товара'),
+    openapi.Parameter('facets', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                      description='добавить в ответ количество по значениям параметров и гистограмму цен'),
+]))
+class ProductInfoView(CatalogCacheMixin, viewsets.ModelViewSet):
     """
     Класс для просмотра информации о товаре
     """
     serializer_class = ProductInfoSerializer
-    queryset = ProductInfo.objects.all()
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
+    queryset = product_info_queryset()
+    filter_backends = (DjangoFilterBackend, ProductSearchFilter,)
     filterset_class = ProductFilterPrice
-    search_fields = ['model', 'product__name', 'product__category__name']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('shop_id', 'id')
+
+    def get_catalog_shop(self, request):
+        shop = request.query_params.get('shop', '')
+        return int(shop) if shop.isdigit() else None
+
+    def get_paginated_response(self, data):
+        """
+        фасеты и гистограмма цен входят в тело страницы: ответ с ними кешируется и проверяется по ETag целиком
+        """
+        response = super().get_paginated_response(data)
+        if self.request.query_params.get('facets', '').lower() in ('1', 'true'):
+            queryset = self.filter_queryset(self.get_queryset())
+            response.data['facets'] = facet_counts(queryset)
+            response.data['price_histogram'] = price_histogram(queryset)
+        return response
+
+    def perform_destroy(self, instance):
+        with deleting_goods(ProductInfo.objects.filter(id=instance.id)):
+            super().perform_destroy(instance)
 
 
 class ContactView(viewsets.ModelViewSet):
@@ -125,15 +241,30 @@ class PartnerState(mixins.RetrieveModelMixin,
             raise Http404
         return obj
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_catalog_version(serializer.instance.id)
+
 
 @method_decorator(name='update_new', decorator=swagger_auto_schema(
     operation_description="Подтверждение заказа с указанием контакта",
 ))
 @method_decorator(name='create', decorator=swagger_auto_schema(
-    operation_description="Добавление или редактирование товара в корзине",
+    operation_description="Добавление или редактирование товара в корзине. "
+                          "При BASKET_BACKEND='db' id в ответе - id позиции заказа-корзины, order - id корзины; "
+                          "при BASKET_BACKEND='redis' id - id товара, order - null, пока корзина не записана в БД",
+))
+@method_decorator(name='list', decorator=swagger_auto_schema(
+    operation_description="Корзина пользователя. При BASKET_BACKEND='redis' id позиций - id товаров, "
+                          "id корзины - null, пока она не записана в БД при оформлении или сбросе",
 ))
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(
-    operation_description="Промотр данных по товару в корзине",
+    operation_description="Промотр данных по товару в корзине: позиция адресуется id из ответов корзины "
+                          "или id товара при любом BASKET_BACKEND",
+))
+@method_decorator(name='destroy', decorator=swagger_auto_schema(
+    operation_description="Удаление товара из корзины: позиция адресуется id из ответов корзины "
+                          "или id товара при любом BASKET_BACKEND",
 ))
 class BasketView(mixins.CreateModelMixin,
                  mixins.RetrieveModelMixin,
@@ -145,50 +276,94 @@ class BasketView(mixins.CreateModelMixin,
     """
     permission_classes = [permissions.IsAuthenticated, IsBuyer]
 
+    @property
+    def basket(self):
+        return basket_store(self.request.user.id)
+
     def create(self, request, *args, **kwargs):
-        basket, _ = Order.objects.get_or_create(user_id=self.request.user.id, state='basket')
         product_info = self.request.data.get('product_info')
         if not ProductInfo.objects.filter(id=product_info).first():
             return JsonResponse({'Status': 'Данные по товару отсутствуют'})
         if not ProductInfo.objects.get(id=product_info).shop.state:
             return JsonResponse({'Status': 'Данный товар недоступен для заказа'})
-        instance = OrderItem.objects.filter(product_info=product_info, order_id=basket.id).first()
-        serializer = self.get_serializer(data=request.data, context={'order': basket}, instance=instance)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        basket = self.basket
+        basket.set_lines({serializer.validated_data['product_info'].id: serializer.validated_data['quantity']})
+        data = self.get_serializer(basket.line(serializer.validated_data['product_info'].id)).data
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @swagger_auto_schema(request_body=BasketBulkSerializer, responses={200: OrderSerializer})
+    @action(methods=['post'], detail=False)
+    def bulk(self, request, *args, **kwargs):
+        """
+        добавление, изменение и удаление (quantity=0) многих позиций корзины одним запросом
+        """
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        basket = self.basket
+        basket.set_lines(serializer.validated_data['items'])
+        return Response(OrderSerializer(basket.current()).data)
+
+    @swagger_auto_schema(responses={200: openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+        'lines': openapi.Schema(type=openapi.TYPE_INTEGER, description='позиций'),
+        'units': openapi.Schema(type=openapi.TYPE_INTEGER, description='единиц товара'),
+        'total': openapi.Schema(type=openapi.TYPE_INTEGER, description='сумма'),
+    })})
+    @action(methods=['get'], detail=False)
+    def summary(self, request, *args, **kwargs):
+        """
+        сводка корзины для значка в шапке: из счетчиков, без выборки позиций
+        """
+        return Response(self.basket.summary())
 
     @action(methods=['patch'], detail=False)
     def update_new(self, request, *args, **kwargs):
-        is_updated = Order.objects.filter(user_id=self.request.user.id, state='basket').first()
+        basket = self.basket
+        is_updated = basket.order()
         if is_updated:
             serializer = self.get_serializer(instance=is_updated, data=self.request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
-            sand_mail.delay(
-                request.user.id,
-                f"'Заказ №{is_updated.pk} сформирован'",
-                'Обновление статуса заказа')
+            try:
+                # уведомление записывается в outbox в транзакции оформления
+                with transaction.atomic():
+                    serializer.save()
+                    publish_event(
+                        'backend.tasks.sand_mail',
+                        user_id=request.user.id,
+                        msg_txt=f"'Заказ №{is_updated.pk} сформирован'",
+                        topic_msg='Обновление статуса заказа')
+            except OutOfStock as error:
+                return JsonResponse({'Status': 'Недостаточное количество товара', 'Errors': error.failures},
+                                    status=status.HTTP_409_CONFLICT)
+            except AlreadyPlaced:
+                return JsonResponse({'Status': 'Заказ уже сформирован'}, status=status.HTTP_409_CONFLICT)
+            basket.placed()
             return JsonResponse({'Status': 'Заказ сформирован'})
         return JsonResponse({'Status': 'Неправильные данные по заказу'})
 
     def list(self, request):
-        queryset = Order.objects.filter(user_id=self.request.user.id, state='basket').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        basket = self.basket
+        modified = basket.modified()
+        not_modified, etag, last_modified = conditional_response(
+            request, ('basket', request.user.id, modified, catalog_version(), request.accepted_renderer.format),
+            max(modified or 0, catalog_last_modified() or 0) or None)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(basket.baskets(), many=True)
+        return set_validators(Response(serializer.data), etag, last_modified)
+
+    def destroy(self, request, *args, **kwargs):
+        if not self.kwargs['pk'].isdigit() or not self.basket.remove(int(self.kwargs['pk'])):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def get_object(self):
-        basket = Order.objects.filter(user_id=self.request.user.id, state='basket')
-        if basket and 'pk' in self.kwargs:
-            query = Q() | Q(order_id=basket.first().id, id=self.kwargs['pk'])
-            queryset = OrderItem.objects.filter(query)
-            return get_object_or_404(queryset)
-        elif basket:
-            return get_object_or_404(basket)
-
-        raise Http404
+        item = self.basket.item(int(self.kwargs['pk'])) if self.kwargs['pk'].isdigit() else None
+        if item is None:
+            raise Http404
+        return item
 
     def get_serializer(self, *args, **kwargs):
         if self.action == 'list':
@@ -197,6 +372,8 @@ class BasketView(mixins.CreateModelMixin,
             return OrderItemSerializer(*args, **kwargs)
         elif self.action == 'update_new':
             return OrderNewSerializer(*args, **kwargs)
+        elif self.action == 'bulk':
+            return BasketBulkSerializer(*args, **kwargs)
         return OrderItemCreateSerializer(*args, **kwargs)
 
     def get_queryset(self):
@@ -210,29 +387,58 @@ class OrderView(viewsets.ReadOnlyModelViewSet):
     """
 
     permission_classes = [permissions.IsAuthenticated]
-
-    def list(self, queryset):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        if serializer.data:
-            return Response(serializer.data)
-        return JsonResponse({'Status': 'Нет активных заказов'})
+    pagination_class = KeysetPagination
+    lookup_url_kwarg = 'pk'
+
+    @property
+    def is_shop(self):
+        return getattr(getattr(self.request, 'user', None), 'type', None) == 'shop'
+
+    @property
+    def lookup_field(self):
+        """
+        продавец получает заказы своего магазина, но обращается к ним по номеру заказа
+        """
+        return 'order_id' if self.is_shop else 'pk'
+
+    @property
+    def keyset_ordering(self):
+        return ('order_id',) if self.is_shop else ('id',)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        if not page and self.paginator.cursor_query_param not in request.query_params:
+            return JsonResponse({'Status': 'Нет активных заказов'})
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        updated_at = self.get_queryset().select_related(None).prefetch_related(None).filter(
+            **{self.lookup_field: self.kwargs['pk']}).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404
+        not_modified, etag, last_modified = conditional_response(
+            request, ('order', self.kwargs['pk'], request.user.id, updated_at, catalog_version(),
+                      request.accepted_renderer.format),
+            max(updated_at.timestamp(), catalog_last_modified() or 0))
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
 
     def get_serializer(self, *args, **kwargs):
         if self.action == 'list' and self.request.user.type == 'buyer':
             return OrdersListSerializer(*args, **kwargs)
         elif self.request.user.type == 'shop':
-            return OrderSerializerShop(*args, **kwargs)
+            return ShopOrderSerializer(*args, **kwargs)
         return OrderSerializer(*args, **kwargs)
 
     def get_queryset(self):
+        if self.is_shop:
+            return ShopOrder.objects.filter(shop__user_id=self.request.user.id).select_related(
+                'order__contact').prefetch_related(ordered_items_prefetch('items'))
         queryset = Order.objects.all().exclude(state='basket').select_related('contact')
-        if self.request.user.type == 'buyer':
-            queryset = queryset.filter(
-                user_id=self.request.user.id).annotate(
-                total_sum=Sum(F('ordered_items__quantity')
-                              * F('ordered_items__product_info__price'))).distinct()
+        if self.action == 'list' and self.request.user.type == 'buyer':
+            queryset = queryset.prefetch_related('ordered_items')
         else:
-            queryset = queryset.filter(ordered_items__product_info__shop__user_id=self.request.user.id)
-
-        return queryset
+            queryset = queryset.prefetch_related(ordered_items_prefetch())
+        return queryset.filter(user_id=self.request.user.id)
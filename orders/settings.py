@@ -222,6 +222,42 @@ CELERY_RESULT_BACKEND = 'django-db'
 
 CELERY_CACHE_BACKEND = 'default'
 
+# импорт и почта обрабатываются в отдельных очередях, воркер выбирает их по кругу
+# (celery -A orders worker -Q import,import_shard,mail,celery -O fair)
+CELERY_TASK_ROUTES = {
+    'backend.tasks.do_import': {'queue': 'import'},
+    'backend.tasks.finish_import': {'queue': 'import'},
+    'backend.tasks.import_failed': {'queue': 'import'},
+    'backend.tasks.import_shard': {'queue': 'import_shard'},
+    'backend.tasks.sand_mail': {'queue': 'mail'},
+    'backend.tasks.send_queued_mail': {'queue': 'mail'},
+    'backend.tasks.reimport_shops': {'queue': 'import'},
+    'backend.tasks.refresh_shop_feed': {'queue': 'import'},
+    'backend.tasks.warm_cache': {'queue': 'import'},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+
+# периодическая проверка прайс-листов магазинов (celery -A orders beat)
+CELERY_BEAT_SCHEDULE = {
+    'reimport-shops': {
+        'task': 'backend.tasks.reimport_shops',
+        'schedule': env.int('IMPORT_FEED_INTERVAL', default=60 * 60),
+    },
+    'flush-idle-baskets': {
+        'task': 'backend.tasks.flush_idle_baskets',
+        'schedule': env.int('BASKET_FLUSH_INTERVAL', default=60 * 60),
+    },
+    'relay-outbox': {
+        'task': 'backend.tasks.relay_outbox',
+        'schedule': env.int('OUTBOX_RELAY_INTERVAL', default=5),
+    },
+    'send-queued-mail': {
+        'task': 'backend.tasks.send_queued_mail',
+        'schedule': env.int('MAIL_SEND_INTERVAL', default=10),
+    },
+}
+
 # django setting.
 CACHES = {
     'default': {
@@ -231,6 +267,52 @@ CACHES = {
     }
 }
 
+# кеш ответов каталога сбрасывается сменой версии при импорте и изменениях,
+# срок хранения нужен только для освобождения памяти от старых версий, с
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+# страницы каталога, заполняемые в кеше после импорта, и адрес, от которого строятся ссылки в них
+CATALOG_WARM_PAGES = (
+    '/api/v1/categories/',
+    '/api/v1/shops/',
+    '/api/v1/products/',
+    '/api/v1/products/?shop={shop_id}',
+)
+CATALOG_WARM_BASE_URL = env('CATALOG_WARM_BASE_URL', default='http://localhost:8000')
+
+# размер пачки строк при импорте прайс-листов
+IMPORT_BATCH_SIZE = 500
+# файлы прайс-листов от этого размера разбираются потоково
+IMPORT_STREAMING_SIZE = 20 * 1024 * 1024
+# параллельный импорт: строк в шарде и число одновременно работающих задач записи
+IMPORT_SHARD_SIZE = 5000
+IMPORT_CONCURRENCY = 4
+# блокировка импорта магазина: время жизни (продлевается, пока импорт выполняется), пауза перед повторной
+# попыткой, с, и число попыток, после которого задание завершается ошибкой
+IMPORT_LOCK_TIMEOUT = 60 * 60
+IMPORT_LOCK_RETRY_DELAY = 30
+IMPORT_LOCK_MAX_RETRIES = 240
+# каталог для прайс-листов, загруженных через API
+IMPORT_UPLOAD_DIR = env('IMPORT_UPLOAD_DIR', default=os.path.join(BASE_DIR, 'uploads'))
+# плановый импорт по Shop.url/Shop.filename: режим импорта и таймаут загрузки, с
+IMPORT_FEED_MODE = 'delta'
+IMPORT_FEED_TIMEOUT = 60
+
+# хранилище корзин: 'db' - таблицы заказов, 'redis' - хеши Redis с записью в БД при оформлении
+BASKET_BACKEND = env('BASKET_BACKEND', default='db')
+# корзина Redis, не менявшаяся столько секунд, переносится в БД задачей flush_idle_baskets
+BASKET_IDLE_TIMEOUT = env.int('BASKET_IDLE_TIMEOUT', default=60 * 60 * 24)
+
+# очередь писем: писем в пачке на одно SMTP-соединение, число попыток и пауза перед первой повторной, с
+# (удваивается с каждой попыткой); письмо в отправке дольше MAIL_SEND_TIMEOUT снова берется в работу
+MAIL_BATCH_SIZE = env.int('MAIL_BATCH_SIZE', default=50)
+MAIL_MAX_ATTEMPTS = 5
+MAIL_RETRY_DELAY = 60
+MAIL_SEND_TIMEOUT = 10 * 60
+
+# outbox: событий в пачке на одно соединение с брокером и пауза между проверками команды relay_outbox, с
+OUTBOX_BATCH_SIZE = env.int('OUTBOX_BATCH_SIZE', default=100)
+OUTBOX_POLL_INTERVAL = 0.5
+
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     'SECURITY_DEFINITIONS': {
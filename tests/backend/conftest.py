@@ -3,9 +3,12 @@ import pytest
 from rest_framework.test import APIClient
 from model_bakery import baker
 
+from backend.locks import get_redis
 from backend.models import Category, Contact, Shop
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework.authtoken.models import Token
+from orders.celery_app import app as celery_app
 
 user_shop = {
     'username': 'shop',
@@ -22,6 +25,18 @@ user_buyer = {
 }
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    счетчики ограничения запросов, кеш и корзины в Redis не переходят между тестами
+    """
+    cache.clear()
+    redis = get_redis()
+    for key in redis.scan_iter('basket:*'):
+        redis.delete(key)
+    yield
+
+
 @pytest.fixture
 @pytest.mark.django_db
 def client_shop(client_log):
@@ -84,6 +99,29 @@ def category_factory():
 
     return factory
 
+
+@pytest.fixture
+def query_budget(django_assert_max_num_queries):
+    """
+    GET-запрос к эндпоинту с проверкой бюджета запросов к базе;
+    бюджет не должен зависеть от количества строк в ответе, число запросов - в response.queries
+    """
+    def check(client, url, budget):
+        with django_assert_max_num_queries(budget) as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        response.queries = len(queries)
+        return response
+
+    return check
+
+
+@pytest.fixture
+def celery_eager():
+    celery_app.conf.task_always_eager = True
+    yield
+    celery_app.conf.task_always_eager = False
+
 # @pytest.fixture(scope='session')
 # def celery_config():
 #     return {
@@ -0,0 +1,66 @@
+import pytest
+from django.contrib.auth.tokens import default_token_generator
+from djoser import signals
+from djoser.utils import encode_uid
+
+from tests.backend.conftest import user_buyer
+
+ACTIVATION_URL = '/api/v1/auth/users/activation/'
+
+
+class TestUserActivation:
+
+    @pytest.fixture
+    def inactive(self, user):
+        return user(**dict(user_buyer, is_active=False))
+
+    @staticmethod
+    def link(usr, token=None):
+        return f'/activate/{encode_uid(usr.pk)}/{token or default_token_generator.make_token(usr)}'
+
+    @pytest.fixture
+    def no_requests(self, monkeypatch):
+        def post(*args, **kwargs):
+            raise AssertionError('запрос к собственному API')
+
+        monkeypatch.setattr('requests.post', post)
+
+    # тест активации по ссылке в том же запросе с сигналом djoser
+    @pytest.mark.django_db
+    def test_activation(self, inactive, client_not_log, no_requests):
+        activated = []
+
+        def receiver(user, **kwargs):
+            activated.append(user.pk)
+
+        signals.user_activated.connect(receiver)
+        try:
+            response = client_not_log.get(self.link(inactive))
+        finally:
+            signals.user_activated.disconnect(receiver)
+        assert response.status_code == 200
+        assert response.json() == ''
+        inactive.refresh_from_db()
+        assert inactive.is_active
+        assert activated == [inactive.pk]
+
+    # тест ответов на ошибки в том же виде, что и у /auth/users/activation/
+    @pytest.mark.django_db
+    def test_activation_errors(self, inactive, client_not_log, no_requests):
+        cases = [
+            (encode_uid(0), default_token_generator.make_token(inactive)),
+            (encode_uid(inactive.pk), 'bad-token'),
+        ]
+        for uid, token in cases:
+            expected = client_not_log.post(ACTIVATION_URL, {'uid': uid, 'token': token}).content.decode()
+            response = client_not_log.get(f'/activate/{uid}/{token}')
+            assert response.status_code == 200
+            assert response.json() == expected
+        inactive.refresh_from_db()
+        assert not inactive.is_active
+
+        uid, token = encode_uid(inactive.pk), default_token_generator.make_token(inactive)
+        assert client_not_log.get(f'/activate/{uid}/{token}').json() == ''
+        expected = client_not_log.post(ACTIVATION_URL, {'uid': uid, 'token': token})
+        assert expected.status_code == 403
+        assert client_not_log.get(f'/activate/{uid}/{token}').json() == expected.content.decode()
@@ -0,0 +1,76 @@
+import pytest
+from django.urls import reverse_lazy
+
+from backend.models import Order, OrderItem, ProductInfo, Shop
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestBasketBulk:
+    BULK_URL = reverse_lazy('backend:BasketView-bulk')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        return list(ProductInfo.objects.order_by('id'))
+
+    @staticmethod
+    def lines(*items):
+        return {'items': [{'product_info': product_info.id, 'quantity': quantity} for product_info, quantity in items]}
+
+    # тест добавления, изменения и удаления позиций одним запросом
+    @pytest.mark.django_db
+    def test_bulk_basket(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        response = client.post(self.BULK_URL, self.lines((catalog[0], 1), (catalog[1], 2), (catalog[2], 3)),
+                               format='json')
+        assert response.status_code == 200
+        assert len(response.json()['ordered_items']) == 3
+        response = client.post(self.BULK_URL, self.lines((catalog[0], 5), (catalog[1], 0), (catalog[3], 1)),
+                               format='json')
+        data = response.json()
+        assert {item['product_info']['id']: item['quantity'] for item in data['ordered_items']} == {
+            catalog[0].id: 5, catalog[2].id: 3, catalog[3].id: 1}
+        assert data['total_sum'] == catalog[0].price * 5 + catalog[2].price * 3 + catalog[3].price
+        assert data['items_count'] == 3
+        assert Order.objects.get(state='basket').total_sum == data['total_sum']
+
+    # тест отказа всего пакета при отсутствующем или недоступном товаре
+    @pytest.mark.django_db
+    def test_bulk_basket_invalid(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        Shop.objects.update(state=False)
+        response = client.post(self.BULK_URL, {'items': [{'product_info': catalog[0].id, 'quantity': 1},
+                                                         {'product_info': 0, 'quantity': 1}]}, format='json')
+        assert response.status_code == 400
+        assert response.json()['items'] == ['Данные по товару отсутствуют id=0',
+                                            f'Данный товар недоступен для заказа id={catalog[0].id}']
+        assert not OrderItem.objects.exists()
+        assert client.post(self.BULK_URL, {'items': []}, format='json').status_code == 400
+
+    # тест постоянного числа запросов независимо от числа позиций
+    @pytest.mark.django_db
+    def test_bulk_basket_queries(self, catalog, client_log, django_assert_max_num_queries):
+        client = client_log(**user_buyer)
+        client.post(self.BULK_URL, self.lines((catalog[0], 1)), format='json')
+        # два запроса - точка сохранения транзакции изменения корзины
+        with django_assert_max_num_queries(12):
+            response = client.post(self.BULK_URL, self.lines(*((product_info, 2) for product_info in catalog[1:]),
+                                                              (catalog[0], 0)), format='json')
+        assert len(response.json()['ordered_items']) == len(catalog) - 1
+
+    # тест отката позиций, если сумму корзины пересчитать не удалось
+    @pytest.mark.django_db
+    def test_bulk_basket_atomic(self, catalog, client_log, monkeypatch):
+        client = client_log(**user_buyer)
+        client.post(self.BULK_URL, self.lines((catalog[0], 1), (catalog[1], 2)), format='json')
+
+        def recalculate_order(order_id):
+            raise RuntimeError('сбой пересчета')
+
+        monkeypatch.setattr('backend.baskets.recalculate_order', recalculate_order)
+        with pytest.raises(RuntimeError):
+            client.post(self.BULK_URL, self.lines((catalog[0], 0), (catalog[2], 3)), format='json')
+        assert dict(OrderItem.objects.values_list('product_info_id', 'quantity')) == {catalog[0].id: 1,
+                                                                                      catalog[1].id: 2}
+        assert Order.objects.get(state='basket').total_sum == catalog[0].price + catalog[1].price * 2
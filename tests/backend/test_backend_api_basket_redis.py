@@ -0,0 +1,127 @@
+import pytest
+from django.urls import reverse, reverse_lazy
+
+from backend.locks import get_redis
+from backend.models import Order, OrderItem, ProductInfo
+from backend.tasks import do_import, flush_idle_baskets
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestRedisBasket:
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+    BULK_URL = reverse_lazy('backend:BasketView-bulk')
+    CHECKOUT_URL = reverse_lazy('backend:BasketView-update-new')
+
+    @pytest.fixture(autouse=True)
+    def redis_basket(self, settings):
+        settings.BASKET_BACKEND = 'redis'
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        return list(ProductInfo.objects.order_by('id'))
+
+    # тест корзины без записи в БД с ответами в прежнем формате
+    @pytest.mark.django_db
+    def test_basket_without_writes(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        response = client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        assert response.status_code == 201
+        assert response.json() == {'id': catalog[0].id, 'product_info': catalog[0].id, 'quantity': 2, 'order': None}
+        client.post(self.BULK_URL, {'items': [{'product_info': catalog[1].id, 'quantity': 1}]}, format='json')
+        data = client.get(self.BASKET_URL).json()
+        assert set(data[0]) == {'id', 'ordered_items', 'state', 'dt', 'total_sum', 'items_count', 'contact'}
+        assert data[0]['state'] == 'basket'
+        assert data[0]['total_sum'] == catalog[0].price * 2 + catalog[1].price
+        assert [item['product_info']['id'] for item in data[0]['ordered_items']] == [catalog[0].id, catalog[1].id]
+        url = reverse('backend:BasketView-detail', args=(catalog[1].id,))
+        assert client.get(url).json()['product_info']['model'] == catalog[1].model
+        assert client.delete(url).status_code == 204
+        assert client.get(url).status_code == 404
+        assert client.get(self.BASKET_URL).json()[0]['items_count'] == 1
+        assert not Order.objects.exists()
+
+    # тест адресации позиции и id позиции заказа-корзины, и id товара в обоих режимах
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('mode', ('db', 'redis'))
+    def test_line_ids(self, catalog, client_log, settings, mode):
+        client = client_log(**user_buyer)
+        first, second = catalog[2:4]
+        settings.BASKET_BACKEND = 'db'
+        client.post(self.BULK_URL, {'items': [{'product_info': first.id, 'quantity': 2},
+                                              {'product_info': second.id, 'quantity': 1}]}, format='json')
+        item = OrderItem.objects.get(product_info=first)
+        assert item.id not in (first.id, second.id)
+        settings.BASKET_BACKEND = mode
+        for line_id in (item.id, first.id):
+            response = client.get(reverse('backend:BasketView-detail', args=(line_id,)))
+            assert (response.json()['product_info']['id'], response.json()['quantity']) == (first.id, 2)
+        assert client.delete(reverse('backend:BasketView-detail', args=(item.id,))).status_code == 204
+        assert client.delete(reverse('backend:BasketView-detail', args=(second.id,))).status_code == 204
+        assert client.get(reverse('backend:BasketView-detail', args=(item.id,))).status_code == 404
+        assert client.get(self.BASKET_URL).json()[0]['items_count'] == 0
+
+    # тест id в ответах корзины: db - позиция и заказ-корзина, redis - товар и null до записи в БД;
+    # id из ответов адресует позицию в обоих режимах
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('mode', ('db', 'redis'))
+    def test_response_ids(self, catalog, client_log, settings, mode):
+        settings.BASKET_BACKEND = mode
+        client = client_log(**user_buyer)
+        created = client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2}).json()
+        basket = client.get(self.BASKET_URL).json()[0]
+        if mode == 'db':
+            item = OrderItem.objects.get()
+            assert (created['id'], created['order'], basket['id']) == (item.id, item.order_id, item.order_id)
+        else:
+            assert (created['id'], created['order'], basket['id']) == (catalog[0].id, None, None)
+        assert [line['id'] for line in basket['ordered_items']] == [created['id']]
+        url = reverse('backend:BasketView-detail', args=(created['id'],))
+        assert client.get(url).json()['quantity'] == 2
+        assert client.delete(url).status_code == 204
+
+    # тест условного запроса корзины из Redis
+    @pytest.mark.django_db
+    def test_basket_etag(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+        etag = client.get(self.BASKET_URL)['ETag']
+        assert client.get(self.BASKET_URL, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 3})
+        assert client.get(self.BASKET_URL, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    # тест записи корзины в БД при оформлении
+    @pytest.mark.django_db
+    def test_checkout_materializes(self, catalog, client_log, contact_factory, user, celery_eager):
+        client = client_log(**user_buyer)
+        client.post(self.BULK_URL, {'items': [{'product_info': catalog[0].id, 'quantity': 2},
+                                              {'product_info': catalog[1].id, 'quantity': 1}]}, format='json')
+        contact = contact_factory(user=user(**user_buyer))
+        response = client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+        assert response.json()['Status'] == 'Заказ сформирован'
+        order = Order.objects.get()
+        assert order.state == 'new'
+        assert order.total_sum == catalog[0].price * 2 + catalog[1].price
+        assert dict(order.ordered_items.values_list('product_info_id', 'quantity')) == {
+            catalog[0].id: 2, catalog[1].id: 1}
+        assert ProductInfo.objects.get(id=catalog[0].id).quantity == catalog[0].quantity - 2
+        assert client.get(self.BASKET_URL).json() == []
+
+    # тест сброса простаивающей корзины в БД и ее возврата в Redis
+    @pytest.mark.django_db
+    def test_idle_flush(self, catalog, client_log, settings):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        assert flush_idle_baskets() == 0
+        settings.BASKET_IDLE_TIMEOUT = -1
+        assert flush_idle_baskets() == 1
+        assert not get_redis().exists('basket:idle')
+        basket = Order.objects.get(state='basket')
+        assert list(basket.ordered_items.values_list('product_info_id', 'quantity')) == [(catalog[0].id, 2)]
+        data = client.get(self.BASKET_URL).json()
+        assert data[0]['id'] == basket.id
+        assert data[0]['ordered_items'][0]['quantity'] == 2
+        client.post(self.BASKET_URL, data={'product_info': catalog[1].id, 'quantity': 1})
+        assert OrderItem.objects.count() == 1
+        assert flush_idle_baskets() == 1
+        assert OrderItem.objects.filter(order=basket).count() == 2
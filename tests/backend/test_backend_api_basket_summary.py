@@ -0,0 +1,95 @@
+import pytest
+from django.urls import reverse, reverse_lazy
+
+from backend.cache import bump_catalog_version
+from backend.models import OrderItem, ProductInfo
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestBasketSummary:
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+    BULK_URL = reverse_lazy('backend:BasketView-bulk')
+    SUMMARY_URL = reverse_lazy('backend:BasketView-summary')
+    CHECKOUT_URL = reverse_lazy('backend:BasketView-update-new')
+
+    @pytest.fixture(params=['db', 'redis'])
+    def backend(self, request, settings):
+        settings.BASKET_BACKEND = request.param
+        return request.param
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        return list(ProductInfo.objects.order_by('id'))
+
+    # тест счетчиков сводки при изменениях корзины
+    @pytest.mark.django_db
+    def test_summary(self, backend, catalog, client_log):
+        client = client_log(**user_buyer)
+        assert client.get(self.SUMMARY_URL).json() == {'lines': 0, 'units': 0, 'total': 0}
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        client.post(self.BULK_URL, {'items': [{'product_info': catalog[1].id, 'quantity': 3},
+                                              {'product_info': catalog[2].id, 'quantity': 1}]}, format='json')
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+        assert client.get(self.SUMMARY_URL).json() == {
+            'lines': 3, 'units': 5, 'total': catalog[0].price + catalog[1].price * 3 + catalog[2].price}
+        item = catalog[2].id if backend == 'redis' else OrderItem.objects.get(product_info=catalog[2]).id
+        client.delete(reverse('backend:BasketView-detail', args=(item,)))
+        client.post(self.BULK_URL, {'items': [{'product_info': catalog[1].id, 'quantity': 0}]}, format='json')
+        assert client.get(self.SUMMARY_URL).json() == {'lines': 1, 'units': 1, 'total': catalog[0].price}
+
+    # тест сводки одним запросом к заказу-корзине (db) или без обращения к БД (redis), кроме аутентификации
+    @pytest.mark.django_db
+    def test_summary_queries(self, backend, catalog, client_log, django_assert_num_queries):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        client.get(self.SUMMARY_URL)
+        with django_assert_num_queries(2 if backend == 'db' else 1):
+            assert client.get(self.SUMMARY_URL).json()['units'] == 2
+
+    # тест пересчета суммы после изменения каталога и сброса после оформления
+    @pytest.mark.django_db
+    def test_summary_recount(self, backend, catalog, client_log, contact_factory, user, celery_eager):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        client.get(self.SUMMARY_URL)
+        catalog[0].price = 100
+        catalog[0].save()
+        bump_catalog_version(catalog[0].shop_id)
+        assert client.get(self.SUMMARY_URL).json()['total'] == 200
+        contact = contact_factory(user=user(**user_buyer))
+        client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+        assert client.get(self.SUMMARY_URL).json() == {'lines': 0, 'units': 0, 'total': 0}
+
+    # тест сводки Redis после оформления чужого заказа: списаны только остатки, счетчики не пересчитываются
+    @pytest.mark.django_db
+    def test_summary_after_checkout(self, catalog, client_log, contact_factory, user, settings, celery_eager,
+                                    django_capture_on_commit_callbacks, django_assert_num_queries):
+        settings.BASKET_BACKEND = 'redis'
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        client.get(self.SUMMARY_URL)
+        other = {**user_buyer, 'username': 'other', 'email': 'other@mail.ru'}
+        other_client = client_log(**other)
+        other_client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+        contact = contact_factory(user=user(**other))
+        with django_capture_on_commit_callbacks(execute=True):
+            other_client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+        with django_assert_num_queries(1):
+            assert client.get(self.SUMMARY_URL).json()['total'] == catalog[0].price * 2
+
+    # тест сводки корзины в БД без Redis
+    @pytest.mark.django_db
+    def test_summary_db_without_redis(self, catalog, client_log, settings, monkeypatch):
+        settings.BASKET_BACKEND = 'db'
+
+        def get_redis():
+            raise AssertionError('обращение к Redis')
+
+        monkeypatch.setattr('backend.baskets.get_redis', get_redis)
+        client = client_log(**user_buyer)
+        client.post(self.BULK_URL, {'items': [{'product_info': catalog[0].id, 'quantity': 2},
+                                              {'product_info': catalog[1].id, 'quantity': 1}]}, format='json')
+        assert client.get(self.SUMMARY_URL).json() == {
+            'lines': 2, 'units': 3, 'total': catalog[0].price * 2 + catalog[1].price}
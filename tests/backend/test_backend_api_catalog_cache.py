@@ -0,0 +1,74 @@
+import pytest
+from django.urls import reverse_lazy
+
+from backend.cache import bump_catalog_version
+from backend.models import Shop
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+user_shop_2 = {
+    'username': 'shop2',
+    'email': 'shop2@mail.ru',
+    'type': 'shop',
+    'is_active': True
+}
+
+
+class TestCatalogCache:
+    CATEGORIES_URL = reverse_lazy('backend:categories')
+    SHOPS_URL = reverse_lazy('backend:shops')
+    PRODUCTS_URL = reverse_lazy('backend:ProductInfoView-list')
+    PARTNER_STATE_URL = reverse_lazy('backend:partner-state')
+
+    # тест повторного ответа из кеша до смены версии каталога
+    @pytest.mark.django_db
+    def test_cached_list(self, client_log, category_factory, django_assert_num_queries):
+        client = client_log(**user_buyer)
+        category_factory(_quantity=2)
+        assert client.get(self.CATEGORIES_URL).json()['count'] == 2
+        category_factory()
+        with django_assert_num_queries(1):
+            assert client.get(self.CATEGORIES_URL).json()['count'] == 2
+        assert client.get(self.CATEGORIES_URL, {'page': 1}).json()['count'] == 3
+        bump_catalog_version()
+        assert client.get(self.CATEGORIES_URL).json()['count'] == 3
+
+    # тест сброса кеша импортом только для затронутого магазина
+    @pytest.mark.django_db
+    def test_import_invalidates(self, user, client_not_log, django_assert_num_queries):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        shop = Shop.objects.get()
+        assert len(client_not_log.get(self.PRODUCTS_URL).json()['results']) == 4
+        assert len(client_not_log.get(self.PRODUCTS_URL, {'shop': shop.id}).json()['results']) == 4
+
+        do_import('/products_data/sotik.yml', user(**user_shop_2).id)
+        assert len(client_not_log.get(self.PRODUCTS_URL, {'page_size': 100}).json()['results']) > 4
+        with django_assert_num_queries(0):
+            assert len(client_not_log.get(self.PRODUCTS_URL, {'shop': shop.id}).json()['results']) == 4
+
+    # тест сброса кеша при изменении статуса магазина
+    @pytest.mark.django_db
+    def test_partner_state_invalidates(self, client_log, user, shop_factory):
+        shop_factory(user=user(**user_shop), state=True)
+        client = client_log(**user_shop)
+        assert client.get(self.SHOPS_URL).json()['results'][0]['state'] is True
+        client.patch(self.PARTNER_STATE_URL, data={'state': False})
+        assert client.get(self.SHOPS_URL).json()['results'][0]['state'] is False
+
+    # тест заполнения кеша после импорта
+    @pytest.mark.django_db
+    def test_warm_after_import(self, user, client_not_log, client_log, settings, celery_eager,
+                               django_assert_num_queries):
+        settings.CATALOG_WARM_BASE_URL = 'http://testserver'
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        shop = Shop.objects.get()
+        client = client_log(**user_buyer)
+        with django_assert_num_queries(0):
+            assert len(client_not_log.get(self.PRODUCTS_URL).json()['results']) == 4
+            assert len(client_not_log.get(self.PRODUCTS_URL, {'shop': shop.id}).json()['results']) == 4
+        # единственный запрос - проверка токена
+        with django_assert_num_queries(1):
+            assert len(client.get(self.CATEGORIES_URL).json()['results']) == 3
+        with django_assert_num_queries(1):
+            assert client.get(self.SHOPS_URL).json()['results'][0]['id'] == shop.id
+        assert client_not_log.get(self.CATEGORIES_URL).status_code == 401
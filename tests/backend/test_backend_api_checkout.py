@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connection
+from django.urls import reverse_lazy
+
+from backend.models import Order, OrderItem, ProductInfo
+from backend.orders import AlreadyPlaced, OutOfStock, checkout
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestCheckout:
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+    CHECKOUT_URL = reverse_lazy('backend:BasketView-update-new')
+    PRODUCTS_URL = reverse_lazy('backend:ProductInfoView-list')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        return list(ProductInfo.objects.order_by('id')[:2])
+
+    @pytest.fixture
+    def place(self, client_log, contact_factory, user, celery_eager):
+        def make_order(*lines):
+            client = client_log(**user_buyer)
+            for product_info, quantity in lines:
+                client.post(self.BASKET_URL, data={'product_info': product_info.id, 'quantity': quantity})
+            contact = contact_factory(user=user(**user_buyer))
+            return client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+
+        return make_order
+
+    # тест сброса кеша каталога после оформления: список товаров показывает новый остаток
+    @pytest.mark.django_db
+    def test_checkout_refreshes_catalog(self, catalog, place, client_log, django_capture_on_commit_callbacks):
+        client = client_log(**user_buyer)
+
+        def quantity(**params):
+            results = client.get(self.PRODUCTS_URL, params).json()['results']
+            return next(item['quantity'] for item in results if item['id'] == catalog[0].id)
+
+        shop_id = catalog[0].shop_id
+        assert quantity() == quantity(shop=shop_id) == catalog[0].quantity
+        with django_capture_on_commit_callbacks(execute=True):
+            assert place((catalog[0], 2)).json()['Status'] == 'Заказ сформирован'
+        assert quantity() == quantity(shop=shop_id) == catalog[0].quantity - 2
+
+    # тест списания остатков при оформлении заказа
+    @pytest.mark.django_db
+    def test_checkout_decrements_stock(self, catalog, place):
+        stock = [product_info.quantity for product_info in catalog]
+        response = place((catalog[0], 2), (catalog[1], 1))
+        assert response.json()['Status'] == 'Заказ сформирован'
+        assert [ProductInfo.objects.get(id=product_info.id).quantity for product_info in catalog] == [
+            stock[0] - 2, stock[1] - 1]
+
+    # тест отчета по позициям без остатка: заказ не оформлен, остатки не изменились
+    @pytest.mark.django_db
+    def test_checkout_out_of_stock(self, catalog, place):
+        ProductInfo.objects.filter(id=catalog[1].id).update(quantity=1)
+        response = place((catalog[0], 1), (catalog[1], 3))
+        assert response.status_code == 409
+        assert response.json()['Errors'] == [{'product_info': catalog[1].id, 'requested': 3, 'available': 1}]
+        assert ProductInfo.objects.get(id=catalog[0].id).quantity == catalog[0].quantity
+        assert Order.objects.get().state == 'basket'
+
+    # тест повторного оформления того же заказа
+    @pytest.mark.django_db
+    def test_checkout_twice(self, catalog, place):
+        place((catalog[0], 1))
+        order = Order.objects.get()
+        with pytest.raises(AlreadyPlaced):
+            checkout(order)
+        assert ProductInfo.objects.get(id=catalog[0].id).quantity == catalog[0].quantity - 1
+
+    # нагрузочный тест: конкурентные оформления не продают больше остатка
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_checkout(self, catalog, user, record_property):
+        if connection.vendor != 'postgresql':
+            pytest.skip('конкурентная запись требует PostgreSQL')
+        stock, buyers, workers = 25, 60, 12
+        ProductInfo.objects.filter(id__in=[product_info.id for product_info in catalog]).update(quantity=stock)
+        orders = []
+        for number in range(buyers):
+            order = Order.objects.create(user=user(username=f'buyer{number}', email=f'buyer{number}@mail.ru',
+                                                   type='buyer', is_active=True), state='basket')
+            # половина покупателей кладет товары в обратном порядке
+            lines = catalog if number % 2 else catalog[::-1]
+            OrderItem.objects.bulk_create(OrderItem(order=order, product_info=product_info, quantity=1)
+                                          for product_info in lines)
+            orders.append(order)
+
+        def place(order):
+            try:
+                checkout(order)
+                return True
+            except OutOfStock:
+                return False
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            placed = sum(executor.map(place, orders))
+        elapsed = time.perf_counter() - started
+        record_property('checkouts_per_second', round(buyers / elapsed, 1))
+        assert placed == stock
+        assert list(ProductInfo.objects.filter(id__in=[product_info.id for product_info in catalog]).values_list(
+            'quantity', flat=True)) == [0, 0]
+        assert Order.objects.filter(state='new').count() == stock
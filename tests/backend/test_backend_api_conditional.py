@@ -0,0 +1,81 @@
+import pytest
+from django.urls import reverse, reverse_lazy
+
+from backend.cache import bump_catalog_version
+from backend.models import Order, ProductInfo
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestConditionalGet:
+    CATEGORIES_URL = reverse_lazy('backend:categories')
+    PRODUCTS_URL = reverse_lazy('backend:ProductInfoView-list')
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        return list(ProductInfo.objects.all())
+
+    # тест ответа 304 по ETag без обращения к данным каталога
+    @pytest.mark.django_db
+    def test_catalog_etag(self, client_log, category_factory, django_assert_num_queries):
+        client = client_log(**user_buyer)
+        category_factory(_quantity=2)
+        response = client.get(self.CATEGORIES_URL)
+        etag = response['ETag']
+        with django_assert_num_queries(1):
+            response = client.get(self.CATEGORIES_URL, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert not response.content
+        assert response['ETag'] == etag
+        assert client.get(self.CATEGORIES_URL, {'page': 1}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+        bump_catalog_version()
+        response = client.get(self.CATEGORIES_URL, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    # тест ответа 304 по Last-Modified после импорта
+    @pytest.mark.django_db
+    def test_catalog_last_modified(self, catalog, client_not_log):
+        response = client_not_log.get(self.PRODUCTS_URL)
+        assert response.status_code == 200
+        response = client_not_log.get(self.PRODUCTS_URL, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        assert response.status_code == 304
+
+    # тест ответа 304 и кеша для списка товаров с фасетами
+    @pytest.mark.django_db
+    def test_catalog_facets_etag(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        response = client.get(self.PRODUCTS_URL, {'facets': 1})
+        facets = response.json()['facets']
+        response = client.get(self.PRODUCTS_URL, {'facets': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == 304
+        assert client.get(self.PRODUCTS_URL, {'facets': 1}).json()['facets'] == facets
+
+    # тест условного запроса корзины
+    @pytest.mark.django_db
+    def test_basket_etag(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+        etag = client.get(self.BASKET_URL)['ETag']
+        assert client.get(self.BASKET_URL, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        client.post(self.BASKET_URL, data={'product_info': catalog[1].id, 'quantity': 1})
+        response = client.get(self.BASKET_URL, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert len(response.json()[0]['ordered_items']) == 2
+
+    # тест условного запроса заказа
+    @pytest.mark.django_db
+    def test_order_etag(self, catalog, client_log, user):
+        client = client_log(**user_buyer)
+        order = Order.objects.create(user=user(**user_buyer), state='new')
+        url = reverse('backend:OrderView-detail', args=(order.id,))
+        etag = client.get(url)['ETag']
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        order.state = 'basket'
+        order.save()
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 404
+        order.state = 'new'
+        order.save()
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
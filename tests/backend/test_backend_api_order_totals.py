@@ -0,0 +1,115 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse, reverse_lazy
+
+from backend.models import Order, OrderItem, ProductInfo
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestOrderTotals:
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+    CHECKOUT_URL = reverse_lazy('backend:BasketView-update-new')
+    ORDERS_URL = reverse_lazy('backend:OrderView-list')
+    FILENAME = '/products_data/svyaznoy.yml'
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import(self.FILENAME, user(**user_shop).id)
+        return list(ProductInfo.objects.order_by('id'))
+
+    @pytest.fixture
+    def staff_client(self, user, client):
+        client.force_login(user(username='admin', email='admin@mail.ru', is_staff=True, is_superuser=True,
+                                is_active=True))
+        return client
+
+    # тест пересчета суммы корзины при добавлении, изменении и удалении позиций
+    @pytest.mark.django_db
+    def test_basket_totals(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        client.post(self.BASKET_URL, data={'product_info': catalog[1].id, 'quantity': 1})
+        basket = client.get(self.BASKET_URL).json()[0]
+        assert basket['total_sum'] == catalog[0].price * 2 + catalog[1].price
+        assert basket['items_count'] == 2
+        client.post(self.BASKET_URL, data={'product_info': catalog[1].id, 'quantity': 3})
+        assert client.get(self.BASKET_URL).json()[0]['total_sum'] == catalog[0].price * 2 + catalog[1].price * 3
+        item = OrderItem.objects.get(product_info=catalog[0])
+        client.delete(reverse('backend:BasketView-detail', args=(item.id,)))
+        basket = client.get(self.BASKET_URL).json()[0]
+        assert basket['total_sum'] == catalog[1].price * 3
+        assert basket['items_count'] == 1
+        assert Order.objects.get(state='basket').units_count == 3
+
+    # тест фиксации цен при оформлении заказа
+    @pytest.mark.django_db
+    def test_checkout_freezes_prices(self, catalog, client_log, contact_factory, celery_eager):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        order = Order.objects.get(state='basket')
+        contact = contact_factory(user=order.user)
+        response = client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+        assert response.json()['Status'] == 'Заказ сформирован'
+        assert OrderItem.objects.get(order=order).price == catalog[0].price
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+        catalog[0].price += 100
+        catalog[0].save()
+        order.refresh_from_db()
+        assert order.total_sum == (catalog[0].price - 100) * 2
+        assert client.get(self.ORDERS_URL).json()['results'][0]['total_sum'] == order.total_sum
+        assert Order.objects.get(state='basket').total_sum == catalog[0].price
+
+    # тест пересчета корзин, из которых импорт удалил товары
+    @pytest.mark.django_db
+    def test_import_recalculates_baskets(self, catalog, client_log, user):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+        do_import(self.FILENAME, user(**user_shop).id)
+        basket = Order.objects.get(state='basket')
+        assert (basket.total_sum, basket.items_count) == (0, 0)
+
+    # тест пересчета корзин при каскадном удалении товаров через админку
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('model, lookup', (
+            ('productinfo', lambda info: info),
+            ('shop', lambda info: info.shop),
+            ('category', lambda info: info.product.category),
+            ('user', lambda info: info.shop.user),
+    ))
+    def test_admin_delete_recalculates_baskets(self, catalog, client_log, staff_client, model, lookup):
+        client_log(**user_buyer).post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        assert Order.objects.get(state='basket').total_sum == catalog[0].price * 2
+        obj = lookup(catalog[0])
+        response = staff_client.post(reverse(f'admin:backend_{model}_delete', args=(obj.pk,)), {'post': 'yes'})
+        assert response.status_code == 302
+        basket = Order.objects.get(state='basket')
+        assert (basket.total_sum, basket.items_count) == (0, 0)
+
+    # тест пересчета корзин при удалении магазинов действием списка в админке
+    @pytest.mark.django_db
+    def test_admin_delete_action_recalculates_baskets(self, catalog, client_log, staff_client):
+        client_log(**user_buyer).post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        staff_client.post(reverse('admin:backend_shop_changelist'),
+                          {'action': 'delete_selected', '_selected_action': [catalog[0].shop_id], 'post': 'yes'})
+        basket = Order.objects.get(state='basket')
+        assert (basket.total_sum, basket.items_count) == (0, 0)
+
+    # тест сверки и пересчета сумм командой order_totals
+    @pytest.mark.django_db
+    def test_order_totals_command(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 2})
+        call_command('order_totals', '--check')
+        Order.objects.update(total_sum=0, items_count=0)
+        with pytest.raises(CommandError):
+            call_command('order_totals', '--check')
+        call_command('order_totals', '--batch-size', '1')
+        call_command('order_totals', '--check')
+        assert Order.objects.get().total_sum == catalog[0].price * 2
+        Order.objects.update(units_count=0)
+        with pytest.raises(CommandError):
+            call_command('order_totals', '--check')
+        call_command('order_totals')
+        assert Order.objects.get().units_count == 2
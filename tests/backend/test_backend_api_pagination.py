@@ -0,0 +1,89 @@
+import base64
+import json
+
+import pytest
+from django.urls import reverse_lazy
+from model_bakery import baker
+
+from backend.models import Category, Order, Product, ProductInfo
+from backend.pagination import KeysetPagination
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestKeysetPagination:
+    PRODUCTS_URL = reverse_lazy('backend:ProductInfoView-list')
+    ORDER_URL = reverse_lazy('backend:OrderView-list')
+
+    @pytest.fixture
+    def catalog(self, user, shop_factory):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        shop = shop_factory()
+        for product in baker.make(Product, category=Category.objects.first(), _quantity=5):
+            baker.make(ProductInfo, shop=shop, product=product)
+        return list(ProductInfo.objects.order_by('shop_id', 'id').values_list('id', flat=True))
+
+    def walk(self, client, url, params):
+        ids, pages = [], 0
+        while url:
+            data = client.get(url, params).json()
+            params = None
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    # тест обхода каталога по курсору
+    @pytest.mark.django_db
+    def test_products_pages(self, catalog, client_log, query_budget):
+        client = client_log(**user_buyer)
+        ids, pages = self.walk(client, self.PRODUCTS_URL, {'page_size': 3})
+        assert ids == catalog
+        assert pages == 3
+        data = client.get(self.PRODUCTS_URL, {'page_size': 3}).json()
+        data = query_budget(client, data['next'], 3).json()
+        assert [item['id'] for item in data['results']] == catalog[3:6]
+        assert data['previous'] is None
+
+    # тест ограничения размера страницы
+    @pytest.mark.django_db
+    def test_page_size_cap(self, catalog, client_log, monkeypatch):
+        monkeypatch.setattr(KeysetPagination, 'max_page_size', 4)
+        data = client_log(**user_buyer).get(self.PRODUCTS_URL, {'page_size': 1000}).json()
+        assert len(data['results']) == 4
+
+    # тест курсора по смещению для выборки, отсортированной по релевантности
+    @pytest.mark.django_db
+    def test_search_pages(self, catalog, client_log):
+        ids, pages = self.walk(client_log(**user_buyer), self.PRODUCTS_URL, {'search': 'iphone', 'page_size': 3})
+        assert sorted(ids) == catalog[:4]
+        assert pages == 2
+
+    # тест неверного курсора
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('cursor', ('bm90IGpzb24', 'WzEsIDIsIDNd', 'IngiCg'))
+    def test_invalid_cursor(self, catalog, client_log, cursor):
+        response = client_log(**user_buyer).get(self.PRODUCTS_URL, {'cursor': cursor})
+        assert response.status_code == 404
+
+    # тест курсора с ключами неверного типа
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('position', (['shop', 1], [None, 1], [[1], 2], [1, {'id': 1}], [1, 10 ** 30], [1.5, 'x']))
+    def test_malformed_cursor(self, catalog, client_log, position):
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        client = client_log(**user_buyer)
+        assert client.get(self.PRODUCTS_URL, {'cursor': cursor}).status_code == 404
+        assert client.get(self.ORDER_URL, {'cursor': cursor}).status_code == 404
+        cursor = base64.urlsafe_b64encode(json.dumps(['1', '2']).encode()).decode()
+        assert client.get(self.PRODUCTS_URL, {'cursor': cursor}).status_code == 200
+
+    # тест постраничного списка заказов
+    @pytest.mark.django_db
+    def test_order_pages(self, client_log, user):
+        client = client_log(**user_buyer)
+        buyer = user(**user_buyer)
+        orders = [Order.objects.create(user=buyer, state='new').id for _ in range(7)]
+        Order.objects.create(user=buyer, state='basket')
+        ids, pages = self.walk(client, self.ORDER_URL, None)
+        assert ids == orders
+        assert pages == 2
@@ -0,0 +1,222 @@
+import time
+from pathlib import Path
+
+import pytest
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.urls import reverse, reverse_lazy
+
+from backend.importer import ImportLockLost, ImportProgress
+from backend.locks import acquire_import_lock, get_redis, import_lock_heartbeat, import_lock_key, release_import_lock
+from backend.models import ImportJob, OutboxEvent, ProductInfo
+from backend.tasks import do_import
+from tests.backend.conftest import user_shop, user_buyer
+
+
+class TestPartnerUpdate:
+    URL = reverse_lazy('backend:partner-update')
+
+    # тест запуска импорта и получения его состояния
+    @pytest.mark.django_db
+    def test_partner_update(self, client_shop, celery_eager):
+        response = client_shop.post(self.URL, data={'filename': '/products_data/sotik.yml', 'mode': 'delta'})
+        assert response.status_code == 200
+        job_id = response.json()['job_id']
+        response = client_shop.get(reverse('backend:partner-update-status', args=[job_id]))
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == 'done'
+        assert data['stage'] == 'done'
+        assert data['counts']['added'] == 2
+        assert set(data['timings']) == {'parsed', 'categories', 'products', 'parameters', 'search', 'done'}
+
+    # тест этапа импорта, выполняющегося внутри транзакции
+    @pytest.mark.django_db
+    def test_partner_update_progress_in_transaction(self, client_shop, user):
+        job = ImportJob.objects.create(user=user(**user_shop), filename='/products_data/sotik.yml', status='running')
+        progress = ImportProgress(job)
+        url = reverse('backend:partner-update-status', args=[job.id])
+        with transaction.atomic():
+            with progress.stage('categories'):
+                pass
+            progress.saved = 0
+            with progress.stage('products'):
+                pass
+            data = client_shop.get(url).json()
+            assert data['stage'] == 'products'
+            assert set(data['timings']) == {'categories', 'products'}
+            assert ImportJob.objects.get(id=job.id).stage == ''
+        progress.save(force=True, status='done')
+        data = client_shop.get(url).json()
+        assert (data['status'], data['stage']) == ('done', 'products')
+        assert not cache.get(ImportProgress.PROGRESS_KEY.format(job.id))
+
+    # тест состояния импорта с ошибкой
+    @pytest.mark.django_db
+    def test_partner_update_failed(self, client_shop, celery_eager):
+        job_id = client_shop.post(self.URL, data={'filename': '/products_data/missing.yml'}).json()['job_id']
+        data = client_shop.get(reverse('backend:partner-update-status', args=[job_id])).json()
+        assert data['status'] == 'failed'
+        assert 'missing.yml' in data['error']
+
+    # тест проверки аргументов
+    @pytest.mark.django_db
+    @pytest.mark.parametrize(
+        ('data', 'status'),
+        (({}, False),
+         ({'filename': '/products_data/sotik.yml', 'mode': 'unknown'}, False))
+    )
+    def test_partner_update_arguments(self, client_shop, data, status):
+        assert client_shop.post(self.URL, data=data).json()['Status'] == status
+        assert not ImportJob.objects.exists()
+
+    # тест доступа к чужому импорту
+    @pytest.mark.django_db
+    def test_partner_update_status_permissions(self, client_log, user):
+        job = ImportJob.objects.create(user=user(**user_shop), filename='/products_data/sotik.yml')
+        url = reverse('backend:partner-update-status', args=[job.id])
+        assert client_log(**user_shop).get(url).status_code == 200
+        assert client_log(**user_buyer).get(url).status_code == 404
+        assert client_log().get(url).status_code == 401
+
+    # тест замены задания в очереди более новым запросом
+    @pytest.mark.django_db
+    def test_partner_update_supersede(self, client_shop, user, celery_eager):
+        queued = ImportJob.objects.create(user=user(**user_shop), filename='/products_data/sotik.yml')
+        client_shop.post(self.URL, data={'filename': '/products_data/svyaznoy.yml'})
+        queued.refresh_from_db()
+        assert queued.status == 'superseded'
+        do_import(queued.filename, queued.user_id, job_id=queued.id)
+        queued.refresh_from_db()
+        assert queued.status == 'superseded'
+        assert queued.stage == ''
+
+    # тест ожидания блокировки импорта магазина
+    @pytest.mark.django_db
+    def test_partner_update_locked(self, user):
+        usr = user(**user_shop)
+        job = ImportJob.objects.create(user=usr, filename='/products_data/sotik.yml')
+        assert acquire_import_lock(usr.id, 0)
+        try:
+            with pytest.raises(Retry):
+                do_import(job.filename, usr.id, job_id=job.id)
+            job.refresh_from_db()
+            assert job.status == 'queued'
+        finally:
+            release_import_lock(usr.id, 0)
+        do_import(job.filename, usr.id, job_id=job.id)
+        job.refresh_from_db()
+        assert job.status == 'done'
+        assert acquire_import_lock(usr.id, job.id)
+        release_import_lock(usr.id, job.id)
+
+
+    # тест отказа от ожидания блокировки после IMPORT_LOCK_MAX_RETRIES попыток
+    @pytest.mark.django_db
+    def test_partner_update_lock_retries_exhausted(self, user, settings):
+        usr = user(**user_shop)
+        job = ImportJob.objects.create(user=usr, filename='/products_data/sotik.yml')
+        assert acquire_import_lock(usr.id, 0)
+        try:
+            do_import.apply((job.filename, usr.id), {'job_id': job.id}, retries=settings.IMPORT_LOCK_MAX_RETRIES)
+        finally:
+            release_import_lock(usr.id, 0)
+        job.refresh_from_db()
+        assert job.status == 'failed'
+        assert 'возникла ошибка' in OutboxEvent.objects.get().kwargs['msg_txt']
+
+    # тест продления блокировки, пока идет импорт, и сигнала о ее потере
+    def test_import_lock_heartbeat(self, settings):
+        settings.IMPORT_LOCK_TIMEOUT = 0.6
+        assert acquire_import_lock(-1, 1)
+        try:
+            with import_lock_heartbeat(-1, 1) as lost:
+                time.sleep(1)
+                assert get_redis().get(import_lock_key(-1)) == b'1'
+                assert not lost.is_set()
+                get_redis().delete(import_lock_key(-1))
+                assert lost.wait(1)
+        finally:
+            release_import_lock(-1, 1)
+        progress = ImportProgress(ImportJob(), lost)
+        with pytest.raises(ImportLockLost):
+            with progress.stage('products'):
+                pass
+
+
+class TestPartnerUpload:
+    URL = reverse_lazy('backend:partner-upload')
+    DATA_PATH = Path(__file__).parents[2] / 'backend' / 'products_data' / 'sotik.yml'
+
+    @pytest.fixture
+    def upload_dir(self, settings, tmp_path):
+        settings.IMPORT_UPLOAD_DIR = str(tmp_path)
+        return tmp_path
+
+    # тест загрузки файла и пропуска повторной загрузки того же содержимого
+    @pytest.mark.django_db
+    def test_partner_upload(self, client_shop, upload_dir, celery_eager):
+        content = self.DATA_PATH.read_bytes()
+        response = client_shop.post(self.URL, data={'file': SimpleUploadedFile('sotik.yml', content)},
+                                    format='multipart')
+        data = response.json()
+        assert data['Status'] is True
+        job = ImportJob.objects.get(id=data['job_id'])
+        assert job.status == 'done'
+        assert Path(job.filename).parent == upload_dir
+        assert not Path(job.filename).exists()
+        assert ProductInfo.objects.count() == 2
+
+        response = client_shop.post(self.URL, data={'file': SimpleUploadedFile('copy.yml', content)},
+                                    format='multipart')
+        assert response.json() == {'Status': True, 'Skipped': True, 'job_id': job.id}
+        assert ImportJob.objects.count() == 1
+
+    # тест повторной загрузки после неудачного импорта и после импорта другого содержимого
+    @pytest.mark.django_db
+    def test_partner_upload_dedupe_last_done(self, client_shop, upload_dir, celery_eager):
+        content = self.DATA_PATH.read_bytes()
+        response = client_shop.post(self.URL, data={'file': SimpleUploadedFile('sotik.yml', content)},
+                                    format='multipart')
+        first = ImportJob.objects.get(id=response.json()['job_id'])
+        ImportJob.objects.filter(id=first.id).update(status='failed')
+
+        response = client_shop.post(self.URL, data={'file': SimpleUploadedFile('sotik.yml', content)},
+                                    format='multipart')
+        assert 'Skipped' not in response.json()
+        assert ImportJob.objects.get(id=response.json()['job_id']).status == 'done'
+
+        changed = content.replace(b'price: 5000', b'price: 5100')
+        response = client_shop.post(self.URL, data={'file': SimpleUploadedFile('sotik.yml', changed)},
+                                    format='multipart')
+        assert 'Skipped' not in response.json()
+        ImportJob.objects.filter(id=response.json()['job_id']).update(status='queued')
+
+        response = client_shop.post(self.URL, data={'file': SimpleUploadedFile('sotik.yml', content)},
+                                    format='multipart')
+        assert 'Skipped' not in response.json()
+        assert ImportJob.objects.count() == 4
+        assert not list(upload_dir.iterdir())
+
+    # тест загрузки файла телом запроса
+    @pytest.mark.django_db
+    def test_partner_upload_raw(self, client_shop, upload_dir, celery_eager):
+        response = client_shop.generic('POST', self.URL, self.DATA_PATH.read_bytes(),
+                                       content_type='application/octet-stream',
+                                       HTTP_CONTENT_DISPOSITION='attachment; filename=sotik.yml')
+        assert response.json()['Status'] is True
+        assert ProductInfo.objects.count() == 2
+
+    # тест доступа к загрузке
+    @pytest.mark.django_db
+    @pytest.mark.parametrize(
+        ('user_data', 'status'),
+        ((user_buyer, 403),
+         ({}, 403))
+    )
+    def test_partner_upload_permissions(self, client_log, upload_dir, user_data, status):
+        response = client_log(**user_data).post(self.URL, data={'file': SimpleUploadedFile('sotik.yml', b'')},
+                                                format='multipart')
+        assert response.status_code == status
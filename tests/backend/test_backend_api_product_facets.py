@@ -0,0 +1,83 @@
+import pytest
+from django.urls import reverse_lazy
+
+from backend.importer import DeltaPriceListImporter
+from backend.models import Parameter, ProductInfo, ProductParameter, Shop
+from backend.parsers import load_price_list
+from backend.tasks import do_import
+from backend.uploads import price_list_path
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestProductFacets:
+    URL = reverse_lazy('backend:ProductInfoView-list')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+
+    # тест заполнения фасетов при импорте
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('mode', ('replace', 'staged'))
+    def test_import_facets(self, user, mode):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id, mode=mode)
+        product_info = ProductInfo.objects.get(product__name__contains='черный')
+        assert product_info.facets == {'Диагональ (дюйм)': '6.1', 'Разрешение (пикс)': '1792x828',
+                                       'Встроенная память (Гб)': '256', 'Цвет': 'черный'}
+
+    # тест фасетов товара, измененного дифференциальным импортом
+    @pytest.mark.django_db
+    def test_delta_import_facets(self, catalog, client_log):
+        with open(price_list_path('/products_data/svyaznoy.yml'), 'rb') as stream:
+            price_list = load_price_list(stream)
+        changed = next(item for item in price_list.goods if 'черный' in item['name'])
+        changed['parameters']['Цвет'] = 'графит'
+        stats = DeltaPriceListImporter(Shop.objects.get()).run(price_list.categories, price_list.goods)
+        assert stats['changed'] == 1
+        assert ProductInfo.objects.get(product__name=changed['name']).facets['Цвет'] == 'графит'
+        response = client_log(**user_buyer).get(self.URL, {'param[Цвет]': 'графит'})
+        assert [item['id'] for item in response.json()['results']] == [
+            ProductInfo.objects.get(product__name=changed['name']).id]
+
+    # тест отбора по параметрам товара
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('params, count', (
+            ({'param[Цвет]': 'черный'}, 1),
+            ({'param[Диагональ (дюйм)]': '6.1'}, 3),
+            ({'param[Цвет]': ['черный', 'синий']}, 2),
+            ({'param[Цвет]': ['черный', 'золотистый'], 'param[Диагональ (дюйм)]': '6.1'}, 1),
+            ({'param[Цвет]': 'белый'}, 0),
+    ))
+    def test_param_filter(self, catalog, client_log, params, count):
+        response = client_log(**user_buyer).get(self.URL, params)
+        assert response.status_code == 200
+        assert len(response.json()['results']) == count
+
+    # тест подсчета фасетов и гистограммы цен для текущей выборки
+    @pytest.mark.django_db
+    def test_facet_counts(self, catalog, client_log, query_budget):
+        response = query_budget(client_log(**user_buyer), f'{self.URL}?facets=1', 7)
+        data = response.json()
+        assert data['facets']['Встроенная память (Гб)'] == {'256': 3, '512': 1}
+        assert data['facets']['Цвет'] == {'золотистый': 1, 'красный': 1, 'синий': 1, 'черный': 1}
+        assert data['price_histogram'] == [{'min': 60000, 'max': 65000, 'count': 3},
+                                           {'min': 105009, 'max': 110009, 'count': 1}]
+
+        data = client_log(**user_buyer).get(self.URL, {'facets': 'true', 'price__gt': 60000}).json()
+        assert data['facets']['Цвет'] == {'золотистый': 1, 'красный': 1, 'черный': 1}
+        assert 'facets' not in client_log(**user_buyer).get(self.URL).json()
+
+    # тест обновления фасетов при ручном изменении параметров
+    @pytest.mark.django_db
+    def test_facets_manual_update(self, catalog):
+        product_info = ProductInfo.objects.get(product__name__contains='черный')
+        parameter = ProductParameter.objects.get(product_info=product_info, parameter__name='Цвет')
+        parameter.value = 'графит'
+        parameter.save()
+        ProductParameter.objects.create(product_info=product_info, parameter=Parameter.objects.create(name='NFC'),
+                                        value='да')
+        product_info.refresh_from_db()
+        assert product_info.facets['Цвет'] == 'графит'
+        assert product_info.facets['NFC'] == 'да'
+        ProductInfo.objects.filter(shop=product_info.shop).delete()
+        assert not ProductParameter.objects.exists()
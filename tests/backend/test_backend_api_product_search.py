@@ -0,0 +1,55 @@
+import pytest
+from django.urls import reverse_lazy
+
+from backend.models import Category, Product, ProductInfo, ProductSearch, Shop
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestProductSearch:
+    URL = reverse_lazy('backend:ProductInfoView-list')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        return Shop.objects.get()
+
+    def search(self, client, text):
+        response = client.get(self.URL, {'search': text})
+        assert response.status_code == 200
+        return [item['product']['name'] for item in response.json()['results']]
+
+    # тест заполнения поисковых документов при импорте
+    @pytest.mark.django_db
+    def test_search_documents(self, catalog):
+        assert ProductSearch.objects.count() == ProductInfo.objects.count() == 4
+        assert set(ProductSearch.objects.values_list('category', flat=True)) == {'Смартфоны'}
+
+    # тест поиска по словам и префиксам
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('text, count', (
+            ('iphone xr', 3),
+            ('IPHONE', 4),
+            ('золотист', 1),
+            ('смартф', 4),
+            ('xr 128gb синий', 1),
+            ('nokia', 0),
+            ('()', 0),
+    ))
+    def test_search(self, catalog, client_log, text, count):
+        assert len(self.search(client_log(**user_buyer), text)) == count
+
+    # тест сортировки по релевантности и обновления документа при ручном изменении
+    @pytest.mark.django_db
+    def test_search_rank(self, catalog, client_log):
+        client = client_log(**user_buyer)
+        product = Product.objects.create(name='Чехол Apple', category=Category.objects.get(id=224))
+        product_info = ProductInfo.objects.create(product=product, shop=catalog, model='case', quantity=1, price=1,
+                                                  price_rrc=1)
+        names = self.search(client, 'смартфон')
+        assert len(names) == 5
+        assert names[-1] == 'Чехол Apple'
+
+        product_info.model = 'nokia/3310'
+        product_info.save()
+        assert self.search(client, 'nokia') == ['Чехол Apple']
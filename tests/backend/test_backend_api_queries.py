@@ -0,0 +1,114 @@
+import pytest
+from django.urls import reverse, reverse_lazy
+
+from backend.cache import bump_catalog_version
+from backend.models import Order, OrderItem, Product, ProductInfo, ProductParameter
+from backend.orders import split_orders
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestQueryBudget:
+    PRODUCTS_URL = reverse_lazy('backend:ProductInfoView-list')
+    ORDER_URL = reverse_lazy('backend:OrderView-list')
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+
+    @pytest.fixture
+    def catalog(self, user):
+        usr = user(**user_shop)
+        do_import('/products_data/svyaznoy.yml', usr.id)
+        return list(ProductInfo.objects.all())
+
+    @pytest.fixture
+    def grow(self, catalog):
+        """
+        добавляем в каталог copies копий каждого товара с параметрами и позиции с ними во все заказы:
+        число запросов должно остаться прежним
+        """
+        def add(copies):
+            for number in range(copies):
+                for product_info in catalog:
+                    product = Product.objects.create(name=f'{product_info.product.name} ({number})',
+                                                     category_id=product_info.product.category_id)
+                    info = ProductInfo.objects.create(product=product, shop_id=product_info.shop_id,
+                                                      model=product_info.model, quantity=product_info.quantity,
+                                                      price=product_info.price, price_rrc=product_info.price_rrc)
+                    ProductParameter.objects.bulk_create(
+                        ProductParameter(product_info=info, parameter_id=parameter.parameter_id, value=parameter.value)
+                        for parameter in product_info.product_parameters.all())
+                    OrderItem.objects.bulk_create(OrderItem(order=order, product_info=info, quantity=1)
+                                                  for order in Order.objects.all())
+            split_orders(Order.objects.exclude(state='basket'))
+            bump_catalog_version()
+
+        return add
+
+    @pytest.fixture
+    def orders(self, catalog, user, contact_factory):
+        buyer = user(**user_buyer)
+        contact = contact_factory(user=buyer)
+        for state in ('basket', 'new', 'confirmed'):
+            order = Order.objects.create(user=buyer, state=state, contact=contact)
+            OrderItem.objects.bulk_create(OrderItem(order=order, product_info=product_info, quantity=1)
+                                          for product_info in catalog)
+        split_orders(Order.objects.exclude(state='basket'))
+        return buyer
+
+    # тест количества запросов каталога товаров на каталогах разного размера
+    @pytest.mark.django_db
+    def test_products_queries(self, catalog, grow, client_log, query_budget):
+        client = client_log(**user_buyer)
+        detail_url = reverse('backend:ProductInfoView-detail', args=(catalog[0].id,))
+        url = f'{self.PRODUCTS_URL}?page_size=100'
+        small = query_budget(client, url, 3).queries
+        detail = query_budget(client, detail_url, 3).queries
+        grow(3)
+        response = query_budget(client, url, 3)
+        data = response.json()['results']
+        assert len(data) == len(catalog) * 4
+        assert all(item['product']['category'] and item['product_parameters'] for item in data)
+        assert response.queries == small
+        assert query_budget(client, detail_url, 3).queries == detail
+
+    # тест количества запросов списка и деталей заказов покупателя на заказах разного размера
+    @pytest.mark.django_db
+    def test_order_queries(self, orders, grow, client_log, query_budget):
+        client = client_log(**user_buyer)
+        order = Order.objects.exclude(state='basket').first()
+        detail_url = reverse('backend:OrderView-detail', args=(order.id,))
+        small = query_budget(client, self.ORDER_URL, 3).queries
+        response = query_budget(client, detail_url, 5)
+        assert len(response.json()['ordered_items']) == 4
+        detail = response.queries
+        grow(3)
+        response = query_budget(client, self.ORDER_URL, 3)
+        assert len(response.json()['results']) == 2
+        assert response.queries == small
+        response = query_budget(client, detail_url, 5)
+        assert len(response.json()['ordered_items']) == 16
+        assert response.queries == detail
+
+    # тест количества запросов заказов магазина на заказах разного размера
+    @pytest.mark.django_db
+    def test_order_shop_queries(self, orders, grow, client_log, query_budget):
+        client = client_log(**user_shop)
+        small = query_budget(client, self.ORDER_URL, 4).queries
+        grow(3)
+        response = query_budget(client, self.ORDER_URL, 4)
+        assert all(len(order['ordered_items']) == 16 for order in response.json()['results'])
+        assert response.queries == small
+
+    # тест количества запросов корзины на корзинах разного размера
+    @pytest.mark.django_db
+    def test_basket_queries(self, orders, grow, client_log, query_budget):
+        client = client_log(**user_buyer)
+        item = OrderItem.objects.filter(order__state='basket').first()
+        detail_url = reverse('backend:BasketView-detail', args=(item.id,))
+        response = query_budget(client, self.BASKET_URL, 6)
+        assert len(response.json()[0]['ordered_items']) == 4
+        small, detail = response.queries, query_budget(client, detail_url, 4).queries
+        grow(3)
+        response = query_budget(client, self.BASKET_URL, 6)
+        assert len(response.json()[0]['ordered_items']) == 16
+        assert response.queries == small
+        assert query_budget(client, detail_url, 4).queries == detail
@@ -0,0 +1,79 @@
+import pytest
+from django.urls import reverse, reverse_lazy
+from model_bakery import baker
+
+from backend.models import Order, ProductInfo, Shop, ShopOrder
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+user_shop_second = {
+    'username': 'shop2',
+    'email': 'shop2@mail.ru',
+    'type': 'shop',
+    'is_active': True
+}
+
+
+class TestShopOrders:
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+    CHECKOUT_URL = reverse_lazy('backend:BasketView-update-new')
+    ORDERS_URL = reverse_lazy('backend:OrderView-list')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        goods = list(ProductInfo.objects.order_by('id')[:2])
+        shop = baker.make(Shop, user=user(**user_shop_second), state=True)
+        goods.append(baker.make(ProductInfo, product=goods[0].product, shop=shop, model='second', price=500,
+                                price_rrc=600, quantity=10))
+        return goods
+
+    @pytest.fixture
+    def order(self, catalog, client_log, contact_factory, celery_eager):
+        client = client_log(**user_buyer)
+        for quantity, product_info in enumerate(catalog, start=1):
+            client.post(self.BASKET_URL, data={'product_info': product_info.id, 'quantity': quantity})
+        order = Order.objects.get(state='basket')
+        contact = contact_factory(user=order.user)
+        client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+        order.refresh_from_db()
+        return order
+
+    # тест разделения заказа по магазинам при оформлении
+    @pytest.mark.django_db
+    def test_checkout_splits_order(self, order, catalog):
+        shop_orders = {shop_order.shop_id: shop_order for shop_order in ShopOrder.objects.filter(order=order)}
+        assert len(shop_orders) == 2
+        first, second = shop_orders[catalog[0].shop_id], shop_orders[catalog[2].shop_id]
+        assert (first.items_count, second.items_count) == (2, 1)
+        assert first.total_sum == catalog[0].price + catalog[1].price * 2
+        assert second.total_sum == catalog[2].price * 3
+        assert first.total_sum + second.total_sum == order.total_sum
+        assert {first.state, second.state} == {'new'}
+
+    # тест ленты заказов магазина: только свои позиции и суммы
+    @pytest.mark.django_db
+    def test_shop_order_feed(self, order, catalog, client_log):
+        data = client_log(**user_shop).get(self.ORDERS_URL).json()['results']
+        assert [item['id'] for item in data] == [order.id]
+        assert {item['product_info']['id'] for item in data[0]['ordered_items']} == {catalog[0].id, catalog[1].id}
+        assert data[0]['total_sum'] == catalog[0].price + catalog[1].price * 2
+        assert 'contact' in data[0]
+        client = client_log(**user_shop_second)
+        response = client.get(reverse('backend:OrderView-detail', args=(order.id,)))
+        assert [item['product_info']['id'] for item in response.json()['ordered_items']] == [catalog[2].id]
+        assert response.json()['total_sum'] == catalog[2].price * 3
+        assert client.get(reverse('backend:OrderView-detail', args=(order.id + 1,))).status_code == 404
+
+    # тест постоянного числа запросов ленты заказов магазина при росте числа заказов
+    @pytest.mark.django_db
+    def test_shop_order_feed_queries(self, order, catalog, client_log, query_budget, contact_factory):
+        small = query_budget(client_log(**user_shop), self.ORDERS_URL, 4).queries
+        client = client_log(**user_buyer)
+        contact = contact_factory(user=order.user)
+        for _ in range(3):
+            client.post(self.BASKET_URL, data={'product_info': catalog[0].id, 'quantity': 1})
+            client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+        response = query_budget(client_log(**user_shop), self.ORDERS_URL, 4)
+        assert len(response.json()['results']) == 4
+        assert response.queries == small
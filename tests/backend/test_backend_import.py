@@ -0,0 +1,362 @@
+import csv
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import pytest
+import yaml
+from model_bakery import baker
+
+from backend.importer import DeltaPriceListImporter, ShardedPriceListImporter, StagedPriceListImporter
+from backend.models import ImportJob, ImportRow, Order, OrderItem, OutboxEvent, Product, ProductInfo, ProductParameter, \
+    Shop
+from backend.parsers import PriceListError, load_price_list, read_price_list, stream_price_list
+from backend.tasks import do_import, refresh_shop_feed
+from backend.uploads import price_list_path
+from tests.backend.conftest import user_shop
+
+
+class TestImport:
+    FILENAME = '/products_data/svyaznoy.yml'
+
+    # тест импорта прайс-листа
+    @pytest.mark.django_db
+    def test_do_import(self, user):
+        usr = user(**user_shop)
+        do_import(self.FILENAME, usr.id)
+        shop = Shop.objects.get(user=usr)
+        assert ProductInfo.objects.filter(shop=shop).count() == 4
+        assert ProductParameter.objects.filter(product_info__shop=shop).count() == 16
+        assert set(shop.categories.values_list('id', flat=True)) == {1, 15, 224}
+        assert 'успешно импортирован' in OutboxEvent.objects.last().kwargs['msg_txt']
+
+    # тест повторного импорта без дублирования продуктов
+    @pytest.mark.django_db
+    def test_do_import_twice(self, user):
+        usr = user(**user_shop)
+        do_import(self.FILENAME, usr.id)
+        products = Product.objects.count()
+        do_import(self.FILENAME, usr.id)
+        assert Product.objects.count() == products
+        assert ProductInfo.objects.count() == 4
+
+    # тест количества запросов при импорте
+    @pytest.mark.django_db
+    def test_do_import_queries(self, user, django_assert_max_num_queries):
+        usr = user(**user_shop)
+        with django_assert_max_num_queries(33):
+            do_import(self.FILENAME, usr.id)
+
+    # тест ошибки при отсутствии файла
+    @pytest.mark.django_db
+    def test_do_import_not_found(self, user):
+        usr = user(**user_shop)
+        do_import('/products_data/missing.yml', usr.id)
+        assert 'возникла ошибка' in OutboxEvent.objects.last().kwargs['msg_txt']
+        assert not Shop.objects.filter(user=usr).exists()
+
+    # тест уведомления об ошибке разбора прайс-листа
+    @pytest.mark.parametrize('content, streaming', [
+        ('shop: Связной\ngoods: [', False),
+        ('shop: Связной\ncategories: []\n', False),
+        ('shop: Связной\ncategories: []\ngoods:\n  - name: Телефон\n', True),
+    ])
+    @pytest.mark.django_db
+    def test_do_import_parse_error(self, user, settings, tmp_path, content, streaming):
+        settings.IMPORT_UPLOAD_DIR = str(tmp_path)
+        path = tmp_path / 'price.yml'
+        path.write_text(content, encoding='utf-8')
+        usr = user(**user_shop)
+        do_import(str(path), usr.id, streaming=streaming)
+        assert ImportJob.objects.get().status == 'failed'
+        assert 'возникла ошибка' in OutboxEvent.objects.last().kwargs['msg_txt']
+        assert not ProductInfo.objects.exists()
+
+    # тест импорта в потоковом режиме
+    @pytest.mark.django_db
+    def test_do_import_streaming(self, user):
+        usr = user(**user_shop)
+        do_import(self.FILENAME, usr.id, streaming=True)
+        assert ProductInfo.objects.count() == 4
+        assert ProductParameter.objects.count() == 16
+
+    # тест параллельного импорта шардами
+    @pytest.mark.django_db
+    def test_do_import_parallel(self, user, settings, celery_eager):
+        settings.IMPORT_SHARD_SIZE = 1
+        settings.IMPORT_CONCURRENCY = 2
+        usr = user(**user_shop)
+        do_import(self.FILENAME, usr.id)
+        shop = Shop.objects.get(user=usr)
+        ProductInfo.objects.create(shop=shop, product=baker.make(Product, category=shop.categories.first()), quantity=1, price=1, price_rrc=1)
+        do_import(self.FILENAME, usr.id, mode='parallel')
+        assert ProductInfo.objects.filter(shop=shop).count() == 4
+        assert ProductParameter.objects.filter(product_info__shop=shop).count() == 16
+        assert 'удалено: 1, без изменений: 4' in OutboxEvent.objects.last().kwargs['msg_txt']
+        assert not ImportRow.objects.exists()
+
+    # тест раскладки строк параллельного импорта по шардам в ImportRow
+    @pytest.mark.django_db
+    def test_parallel_prepare(self, user, shop_factory):
+        job = ImportJob.objects.create(user=user(**user_shop), filename=self.FILENAME, mode='parallel')
+        importer = ShardedPriceListImporter(shop_factory(user=job.user), shard_size=3)
+        with open(price_list_path(self.FILENAME), 'rb') as price_file:
+            price_list = read_price_list(price_file, self.FILENAME)
+        assert importer.prepare(price_list.categories, price_list.goods, job.id) == 2
+        assert list(ImportRow.objects.order_by('id').values_list('shard', flat=True)) == [0, 0, 0, 1]
+        assert importer.load_shard(job.id, 1) == [ImportRow.objects.get(shard=1).product_id]
+        importer.reconcile_staged(job.id)
+        assert not ImportRow.objects.exists()
+
+
+class TestDeltaImport:
+    DATA_PATH = Path(__file__).parents[2] / 'backend' / 'products_data' / 'svyaznoy.yml'
+
+    @pytest.fixture
+    def price_list(self):
+        with open(self.DATA_PATH, 'rb') as stream:
+            return load_price_list(stream)
+
+    @pytest.fixture
+    @pytest.mark.django_db
+    def shop(self, user, shop_factory):
+        return shop_factory(user=user(**user_shop))
+
+    # тест пустых строковых значений при поэтапном импорте (на PostgreSQL - через COPY)
+    @pytest.mark.django_db
+    def test_staged_import_empty_strings(self, shop, price_list):
+        goods = [dict(item, model='', parameters=dict(item['parameters'], Цвет='')) for item in price_list.goods]
+        StagedPriceListImporter(shop).run(price_list.categories, goods)
+        assert set(ProductInfo.objects.values_list('model', flat=True)) == {''}
+        assert set(ProductParameter.objects.filter(parameter__name='Цвет').values_list('value', flat=True)) == {''}
+
+    # тест дифференциального и поэтапного импорта с сохранением строк ProductInfo
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('importer_class', (DeltaPriceListImporter, StagedPriceListImporter))
+    def test_delta_import(self, shop, price_list, user, importer_class):
+        importer_class(shop).run(price_list.categories, price_list.goods)
+        ids = dict(ProductInfo.objects.values_list('product__name', 'id'))
+        kept, changed, removed = price_list.goods[:3]
+        order = Order.objects.create(user=user(username='buyer', email='buyer@mail.ru'), state='basket')
+        OrderItem.objects.create(order=order, product_info_id=ids[kept['name']], quantity=1)
+
+        changed['price'] += 100
+        changed['parameters']['Цвет'] = 'синий'
+        added = dict(removed, name='Новый товар')
+        goods = [kept, changed, added] + price_list.goods[3:]
+        stats = importer_class(shop).run(price_list.categories, goods)
+
+        assert (stats['changed'], stats['added'], stats['removed'], stats['unchanged']) == (1, 1, 1, 2)
+        assert ProductInfo.objects.get(id=ids[changed['name']]).price == changed['price']
+        assert ProductParameter.objects.get(product_info_id=ids[changed['name']], parameter__name='Цвет').value == 'синий'
+        assert not ProductInfo.objects.filter(id=ids[removed['name']]).exists()
+        assert ProductInfo.objects.filter(id=ids[kept['name']]).exists()
+        assert OrderItem.objects.filter(order=order).count() == 1
+
+    # тест повторного импорта того же измененного прайс-листа: строки больше не считаются измененными
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('importer_class', (DeltaPriceListImporter, ShardedPriceListImporter))
+    def test_delta_reimport_settles(self, shop, price_list, importer_class):
+        importer_class(shop).run(price_list.categories, price_list.goods)
+        changed = price_list.goods[0]
+        changed['price'] += 100
+        changed['parameters']['Цвет'] = 'синий'
+        assert importer_class(shop).run(price_list.categories, price_list.goods)['changed'] == 1
+        assert ProductInfo.objects.get(product__name=changed['name']).fingerprint
+        stats = importer_class(shop).run(price_list.categories, price_list.goods)
+        assert (stats['changed'], stats['unchanged']) == (0, len(price_list.goods))
+
+    # тест повторного импорта без изменений
+    @pytest.mark.django_db
+    def test_delta_import_unchanged(self, shop, price_list, django_assert_max_num_queries):
+        DeltaPriceListImporter(shop).run(price_list.categories, price_list.goods)
+        importer = DeltaPriceListImporter(shop)
+        with django_assert_max_num_queries(8):
+            stats = importer.run(price_list.categories, price_list.goods)
+        assert stats['unchanged'] == len(price_list.goods)
+        assert 'без изменений: 4' in importer.summary()
+
+
+class TestParsers:
+    DATA_PATH = Path(__file__).parents[2] / 'backend' / 'products_data'
+
+    # тест совпадения потокового разбора с полной загрузкой
+    @pytest.mark.parametrize('filename', ('sotik.yml', 'svyaznoy.yml'))
+    def test_stream_price_list(self, filename):
+        with open(self.DATA_PATH / filename, 'rb') as stream:
+            expected = load_price_list(stream)
+        with open(self.DATA_PATH / filename, 'rb') as stream:
+            price_list = stream_price_list(stream)
+            assert price_list.shop == expected.shop
+            assert price_list.categories == expected.categories
+            assert list(price_list.goods) == expected.goods
+
+    # тест порядка разделов при потоковом разборе
+    def test_stream_price_list_order(self):
+        stream = BytesIO(yaml.safe_dump({'goods': [], 'shop': 'shop', 'categories': []}, sort_keys=False).encode())
+        with pytest.raises(PriceListError):
+            stream_price_list(stream)
+
+
+class TestFormats:
+    DATA_PATH = Path(__file__).parents[2] / 'backend' / 'products_data' / 'svyaznoy.yml'
+
+    @pytest.fixture
+    def price_list(self):
+        with open(self.DATA_PATH, 'rb') as stream:
+            return load_price_list(stream)
+
+    def to_json(self, price_list):
+        return json.dumps(price_list._asdict(), ensure_ascii=False).encode()
+
+    def to_jsonl(self, price_list):
+        lines = [{'shop': price_list.shop, 'categories': price_list.categories}] + price_list.goods
+        return '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines).encode()
+
+    def to_csv(self, price_list):
+        names = {category['id']: category['name'] for category in price_list.categories}
+        parameters = list(dict.fromkeys(name for item in price_list.goods for name in item['parameters']))
+        text = StringIO()
+        writer = csv.writer(text, delimiter=';')
+        writer.writerow(['shop', 'category', 'category_name', 'name', 'model', 'price', 'price_rrc', 'quantity']
+                        + parameters)
+        for item in price_list.goods:
+            writer.writerow([price_list.shop, item['category'], names[item['category']], item['name'], item['model'],
+                             item['price'], item['price_rrc'], item['quantity']]
+                            + [item['parameters'].get(name, '') for name in parameters])
+        return text.getvalue().encode()
+
+    def normalize(self, goods):
+        return [{'category': item['category'], 'model': item['model'], 'name': item['name'],
+                 'price': item['price'], 'price_rrc': item['price_rrc'], 'quantity': item['quantity'],
+                 'parameters': {name: str(value) for name, value in item['parameters'].items()}}
+                for item in goods]
+
+    # тест разбора всех форматов с определением по расширению и по содержимому
+    @pytest.mark.parametrize('extension', ('json', 'jsonl', 'csv'))
+    @pytest.mark.parametrize('filename', ('price', 'price.{}'))
+    @pytest.mark.parametrize('streaming', (False, True))
+    def test_read_price_list(self, price_list, extension, filename, streaming):
+        stream = BytesIO(getattr(self, f'to_{extension}')(price_list))
+        result = read_price_list(stream, filename.format(extension), streaming)
+        assert result.shop == price_list.shop
+        assert {item['category'] for item in price_list.goods} <= {category['id'] for category in result.categories}
+        assert self.normalize(result.goods) == self.normalize(price_list.goods)
+
+    # тест прайс-листа, который не является объектом с нужными разделами
+    @pytest.mark.parametrize('filename', ('price', 'price.json', 'price.yml'))
+    @pytest.mark.parametrize('content', ('[{"shop": "Связной"}]', '{"shop": "Связной", "goods": []}', '[1, 2]'))
+    def test_read_price_list_not_object(self, filename, content):
+        with pytest.raises(PriceListError):
+            read_price_list(BytesIO(content.encode()), filename)
+
+    # тест определения YAML по содержимому
+    def test_read_price_list_yaml(self, price_list):
+        with open(self.DATA_PATH, 'rb') as stream:
+            assert read_price_list(stream, 'price').goods == price_list.goods
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    content = b''
+    etag = '"v1"'
+    truncated = False
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content[:len(self.content) // 2] if self.truncated else self.content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFeedReimport:
+    DATA_PATH = Path(__file__).parents[2] / 'backend' / 'products_data' / 'svyaznoy.yml'
+
+    @pytest.fixture
+    def feed_server(self):
+        FeedHandler.content, FeedHandler.etag, FeedHandler.truncated = self.DATA_PATH.read_bytes(), '"v1"', False
+        server = HTTPServer(('127.0.0.1', 0), FeedHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield f'http://127.0.0.1:{server.server_port}/price.yml'
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture
+    def shop(self, user, shop_factory, settings, tmp_path):
+        settings.IMPORT_UPLOAD_DIR = str(tmp_path)
+        return shop_factory(name='Мегафон', user=user(**user_shop), url=None, filename='')
+
+    # тест планового импорта по ссылке с условным запросом
+    @pytest.mark.django_db
+    def test_refresh_shop_feed_url(self, shop, feed_server, celery_eager):
+        Shop.objects.filter(id=shop.id).update(url=feed_server)
+        job_id = refresh_shop_feed(shop.id)
+        assert ImportJob.objects.get(id=job_id).status == 'done'
+        assert ProductInfo.objects.filter(shop=shop).count() == 4
+        assert refresh_shop_feed(shop.id) is None
+
+        FeedHandler.etag = '"v2"'
+        assert refresh_shop_feed(shop.id) is None
+        assert Shop.objects.get(id=shop.id).feed_etag == '"v2"'
+        assert ImportJob.objects.count() == 1
+
+    # тест планового импорта файла по времени изменения и хешу содержимого
+    @pytest.mark.django_db
+    def test_refresh_shop_feed_file(self, shop, tmp_path, celery_eager):
+        path = tmp_path / 'price.yml'
+        shutil.copy(self.DATA_PATH, path)
+        Shop.objects.filter(id=shop.id).update(filename=str(path))
+        assert ImportJob.objects.get(id=refresh_shop_feed(shop.id)).status == 'done'
+        assert refresh_shop_feed(shop.id) is None
+
+        os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 10))
+        assert refresh_shop_feed(shop.id) is None
+        assert Shop.objects.get(id=shop.id).feed_mtime == path.stat().st_mtime
+
+        path.write_bytes(path.read_bytes().replace(b'price: 110000', b'price: 120000'))
+        assert refresh_shop_feed(shop.id) is not None
+        assert ImportJob.objects.count() == 2
+
+    # тест недоступного и оборванного прайс-листа по ссылке: импорт не запускается, временный файл удаляется
+    @pytest.mark.django_db
+    def test_refresh_shop_feed_url_errors(self, shop, feed_server, tmp_path, celery_eager):
+        Shop.objects.filter(id=shop.id).update(url='http://127.0.0.1:1/price.yml')
+        assert refresh_shop_feed(shop.id) is None
+
+        FeedHandler.truncated = True
+        Shop.objects.filter(id=shop.id).update(url=feed_server)
+        assert refresh_shop_feed(shop.id) is None
+        assert not ImportJob.objects.exists()
+        assert not list(tmp_path.iterdir())
+        assert Shop.objects.get(id=shop.id).feed_etag == ''
+
+    # тест повторного импорта после ошибки и удаления скачанного файла после импорта
+    @pytest.mark.django_db
+    def test_refresh_shop_feed_after_failure(self, shop, feed_server, tmp_path, celery_eager):
+        Shop.objects.filter(id=shop.id).update(url=feed_server)
+        job_id = refresh_shop_feed(shop.id)
+        assert not list(tmp_path.iterdir())
+        ImportJob.objects.filter(id=job_id).update(status='failed')
+
+        assert refresh_shop_feed(shop.id) is not None
+        assert refresh_shop_feed(shop.id) is None
+        assert ImportJob.objects.filter(status='done').count() == 1
+        assert not list(tmp_path.iterdir())
+
+    # тест отсутствующего файла прайс-листа
+    @pytest.mark.django_db
+    def test_refresh_shop_feed_missing_file(self, shop, tmp_path, celery_eager):
+        Shop.objects.filter(id=shop.id).update(filename=str(tmp_path / 'missing.yml'))
+        assert refresh_shop_feed(shop.id) is None
+        assert not ImportJob.objects.exists()
@@ -0,0 +1,147 @@
+import socket
+import threading
+from datetime import timedelta
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+import pytest
+from django.utils import timezone
+
+from backend.models import MailMessage
+from backend.tasks import sand_mail, send_queued_mail
+from tests.backend.conftest import user_buyer
+
+
+class SMTPHandler(StreamRequestHandler):
+    """
+    минимальный SMTP-сервер: считает соединения, сохраняет письма, отклоняет адреса из rejected
+    """
+    connections = 0
+    messages = []
+    rejected = set()
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        SMTPHandler.connections += 1
+        self.reply('220 localhost')
+        data = None
+        for line in self.rfile:
+            line = line.decode().rstrip('\r\n')
+            if data is not None:
+                if line == '.':
+                    self.messages.append('\n'.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    data.append(line)
+                continue
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'RCPT' and any(email in line for email in self.rejected):
+                self.reply('550 mailbox unavailable')
+            elif command == 'DATA':
+                self.reply('354 end data with <CR><LF>.<CR><LF>')
+                data = []
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                break
+            else:
+                self.reply('250 OK')
+
+
+class TestMailQueue:
+
+    @pytest.fixture
+    def smtp_server(self, settings):
+        SMTPHandler.connections, SMTPHandler.messages, SMTPHandler.rejected = 0, [], set()
+        server = ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+        settings.EMAIL_HOST, settings.EMAIL_PORT = '127.0.0.1', server.server_address[1]
+        settings.EMAIL_USE_SSL = settings.EMAIL_USE_TLS = False
+        settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD = 'shop@mail.ru', ''
+        yield SMTPHandler
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture
+    def buyers(self, user):
+        return [user(username=f'buyer{number}', email=f'buyer{number}@mail.ru', type='buyer', is_active=True)
+                for number in range(5)]
+
+    # тест постановки письма в очередь без отправки
+    @pytest.mark.django_db
+    def test_sand_mail_enqueues(self, user, mailoutbox):
+        usr = user(**user_buyer)
+        sand_mail(usr.id, 'Заказ №1 сформирован', 'Обновление статуса заказа')
+        message = MailMessage.objects.get()
+        assert (message.email, message.subject, message.status) == (usr.email, 'Обновление статуса заказа', 'queued')
+        assert not mailoutbox
+
+    # тест отправки очереди пачками через одно SMTP-соединение
+    @pytest.mark.django_db
+    def test_send_batches(self, buyers, smtp_server, settings):
+        settings.MAIL_BATCH_SIZE = 2
+        for buyer in buyers:
+            sand_mail(buyer.id, f'Письмо для {buyer.username}', 'Уведомление')
+        assert send_queued_mail() == 5
+        assert smtp_server.connections == 1
+        assert len(smtp_server.messages) == 5
+        assert set(MailMessage.objects.values_list('status', flat=True)) == {'sent'}
+        assert send_queued_mail() == 0
+
+    # тест повторной отправки отклоненного письма с увеличением паузы
+    @pytest.mark.django_db
+    def test_retry_with_backoff(self, buyers, smtp_server, settings):
+        settings.MAIL_MAX_ATTEMPTS = 3
+        for buyer in buyers:
+            sand_mail(buyer.id, 'Уведомление', 'Уведомление')
+        smtp_server.rejected = {buyers[1].email}
+        started = timezone.now()
+        assert send_queued_mail() == 4
+        message = MailMessage.objects.get(email=buyers[1].email)
+        assert (message.status, message.attempts) == ('queued', 1)
+        assert '550' in message.error
+        assert message.next_attempt_at >= started + timedelta(seconds=settings.MAIL_RETRY_DELAY)
+        assert send_queued_mail() == 0
+
+        MailMessage.objects.filter(id=message.id).update(next_attempt_at=timezone.now())
+        assert send_queued_mail() == 0
+        message.refresh_from_db()
+        assert message.attempts == 2
+        assert message.next_attempt_at >= timezone.now() + timedelta(seconds=settings.MAIL_RETRY_DELAY * 1.5)
+
+        MailMessage.objects.filter(id=message.id).update(next_attempt_at=timezone.now())
+        assert send_queued_mail() == 0
+        assert MailMessage.objects.get(id=message.id).status == 'failed'
+
+        smtp_server.rejected = set()
+        MailMessage.objects.filter(id=message.id).update(status='queued', next_attempt_at=timezone.now())
+        assert send_queued_mail() == 1
+        assert len(smtp_server.messages) == 5
+
+    # тест недоступного SMTP-сервера: письма откладываются, а не теряются
+    @pytest.mark.django_db
+    def test_server_unavailable(self, buyers, settings):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+        settings.EMAIL_HOST, settings.EMAIL_PORT = '127.0.0.1', port
+        settings.EMAIL_USE_SSL = settings.EMAIL_USE_TLS = False
+        sand_mail(buyers[0].id, 'Уведомление', 'Уведомление')
+        assert send_queued_mail() == 0
+        message = MailMessage.objects.get()
+        assert (message.status, message.attempts) == ('queued', 1)
+        assert message.next_attempt_at > timezone.now()
+
+    # тест возврата в очередь письма, зависшего в отправке
+    @pytest.mark.django_db
+    def test_stale_sending(self, buyers, mailoutbox):
+        sand_mail(buyers[0].id, 'Уведомление', 'Уведомление')
+        MailMessage.objects.update(status='sending', attempts=1, next_attempt_at=timezone.now() - timedelta(seconds=1))
+        assert send_queued_mail() == 1
+        assert mailoutbox[0].to == [buyers[0].email]
@@ -0,0 +1,92 @@
+import pytest
+from celery.app.task import Task
+from django.core.management import call_command
+from django.urls import reverse_lazy
+
+from backend.models import MailMessage, OutboxEvent, ProductInfo
+from backend.outbox import publish_event, relay_events
+from backend.tasks import do_import
+from tests.backend.conftest import user_buyer, user_shop
+
+
+class TestOutbox:
+    BASKET_URL = reverse_lazy('backend:BasketView-list')
+    CHECKOUT_URL = reverse_lazy('backend:BasketView-update-new')
+
+    @pytest.fixture
+    def catalog(self, user):
+        do_import('/products_data/svyaznoy.yml', user(**user_shop).id)
+        OutboxEvent.objects.all().delete()
+        return list(ProductInfo.objects.order_by('id')[:2])
+
+    @pytest.fixture
+    def place(self, client_log, contact_factory, user):
+        def make_order(product_info, quantity):
+            client = client_log(**user_buyer)
+            client.post(self.BASKET_URL, data={'product_info': product_info.id, 'quantity': quantity})
+            contact = contact_factory(user=user(**user_buyer))
+            return client.patch(self.CHECKOUT_URL, data={'contact': contact.id}, format='json')
+
+        return make_order
+
+    @pytest.fixture
+    def no_broker(self, monkeypatch):
+        def apply_async(*args, **kwargs):
+            raise AssertionError('задача отправлена в брокер из запроса')
+
+        monkeypatch.setattr(Task, 'apply_async', apply_async)
+
+    # тест записи уведомления в outbox при оформлении без обращения к брокеру
+    @pytest.mark.django_db
+    def test_checkout_writes_event(self, catalog, place, user, no_broker):
+        response = place(catalog[0], 1)
+        assert response.json()['Status'] == 'Заказ сформирован'
+        event = OutboxEvent.objects.get()
+        assert event.task == 'backend.tasks.sand_mail'
+        assert event.kwargs['user_id'] == user(**user_buyer).id
+        assert 'сформирован' in event.kwargs['msg_txt']
+        assert not MailMessage.objects.exists()
+
+    # тест отсутствия события при откате оформления
+    @pytest.mark.django_db
+    def test_failed_checkout_no_event(self, catalog, place, no_broker):
+        ProductInfo.objects.filter(id=catalog[0].id).update(quantity=0)
+        assert place(catalog[0], 1).status_code == 409
+        assert not OutboxEvent.objects.exists()
+
+    # тест публикации событий пачками
+    @pytest.mark.django_db
+    def test_relay_events(self, user, celery_eager):
+        usr = user(**user_buyer)
+        for number in range(5):
+            publish_event('backend.tasks.sand_mail', user_id=usr.id, msg_txt=f'Письмо {number}', topic_msg='Тема')
+        assert relay_events(batch_size=2) == 5
+        assert not OutboxEvent.objects.exists()
+        assert list(MailMessage.objects.order_by('id').values_list('body', flat=True)) == [
+            f'Письмо {number}' for number in range(5)]
+        assert relay_events() == 0
+
+    # тест повторной публикации события: письмо ставится в очередь один раз
+    @pytest.mark.django_db
+    def test_relay_redelivery(self, user, celery_eager):
+        usr = user(**user_buyer)
+        publish_event('backend.tasks.sand_mail', user_id=usr.id, msg_txt='Письмо', topic_msg='Тема')
+        event = OutboxEvent.objects.get()
+        assert relay_events() == 1
+        # событие опубликовано, но удалить его не успели
+        OutboxEvent.objects.create(id=event.id, task=event.task, kwargs=event.kwargs)
+        assert relay_events() == 1
+        message = MailMessage.objects.get()
+        assert (message.event_id, message.body) == (event.id, 'Письмо')
+
+        publish_event('backend.tasks.sand_mail', user_id=usr.id, msg_txt='Письмо', topic_msg='Тема')
+        assert relay_events() == 1
+        assert MailMessage.objects.count() == 2
+
+    # тест команды публикации одним проходом
+    @pytest.mark.django_db
+    def test_relay_command(self, user, celery_eager, capsys):
+        publish_event('backend.tasks.sand_mail', user_id=user(**user_buyer).id, msg_txt='Письмо', topic_msg='Тема')
+        call_command('relay_outbox', '--once')
+        assert 'Опубликовано событий: 1' in capsys.readouterr().out
+        assert MailMessage.objects.get().body == 'Письмо'